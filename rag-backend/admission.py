@@ -0,0 +1,141 @@
+# type : ignore
+"""
+admission control for the expensive endpoints (`/query`) : at most max_in_flight requests run at once, up to max_queue more wait
+in a FIFO queue for at most queue_timeout seconds, everything beyond that is turned away immediately.
+
+- queue full           -> AdmissionRejected(429), the client should back off
+- waited queue_timeout -> AdmissionRejected(503), the server is saturated
+both carry a retry_after (seconds) estimated from the recent service time and the current backlog.
+
+a request that is admitted keeps its slot until it finishes, so admitted work sees the latency of max_in_flight concurrent requests
+rather than the latency of everything that was sent.
+"""
+import asyncio
+import math
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from typing import Any
+
+from config import settings
+
+# samples kept for the wait / service time percentiles of `metrics()`
+METRICS_WINDOW = 1000
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def percentiles(samples) -> dict[str, float | None]:
+    ordered = sorted(samples)
+    if not ordered:
+        return {"p50_ms": None, "p99_ms": None, "max_ms": None}
+    pick = lambda quantile: ordered[min(len(ordered) - 1, int(quantile * len(ordered)))] * 1000
+    return {"p50_ms": pick(0.50), "p99_ms": pick(0.99), "max_ms": ordered[-1] * 1000}
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight: int | None = None, max_queue: int | None = None, queue_timeout: float | None = None):
+        self.max_in_flight = max_in_flight or settings.admission_max_in_flight
+        self.max_queue = max_queue if max_queue is not None else settings.admission_max_queue
+        self.queue_timeout = queue_timeout if queue_timeout is not None else settings.admission_queue_timeout_seconds
+
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._counters: Counter = Counter()
+        self._max_queue_depth = 0
+        self._wait_times: deque[float] = deque(maxlen=METRICS_WINDOW)
+        self._service_times: deque[float] = deque(maxlen=METRICS_WINDOW)
+        # moving average of the service time, the base of retry_after
+        self._average_service_time = 1.0
+
+    @asynccontextmanager
+    async def slot(self):
+        """holds a slot for the duration of the block, raises AdmissionRejected when the request is shed"""
+        await self.acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            service_time = time.perf_counter() - start
+            self._service_times.append(service_time)
+            self._average_service_time = 0.9 * self._average_service_time + 0.1 * service_time
+            self._counters["completed"] += 1
+            self.release()
+
+    async def acquire(self):
+        start = time.perf_counter()
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self._admitted(0.0)
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self._counters["rejected_queue_full"] += 1
+            raise AdmissionRejected(429, "too many queued requests", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._max_queue_depth = max(self._max_queue_depth, len(self._waiters))
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except (TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over just as the wait ended
+                if isinstance(e, asyncio.CancelledError):
+                    self.release()
+                    raise
+            else:
+                self._remove_waiter(waiter)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                self._counters["rejected_queue_timeout"] += 1
+                raise AdmissionRejected(503, "timed out waiting for a free slot", self.retry_after()) from None
+        self._admitted(time.perf_counter() - start)
+
+    def release(self):
+        # the slot goes straight to the oldest waiter, in_flight only drops when nobody is waiting
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def retry_after(self) -> int:
+        """seconds until the current backlog should have drained"""
+        backlog = len(self._waiters) + self.in_flight
+        return max(1, math.ceil(self._average_service_time * backlog / self.max_in_flight))
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "queue_timeout_seconds": self.queue_timeout,
+            "in_flight": self.in_flight,
+            "queue_depth": len(self._waiters),
+            "max_queue_depth": self._max_queue_depth,
+            "admitted": self._counters["admitted"],
+            "queued": self._counters["queued"],
+            "completed": self._counters["completed"],
+            "rejected_queue_full": self._counters["rejected_queue_full"],
+            "rejected_queue_timeout": self._counters["rejected_queue_timeout"],
+            "wait_time": percentiles(self._wait_times),
+            "service_time": percentiles(self._service_times),
+        }
+
+    def _admitted(self, wait_time: float):
+        self._counters["admitted"] += 1
+        self._counters["queued"] += wait_time > 0
+        self._wait_times.append(wait_time)
+
+    def _remove_waiter(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
@@ -0,0 +1,97 @@
+# type : ignore
+"""
+async chroma clients used by the MCP tools, created through `chromaDB.get_async_client()`.
+
+- http mode uses chroma's AsyncHttpClient with a pooled, keep-alive httpx connection pool sized from settings
+- the embedded modes (persistent / ephemeral) have no async client, so the sync client is wrapped and every call runs in a worker thread
+"""
+import asyncio
+import logging
+from typing import Any
+
+import chromadb  # type: ignore
+import httpx  # type: ignore
+from chromadb import __version__ as chroma_version  # type: ignore
+from chromadb.api.async_fastapi import AsyncFastAPI  # type: ignore
+from chromadb.api.models.Collection import Collection  # type: ignore
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def install_connection_pool(chroma_settings: chromadb.config.Settings) -> bool:
+    """
+    AsyncFastAPI keeps one httpx.AsyncClient per event loop in a class level cache (the private `_clients`) and creates it with httpx's
+    default limits and no timeout. seeding that cache for the running loop makes every async chroma client on this loop share our pooled,
+    keep-alive client. It is built like AsyncFastAPI._get_client builds its own (server headers, user agent, certificate verification
+    from `chroma_settings`), only the limits and the timeout differ.
+
+    returns False and leaves chroma's default client in place when the cache isn't there any more (tests/test_async_chroma.py pins it)
+    """
+    clients = getattr(AsyncFastAPI, "_clients", None)
+    if not isinstance(clients, dict):
+        logger.warning(f"chromadb {chroma_version} has no AsyncFastAPI._clients cache, the async client keeps httpx's default pool limits")
+        return False
+
+    loop_hash = asyncio.get_running_loop().__hash__()
+    if loop_hash in clients:
+        return True
+
+    headers = dict(chroma_settings.chroma_server_headers or {})
+    headers["Content-Type"] = "application/json"
+    headers["User-Agent"] = f"Chroma Python Client v{chroma_version} (https://github.com/chroma-core/chroma)"
+    clients[loop_hash] = httpx.AsyncClient(
+        timeout=settings.chroma_async_timeout_seconds,
+        headers=headers,
+        verify=chroma_settings.chroma_server_ssl_verify or False,
+        limits=httpx.Limits(
+            max_connections=settings.chroma_async_max_connections,
+            max_keepalive_connections=settings.chroma_async_max_keepalive_connections,
+            keepalive_expiry=settings.chroma_async_keepalive_expiry_seconds,
+        ),
+    )
+    return True
+
+
+async def create_async_http_client():
+    from chromaDB import get_http_client_settings
+
+    chroma_settings = get_http_client_settings()
+    install_connection_pool(chroma_settings)
+    return await chromadb.AsyncHttpClient(
+        host=settings.chroma_host,
+        port=settings.chroma_port,
+        ssl=settings.chroma_ssl,
+        headers=chroma_settings.chroma_server_headers,
+        settings=chroma_settings,
+    )
+
+
+class ThreadedAsyncClient:
+    """
+    async facade over a sync chroma client (or collection) for the embedded modes.
+
+    every method call runs in a worker thread, at most settings.chroma_async_max_connections at a time, and collections returned by a call are wrapped the same way.
+    """
+
+    def __init__(self, target: Any, limiter: asyncio.Semaphore | None = None):
+        self._target = target
+        self._limiter = limiter or asyncio.Semaphore(settings.chroma_async_max_connections)
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+
+        async def call_in_thread(*args, **kwargs):
+            async with self._limiter:
+                result = await asyncio.to_thread(attribute, *args, **kwargs)
+            if isinstance(result, Collection):
+                return ThreadedAsyncClient(result, self._limiter)
+            return result
+
+        return call_in_thread
+
+    def __repr__(self) -> str:
+        return repr(self._target)
@@ -0,0 +1 @@
+"""benchmark scripts, run them as modules from rag-backend/ e.g. `python -m benchmarks.retrieval`"""
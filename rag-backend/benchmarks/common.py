@@ -0,0 +1,119 @@
+# type : ignore
+"""shared helpers for the benchmark scripts (timing summaries, synthetic corpus, result files)"""
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+from datetime import datetime
+from typing import Any, Iterable
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# small fixed vocabulary so the synthetic corpus (and therefore the hashing embeddings) are reproducible
+VOCABULARY = (
+    "lincoln president war union army river city capital language music science king queen "
+    "empire ocean island mountain winter summer bird animal species planet moon star energy "
+    "theory law court church school university history century born died founded built "
+    "population nation border trade railroad election senate congress treaty battle"
+).split()
+
+
+def percentile(sorted_samples: list[float], fraction: float) -> float:
+    """linear interpolation percentile, `sorted_samples` must already be sorted"""
+    if not sorted_samples:
+        return math.nan
+    position = (len(sorted_samples) - 1) * fraction
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    if lower == upper:
+        return sorted_samples[lower]
+    return sorted_samples[lower] + (sorted_samples[upper] - sorted_samples[lower]) * (
+        position - lower
+    )
+
+
+def summarize_latencies(samples_in_seconds: Iterable[float]) -> dict[str, float]:
+    """latency distribution in milliseconds"""
+    samples = sorted(sample * 1000 for sample in samples_in_seconds)
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "mean_ms": sum(samples) / len(samples),
+        "min_ms": samples[0],
+        "p50_ms": percentile(samples, 0.50),
+        "p90_ms": percentile(samples, 0.90),
+        "p99_ms": percentile(samples, 0.99),
+        "max_ms": samples[-1],
+    }
+
+
+def synthetic_qa_corpus(size: int, seed: int = 0) -> dict[str, list[dict[str, Any]]]:
+    """
+    builds data shaped like the `question-answer` config of rag-mini-wikipedia so it can be passed to `ChromaDBVectorDatabase.store_data`
+    """
+    generator = random.Random(seed)
+    entries = []
+    for index in range(size):
+        question = " ".join(generator.choices(VOCABULARY, k=generator.randint(6, 14)))
+        answer = " ".join(generator.choices(VOCABULARY, k=generator.randint(2, 30)))
+        entries.append({"question": f"{question}?", "answer": answer, "id": index})
+    return {"test": entries}
+
+
+@contextlib.contextmanager
+def quiet():
+    """silences the debug prints emitted by the code being measured"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def git_commit() -> str | None:
+    try:
+        return (
+            subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                capture_output=True,
+                text=True,
+                check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+            ).stdout.strip()
+            or None
+        )
+    except Exception:
+        return None
+
+
+def save_results(
+    benchmark_name: str, parameters: dict[str, Any], results: Any, output_path: str | None = None
+) -> str:
+    """writes results alongside enough environment information to compare runs across commits"""
+    commit = git_commit()
+    if output_path is None:
+        os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        output_path = os.path.join(
+            RESULTS_DIRECTORY, f"{benchmark_name}_{commit or 'nocommit'}_{timestamp}.json"
+        )
+
+    payload = {
+        "benchmark": benchmark_name,
+        "git_commit": commit,
+        "created": str(datetime.now()),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "parameters": parameters,
+        "results": results,
+    }
+    with open(output_path, "w") as f:
+        json.dump(payload, f, indent=2, default=str)
+    return output_path
+
+
+def parse_int_list(value: str) -> list[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
@@ -0,0 +1,57 @@
+# type : ignore
+"""
+compares two benchmark result files and prints the relative change of every numeric metric.
+
+usage (from rag-backend/):
+    python -m benchmarks.compare benchmarks/results/before.json benchmarks/results/after.json
+"""
+import argparse
+import json
+from typing import Any, Iterator
+
+
+def flatten(value: Any, prefix: str = "") -> Iterator[tuple[str, float]]:
+    """yields (path, number) pairs, list entries are labelled by their identifying fields when present"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from flatten(item, f"{prefix}.{key}" if prefix else str(key))
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            label = str(index)
+            if isinstance(item, dict):
+                identifiers = [
+                    f"{key}={item[key]}"
+                    for key in item
+                    if not isinstance(item[key], (dict, list, float)) and key != "count"
+                ]
+                label = ",".join(identifiers) or label
+            yield from flatten(item, f"{prefix}[{label}]")
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix, float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"baseline  : {baseline.get('git_commit')} ({baseline.get('created')})")
+    print(f"candidate : {candidate.get('git_commit')} ({candidate.get('created')})")
+
+    baseline_metrics = dict(flatten(baseline["results"]))
+    for path, value in flatten(candidate["results"]):
+        if path not in baseline_metrics:
+            continue
+        before = baseline_metrics[path]
+        change = f"{(value - before) / before * 100:+.1f}%" if before else "n/a"
+        print(f"{path:<80} {before:>14.3f} {value:>14.3f} {change:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+# type : ignore
+"""
+hnsw parameter sweep : query latency, recall@k and index size on disk for every combination of
+max_neighbors (M) x ef_construction x ef_search.
+
+every (M, ef_construction) pair builds one persistent collection in a temporary directory, ef_search is then changed in place
+(it is the only parameter chroma lets you modify) and the same sample of queries is run for each value.
+NOTE : chroma only applies a modified ef_search when the index is loaded again, so the client is reopened after every change.
+recall is measured against an exact (brute force) search over the same embeddings, so it isolates the approximation of the index.
+a returned document counts as a hit when it is at least as close as the exact k-th neighbor (ties are common with short documents).
+
+the embeddings come from the configured embedding function (chromaDB.get_embedding_function, RAG_EMBEDDING_FUNCTION) so the graph is
+tuned on the vectors it will actually index. --fast-embedder uses the deterministic hashing embedder (embeddings.py) instead, no model
+download or network access is needed but its vectors cluster differently, use it to try the script rather than to pick parameters.
+
+usage (from rag-backend/):
+    python -m benchmarks.hnsw_tuning
+    python -m benchmarks.hnsw_tuning --fast-embedder --corpus-size 5000   # quick run without the embedding model
+    python -m benchmarks.hnsw_tuning --corpus-size 100000 --max-neighbors 8,16,32,64 --ef-search 10,20,40,80,160 --target-recall 0.98
+    python -m benchmarks.hnsw_tuning --dataset huggingface   # rag-mini-wikipedia from the local huggingface cache
+
+pick the knee : the suggested configuration is the fastest one (p50) that reaches --target-recall, the pareto frontier is printed
+so the trade off around it is visible. Apply it with CHROMA_HNSW_* or the hnsw parameters of `enter_data`.
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from typing import Any
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import numpy as np  # noqa: E402
+
+from benchmarks.common import parse_int_list, save_results, summarize_latencies, synthetic_qa_corpus  # noqa: E402
+
+
+def load_documents(dataset: str, corpus_size: int) -> tuple[list[str], list[str]]:
+    """(documents, questions) in the format written by ChromaDBVectorDatabase.store_data"""
+    if dataset == "huggingface":
+        from chromaDB import get_huggingface_data
+
+        loaded = get_huggingface_data()
+        if loaded["status_code"] != 200:
+            raise SystemExit(f"failed to load the huggingface dataset : {loaded['message']}")
+        entries = list(loaded["data"]["test"])[:corpus_size]
+    else:
+        entries = synthetic_qa_corpus(corpus_size)["test"]
+
+    documents = [f"Question: {entry['question']} Answer: {entry['answer']}" for entry in entries]
+    return documents, [entry["question"] for entry in entries]
+
+
+def embed(embedder, texts: list[str], batch_size: int) -> np.ndarray:
+    return np.concatenate(
+        [np.asarray(embedder(texts[start : start + batch_size]), dtype=np.float32) for start in range(0, len(texts), batch_size)]
+    )
+
+
+def pairwise_distances(corpus: np.ndarray, queries: np.ndarray, space: str) -> np.ndarray:
+    if space == "l2":
+        distances = (
+            (queries**2).sum(axis=1, keepdims=True) - 2 * queries @ corpus.T + (corpus**2).sum(axis=1)[None, :]
+        )
+    elif space == "cosine":
+        corpus_norms = np.linalg.norm(corpus, axis=1)
+        query_norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        distances = 1 - (queries @ corpus.T) / np.maximum(query_norms * corpus_norms[None, :], 1e-12)
+    else:
+        distances = 1 - queries @ corpus.T
+    return distances
+
+
+def recall_at_k(distances: np.ndarray, found_ids: list[int], k: int) -> float:
+    """share of the k results that are at least as close as the exact k-th nearest neighbor"""
+    kth_distance = np.partition(distances, k - 1)[k - 1]
+    return sum(distances[found] <= kth_distance + 1e-5 for found in found_ids) / k
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def index_size(persist_directory: str) -> int:
+    """bytes of the hnsw segment files (everything but the sqlite metadata / document store)"""
+    return sum(
+        directory_size(os.path.join(persist_directory, entry))
+        for entry in os.listdir(persist_directory)
+        if os.path.isdir(os.path.join(persist_directory, entry))
+    )
+
+
+def build_collection(persist_directory, space, max_neighbors, ef_construction, ef_search, documents, embeddings, batch_size):
+    import chromadb  # type: ignore
+
+    collection = chromadb.PersistentClient(path=persist_directory).create_collection(
+        name="hnsw_tuning",
+        configuration={
+            "hnsw": {
+                "space": space,
+                "max_neighbors": max_neighbors,
+                "ef_construction": ef_construction,
+                "ef_search": ef_search,
+            }
+        },
+    )
+    ids = [str(index) for index in range(len(documents))]
+    for start in range(0, len(documents), batch_size):
+        end = start + batch_size
+        collection.add(ids=ids[start:end], documents=documents[start:end], embeddings=embeddings[start:end])
+    return collection
+
+
+def reopen_collection(persist_directory: str):
+    import chromadb  # type: ignore
+
+    release_clients()
+    return chromadb.PersistentClient(path=persist_directory).get_collection("hnsw_tuning")
+
+
+def release_clients():
+    # chroma keeps one system (and its loaded index) per persist path alive for the whole process
+    from chromadb.api.client import SharedSystemClient  # type: ignore
+
+    SharedSystemClient.clear_system_cache()
+
+
+def run_queries(collection, query_embeddings: np.ndarray, k: int, distances: np.ndarray) -> dict[str, Any]:
+    samples, recall = [], []
+    for query_embedding, query_distances in zip(query_embeddings, distances):
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[query_embedding], n_results=k, include=[])
+        samples.append(time.perf_counter() - start)
+        recall.append(recall_at_k(query_distances, [int(identifier) for identifier in result["ids"][0]], k))
+    return {"recall": float(np.mean(recall)), **summarize_latencies(samples)}
+
+
+def pareto_frontier(rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """configurations for which no other one is both faster (p50) and at least as accurate"""
+    frontier, best_recall = [], -1.0
+    for row in sorted(rows, key=lambda row: (row["p50_ms"], -row["recall"])):
+        if row["recall"] > best_recall:
+            frontier.append(row)
+            best_recall = row["recall"]
+    return frontier
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", choices=("synthetic", "huggingface"), default="synthetic")
+    parser.add_argument("--corpus-size", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200, help="number of sampled queries")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--space", choices=("l2", "cosine", "ip"), default="l2")
+    parser.add_argument("--max-neighbors", default="8,16,32")
+    parser.add_argument("--ef-construction", default="50,100,200")
+    parser.add_argument("--ef-search", default="10,20,50,100,200")
+    parser.add_argument("--batch-size", type=int, default=1000, help="documents per add call while building")
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--fast-embedder",
+        action="store_true",
+        help="hashing embedder instead of the configured embedding function (no model, but not representative of the real index)",
+    )
+    parser.add_argument("--output", default=None, help="result file (default: benchmarks/results/)")
+    args = parser.parse_args()
+
+    if args.fast_embedder:
+        from embeddings import HashingEmbeddingFunction
+
+        embedder = HashingEmbeddingFunction()
+    else:
+        from chromaDB import get_embedding_function
+
+        embedder = get_embedding_function()
+
+    documents, questions = load_documents(args.dataset, args.corpus_size)
+    embeddings = embed(embedder, documents, args.batch_size)
+    sampled_questions = random.Random(args.seed).sample(questions, min(args.queries, len(questions)))
+    query_embeddings = embed(embedder, sampled_questions, args.batch_size)
+    distances = pairwise_distances(embeddings, query_embeddings, args.space)
+    print(
+        f"corpus={len(documents)} queries={len(sampled_questions)} k={args.k} space={args.space} "
+        f"embedding_function={embedder.name()} dimension={embeddings.shape[1]}"
+    )
+
+    rows = []
+    for max_neighbors in parse_int_list(args.max_neighbors):
+        for ef_construction in parse_int_list(args.ef_construction):
+            persist_directory = tempfile.mkdtemp(prefix="hnsw_tuning_")
+            try:
+                ef_search_values = parse_int_list(args.ef_search)
+                start = time.perf_counter()
+                build_collection(
+                    persist_directory, args.space, max_neighbors, ef_construction, ef_search_values[0],
+                    documents, embeddings, args.batch_size,
+                )
+                build_seconds = time.perf_counter() - start
+                # closing the client flushes the index to disk
+                reopen_collection(persist_directory)
+                index_bytes = index_size(persist_directory)
+
+                for ef_search in ef_search_values:
+                    reopen_collection(persist_directory).modify(configuration={"hnsw": {"ef_search": ef_search}})
+                    collection = reopen_collection(persist_directory)
+                    # the first query loads the index
+                    collection.query(query_embeddings=[query_embeddings[0]], n_results=args.k, include=[])
+                    row = {
+                        "max_neighbors": max_neighbors,
+                        "ef_construction": ef_construction,
+                        "ef_search": ef_search,
+                        "build_seconds": build_seconds,
+                        "index_bytes": index_bytes,
+                        **run_queries(collection, query_embeddings, args.k, distances),
+                    }
+                    rows.append(row)
+                    print(
+                        f"M={max_neighbors} ef_construction={ef_construction} ef_search={ef_search}: "
+                        f"recall@{args.k}={row['recall']:.3f} p50={row['p50_ms']:.2f}ms p99={row['p99_ms']:.2f}ms "
+                        f"index={index_bytes / 2**20:.1f}MiB build={build_seconds:.1f}s"
+                    )
+            finally:
+                release_clients()
+                shutil.rmtree(persist_directory, ignore_errors=True)
+
+    frontier = pareto_frontier(rows)
+    print("\npareto frontier (p50 vs recall) :")
+    for row in frontier:
+        print(
+            f"  M={row['max_neighbors']} ef_construction={row['ef_construction']} ef_search={row['ef_search']}: "
+            f"recall={row['recall']:.3f} p50={row['p50_ms']:.2f}ms index={row['index_bytes'] / 2**20:.1f}MiB"
+        )
+
+    reaching_target = [row for row in rows if row["recall"] >= args.target_recall]
+    suggestion = min(reaching_target, key=lambda row: (row["p50_ms"], row["index_bytes"])) if reaching_target else None
+    if suggestion:
+        print(
+            f"\nfastest configuration with recall@{args.k} >= {args.target_recall} : "
+            f"CHROMA_HNSW_SPACE={args.space} CHROMA_HNSW_MAX_NEIGHBORS={suggestion['max_neighbors']} "
+            f"CHROMA_HNSW_EF_CONSTRUCTION={suggestion['ef_construction']} CHROMA_HNSW_EF_SEARCH={suggestion['ef_search']}"
+        )
+    else:
+        print(f"\nno configuration reached recall@{args.k} >= {args.target_recall}, try larger values")
+
+    output_path = save_results(
+        "hnsw_tuning",
+        vars(args),
+        {"corpus_size": len(documents), "embedding_function": embedder.name(), "sweep": rows, "pareto_frontier": frontier, "suggestion": suggestion},
+        args.output,
+    )
+    print(f"results written to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# type : ignore
+"""
+load generator for the fastapi `/query` endpoint.
+
+two modes:
+    --concurrency N : closed loop, N workers each send a new request as soon as the previous one finishes
+    --rps R         : open loop, requests are started at a fixed rate regardless of how many are still in flight
+
+reports throughput, latency percentiles, error rate and status code counts, and saves them as JSON.
+requests shed by admission control (429 / 503) return quickly, so the latency of successful requests is reported separately too.
+
+to measure the server without paying for real llm calls, start it with the replay backend, e.g.
+    LLM_BACKEND=replay LLM_REPLAY_ON_MISS=echo LLM_REPLAY_LATENCY_MS=800 uv run uvicorn main:app
+
+usage (from rag-backend/):
+    python -m benchmarks.load_generator --concurrency 8 --duration 30
+    python -m benchmarks.load_generator --rps 5 --duration 60 --queries-file queries.txt
+"""
+import argparse
+import asyncio
+import itertools
+import time
+from collections import Counter
+from typing import Any
+
+import httpx  # type: ignore
+
+from benchmarks.common import save_results, summarize_latencies
+
+DEFAULT_QUERIES = [
+    "who was abraham lincoln?",
+    "how many entries are in the collection complete_collection?",
+    "list the available collections",
+    "what did the united states do during the civil war?",
+    "echo hello there",
+]
+
+
+class LoadStatistics:
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.successful_latencies: list[float] = []
+        self.status_codes: Counter = Counter()
+        self.errors = 0
+        self.started = 0
+
+    def record(self, latency: float, status: str, is_error: bool):
+        self.latencies.append(latency)
+        self.status_codes[status] += 1
+        self.errors += is_error
+        if not is_error:
+            self.successful_latencies.append(latency)
+
+    def report(self, elapsed: float) -> dict[str, Any]:
+        completed = len(self.latencies)
+        return {
+            "started": self.started,
+            "completed": completed,
+            "errors": self.errors,
+            "error_rate": self.errors / completed if completed else None,
+            "elapsed_seconds": elapsed,
+            "throughput_rps": (completed - self.errors) / elapsed if elapsed else None,
+            "latency": summarize_latencies(self.latencies),
+            "successful_latency": summarize_latencies(self.successful_latencies),
+            "status_codes": dict(self.status_codes),
+        }
+
+
+async def send_query(http_client: httpx.AsyncClient, url: str, query: str, statistics: LoadStatistics):
+    statistics.started += 1
+    start = time.perf_counter()
+    try:
+        response = await http_client.post(url, json={"query": query})
+        statistics.record(time.perf_counter() - start, str(response.status_code), response.status_code >= 400)
+    except Exception as e:
+        statistics.record(time.perf_counter() - start, type(e).__name__, True)
+
+
+async def run_closed_loop(http_client, url, queries, concurrency, deadline, statistics):
+    query_cycle = itertools.cycle(queries)
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            await send_query(http_client, url, next(query_cycle), statistics)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def run_open_loop(http_client, url, queries, rps, deadline, statistics):
+    query_cycle = itertools.cycle(queries)
+    interval = 1 / rps
+    next_start = time.perf_counter()
+    in_flight: set[asyncio.Task] = set()
+
+    while next_start < deadline:
+        task = asyncio.create_task(send_query(http_client, url, next(query_cycle), statistics))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        next_start += interval
+        await asyncio.sleep(max(next_start - time.perf_counter(), 0))
+
+    if in_flight:
+        await asyncio.gather(*in_flight)
+
+
+async def run(args, queries: list[str]) -> dict[str, Any]:
+    statistics = LoadStatistics()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as http_client:
+        start = time.perf_counter()
+        deadline = start + args.duration
+        if args.rps:
+            await run_open_loop(http_client, args.url, queries, args.rps, deadline, statistics)
+        else:
+            await run_closed_loop(http_client, args.url, queries, args.concurrency, deadline, statistics)
+        elapsed = time.perf_counter() - start
+    return statistics.report(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000/query")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--concurrency", type=int, default=4, help="closed loop worker count (default mode)")
+    mode.add_argument("--rps", type=float, default=None, help="open loop target requests per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to keep starting requests")
+    parser.add_argument("--timeout", type=float, default=120, help="per request timeout in seconds")
+    parser.add_argument("--queries-file", default=None, help="one query per line (default: a small built-in set)")
+    parser.add_argument("--output", default=None, help="result file (default: benchmarks/results/)")
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries_file:
+        with open(args.queries_file) as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    report = asyncio.run(run(args, queries))
+    latency = report["latency"]
+    print(
+        f"completed {report['completed']} requests in {report['elapsed_seconds']:.1f}s : "
+        f"{report['throughput_rps']:.2f} req/s, error rate {report['error_rate'] or 0:.1%}"
+    )
+    if latency["count"]:
+        print(f"latency p50={latency['p50_ms']:.0f}ms p99={latency['p99_ms']:.0f}ms max={latency['max_ms']:.0f}ms")
+    successful_latency = report["successful_latency"]
+    if report["errors"] and successful_latency["count"]:
+        print(
+            f"successful requests p50={successful_latency['p50_ms']:.0f}ms p99={successful_latency['p99_ms']:.0f}ms "
+            f"max={successful_latency['max_ms']:.0f}ms"
+        )
+    print(f"status codes : {report['status_codes']}")
+
+    output_path = save_results("load", vars(args), report, args.output)
+    print(f"results written to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+# type : ignore
+"""
+offline micro-benchmarks for ingestion, retrieval and the MCP tools.
+
+everything runs in-process against an ephemeral chroma client with the deterministic hashing embedder, no chroma server, model download or network access is needed.
+
+usage (from rag-backend/):
+    python -m benchmarks.retrieval
+    python -m benchmarks.retrieval --corpus-sizes 1000,10000 --batch-sizes 100,500 --sections store,search
+    python -m benchmarks.retrieval --sections search,quantized   # chroma hnsw vs the memory-mapped quantized index
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import Any
+from unittest import mock
+
+# must be set before chromaDB is imported so every collection handle is in-process and uses the local embedder
+os.environ.setdefault("CHROMA_MODE", "ephemeral")
+os.environ.setdefault("RAG_EMBEDDING_FUNCTION", "hashing")
+os.environ.setdefault("HF_DATASETS_OFFLINE", "1")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+from benchmarks.common import (  # noqa: E402
+    parse_int_list,
+    quiet,
+    save_results,
+    summarize_latencies,
+    synthetic_qa_corpus,
+)
+
+SECTIONS = ("store", "search", "quantized", "tools")
+
+# tools that reach external services, they are reported as skipped instead of measured
+NETWORK_TOOLS = {
+    "count_claude_message_tokens": "calls the anthropic token counting api",
+}
+
+
+def load_modules():
+    import chromaDB
+    import server
+
+    # FastMCP configures DEBUG logging on import, which would drown the benchmark output
+    logging.getLogger().setLevel(logging.WARNING)
+    return chromaDB.get_client(), chromaDB, server
+
+
+def drop_collection(client, name: str):
+    try:
+        client.delete_collection(name=name)
+    except Exception:
+        pass
+
+
+def benchmark_store(client, chromaDB, corpus_sizes: list[int], batch_sizes: list[int]):
+    results = []
+    for corpus_size in corpus_sizes:
+        corpus = synthetic_qa_corpus(corpus_size)
+        for batch_size in batch_sizes:
+            collection_name = f"benchmark_store_{corpus_size}_{batch_size}"
+            drop_collection(client, collection_name)
+            database = chromaDB.ChromaDBVectorDatabase(collection_name, client)
+
+            start = time.perf_counter()
+            with quiet():
+                database.store_data(corpus, batch_size=batch_size)
+            elapsed = time.perf_counter() - start
+
+            results.append(
+                {
+                    "corpus_size": corpus_size,
+                    "batch_size": batch_size,
+                    "seconds": elapsed,
+                    "documents_per_second": corpus_size / elapsed if elapsed else None,
+                }
+            )
+            print(
+                f"store_data corpus={corpus_size} batch={batch_size}: {elapsed:.3f}s "
+                f"({corpus_size / elapsed:.0f} docs/s)"
+            )
+            drop_collection(client, collection_name)
+    return results
+
+
+def benchmark_search(
+    client, chromaDB, corpus_size: int, k_values: list[int], number_of_queries: int
+):
+    corpus = synthetic_qa_corpus(corpus_size)
+    queries = [entry["question"] for entry in corpus["test"][:number_of_queries]]
+    collection_name = f"benchmark_search_{corpus_size}"
+    drop_collection(client, collection_name)
+    database = chromaDB.ChromaDBVectorDatabase(collection_name, client)
+    with quiet():
+        database.store_data(corpus, batch_size=500)
+
+    # warm the index so the first measured query doesn't pay for loading it
+    database.search(queries[0], 1)
+
+    results = []
+    for k in k_values:
+        samples = []
+        for query in queries:
+            start = time.perf_counter()
+            database.search(query, k)
+            samples.append(time.perf_counter() - start)
+        summary = summarize_latencies(samples)
+        results.append({"corpus_size": corpus_size, "k": k, **summary})
+        print(
+            f"search corpus={corpus_size} k={k}: p50={summary['p50_ms']:.2f}ms p99={summary['p99_ms']:.2f}ms"
+        )
+    drop_collection(client, collection_name)
+    return results
+
+
+def benchmark_quantized_index(corpus_size: int, k_values: list[int], number_of_queries: int, quantizations: list[str]):
+    """build / open time, latency, recall against an exact search and footprint of vector_index.QuantizedVectorIndex"""
+    import shutil
+    import tempfile
+
+    import numpy as np
+    import vector_index
+    from benchmarks.hnsw_tuning import pairwise_distances, recall_at_k
+    from config import settings
+
+    corpus = synthetic_qa_corpus(corpus_size)
+    queries = [entry["question"] for entry in corpus["test"][:number_of_queries]]
+    directory = tempfile.mkdtemp(prefix="quantized_index_")
+    results = []
+    try:
+        for quantization in quantizations:
+            settings.vector_index_quantization = quantization
+            # the exact copy is written so both modes can be compared (and is the ground truth below), it is off by default
+            settings.vector_index_rescore = True
+            start = time.perf_counter()
+            with quiet():
+                vector_index.QuantizedVectorIndex(f"benchmark_{quantization}", directory).store_data(corpus, batch_size=500)
+            build_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            index = vector_index.QuantizedVectorIndex(f"benchmark_{quantization}", directory)
+            open_seconds = time.perf_counter() - start
+
+            exact = index.stored_vectors(list(range(index.count())))
+            distances = pairwise_distances(exact, index.embed(queries), index.space)
+            row_of_id = {identifier: row for row, identifier in enumerate(index.records["ids"])}
+            index.search(queries[0], 1)
+
+            for k in k_values:
+                for rescore in (False, True):
+                    samples, recall = [], []
+                    for query, query_distances in zip(queries, distances):
+                        start = time.perf_counter()
+                        found = index.search(query, k, rescore=rescore)["ids"][0]
+                        samples.append(time.perf_counter() - start)
+                        recall.append(recall_at_k(query_distances, [row_of_id[identifier] for identifier in found], k))
+                    summary = summarize_latencies(samples)
+                    results.append(
+                        {
+                            "quantization": quantization,
+                            "corpus_size": corpus_size,
+                            "k": k,
+                            "rescore": rescore,
+                            "recall": float(np.mean(recall)),
+                            "build_seconds": build_seconds,
+                            "open_ms": open_seconds * 1000,
+                            **index.memory_footprint(),
+                            **summary,
+                        }
+                    )
+                    print(
+                        f"quantized {quantization} corpus={corpus_size} k={k} rescore={rescore}: "
+                        f"recall={np.mean(recall):.3f} p50={summary['p50_ms']:.2f}ms p99={summary['p99_ms']:.2f}ms "
+                        f"open={open_seconds * 1000:.1f}ms scanned={index.memory_footprint()['quantized_bytes'] / 2**20:.1f}MiB "
+                        f"disk={index.memory_footprint()['disk_bytes'] / 2**20:.1f}MiB float32={index.memory_footprint()['float32_bytes'] / 2**20:.1f}MiB"
+                    )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+class ToolArguments:
+    """builds the arguments (and any per-call setup) for every tool exposed by server.py"""
+
+    def __init__(self, client, chromaDB, collection_name: str, queries: list[str]):
+        self.client = client
+        self.chromaDB = chromaDB
+        self.collection_name = collection_name
+        self.queries = queries
+        self.scratch_collections: list[str] = []
+
+    def _scratch(self, name: str, create: bool = False) -> str:
+        self.scratch_collections.append(name)
+        if create:
+            self.client.get_or_create_collection(name=name)
+        return name
+
+    def build(self, tool_name: str, iteration: int) -> dict[str, Any] | None:
+        query = self.queries[iteration % len(self.queries)]
+        match tool_name:
+            case "echo":
+                return {"message": "well hello there"}
+            case "context_retriever":
+                return {
+                    "user_query": query,
+                    "number_of_relevant_context": 3,
+                    "name_of_collection": self.collection_name,
+                }
+            case "peek_at_database":
+                return {"number_of_rows": 3, "name_of_collection": self.collection_name}
+            case "modify_collection_name":
+                original = f"benchmark_rename_{iteration}"
+                if iteration == 0:
+                    self._scratch(original, create=True)
+                return {
+                    "original_collection": original,
+                    "new_collection_name": self._scratch(f"benchmark_rename_{iteration + 1}"),
+                }
+            case "get_list_of_collections":
+                return {}
+            case "delete_collection_by_name":
+                return {"collection_name": self._scratch(f"benchmark_delete_{iteration}", create=True)}
+            case "enter_data":
+                return {"collection_name": self._scratch(f"benchmark_enter_{iteration}")}
+            case "get_collection_data_count":
+                return {"name_of_collection": self.collection_name}
+            case "scan_collection":
+                return {"name_of_collection": self.collection_name, "page_size": 20}
+            case "clone_collection":
+                return {
+                    "source_collection": self.collection_name,
+                    "new_collection_name": self._scratch(f"benchmark_clone_{iteration}"),
+                }
+            case "get_user_query_history":
+                return {"user_query": query, "collection_name": self.collection_name, "n_results": 5}
+            case _:
+                return None
+
+    def cleanup(self):
+        for name in self.scratch_collections:
+            drop_collection(self.client, name)
+        self.scratch_collections = []
+
+
+async def benchmark_tools(
+    client, chromaDB, server, corpus_size: int, ingest_corpus_size: int, iterations: int
+):
+    from mcp.shared.memory import create_connected_server_and_client_session  # type: ignore
+
+    corpus = synthetic_qa_corpus(corpus_size)
+    collection_name = "benchmark_tools"
+    drop_collection(client, collection_name)
+    with quiet():
+        chromaDB.ChromaDBVectorDatabase(collection_name, client).store_data(corpus, batch_size=500)
+
+    arguments = ToolArguments(
+        client, chromaDB, collection_name, [entry["question"] for entry in corpus["test"]]
+    )
+    # `enter_data` would otherwise download rag-mini-wikipedia
+    ingest_corpus = {
+        "status": "success",
+        "status_code": 200,
+        "message": "data loaded successfully",
+        "data": synthetic_qa_corpus(ingest_corpus_size),
+    }
+
+    results: dict[str, Any] = {}
+    # the server warmup would ingest and query the configured collections while the tools are being timed
+    with mock.patch.object(server, "get_huggingface_data", return_value=ingest_corpus), mock.patch.object(
+        server.settings, "warmup_enabled", False
+    ):
+        async with create_connected_server_and_client_session(server.mcp._mcp_server) as session:
+            tools = (await session.list_tools()).tools
+            for tool in tools:
+                if tool.name in NETWORK_TOOLS:
+                    results[tool.name] = {"skipped": NETWORK_TOOLS[tool.name]}
+                    continue
+
+                samples, errors = [], 0
+                for iteration in range(iterations):
+                    tool_arguments = arguments.build(tool.name, iteration)
+                    if tool_arguments is None:
+                        break
+                    start = time.perf_counter()
+                    with quiet():
+                        try:
+                            result = await session.call_tool(tool.name, tool_arguments)
+                            errors += bool(result.isError)
+                        except Exception:
+                            errors += 1
+                    samples.append(time.perf_counter() - start)
+                arguments.cleanup()
+
+                if not samples:
+                    results[tool.name] = {"skipped": "no benchmark arguments defined"}
+                    continue
+                summary = summarize_latencies(samples)
+                results[tool.name] = {**summary, "errors": errors}
+                print(
+                    f"tool {tool.name}: p50={summary['p50_ms']:.2f}ms p99={summary['p99_ms']:.2f}ms errors={errors}"
+                )
+
+    drop_collection(client, collection_name)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", default=",".join(SECTIONS), help="comma separated subset of store,search,tools")
+    parser.add_argument("--corpus-sizes", default="1000,5000", help="corpus sizes for the store_data benchmark")
+    parser.add_argument("--batch-sizes", default="50,100,500", help="batch sizes for the store_data benchmark")
+    parser.add_argument("--search-corpus-size", type=int, default=5000)
+    parser.add_argument("--k-values", default="1,3,5,10,50")
+    parser.add_argument("--queries", type=int, default=200, help="number of queries per k")
+    parser.add_argument("--quantizations", default="int8,float16", help="vector formats for the quantized section")
+    parser.add_argument("--tool-corpus-size", type=int, default=1000)
+    parser.add_argument("--tool-ingest-size", type=int, default=200, help="corpus size ingested by each enter_data call")
+    parser.add_argument("--tool-iterations", type=int, default=20)
+    parser.add_argument("--output", default=None, help="result file (default: benchmarks/results/)")
+    args = parser.parse_args()
+
+    sections = [section.strip() for section in args.sections.split(",") if section.strip()]
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        parser.error(f"unknown sections : {sorted(unknown)}")
+
+    client, chromaDB, server = load_modules()
+    results: dict[str, Any] = {}
+
+    if "store" in sections:
+        results["store_data"] = benchmark_store(
+            client, chromaDB, parse_int_list(args.corpus_sizes), parse_int_list(args.batch_sizes)
+        )
+    if "search" in sections:
+        results["search"] = benchmark_search(
+            client, chromaDB, args.search_corpus_size, parse_int_list(args.k_values), args.queries
+        )
+    if "quantized" in sections:
+        results["quantized"] = benchmark_quantized_index(
+            args.search_corpus_size,
+            parse_int_list(args.k_values),
+            args.queries,
+            [quantization.strip() for quantization in args.quantizations.split(",") if quantization.strip()],
+        )
+    if "tools" in sections:
+        results["tools"] = asyncio.run(
+            benchmark_tools(
+                client, chromaDB, server, args.tool_corpus_size, args.tool_ingest_size, args.tool_iterations
+            )
+        )
+
+    output_path = save_results("retrieval", vars(args), results, args.output)
+    print(f"results written to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+# type : ignore
+"""
+retrieval quality vs latency over rag-mini-wikipedia : recall@k, hit rate@k and MRR next to per query latency and throughput,
+so a retrieval change can be checked on both axes with one command.
+
+every question of the `question-answer` split is run against a collection built from the same dataset :
+    --corpus passages  the text-corpus passages chunked by chunking.py, the relevant chunks are the ones containing the answer
+                       (questions with yes / no or very short answers, and answers no chunk contains, are left out).
+                       the default with the huggingface dataset
+    --corpus qa        the question / answer documents written by store_data, the relevant rows are the ones with the same question.
+                       NOTE : this is self-retrieval, every document contains the text of its question, so recall and MRR are an upper
+                       bound that says little about retrieval quality. Use it for latency / throughput, and with --dataset synthetic
+                       (the default there, it has no passages)
+
+queries go through `get_vector_database(name).search` (the configured backend, see --backend) or, with --through-tool,
+through the `context_retriever` tool over an in-memory MCP session (single-flight, result formatting and all).
+--batch-size queries are sent per search call and --workers calls run in parallel.
+
+the dataset is read from the local huggingface cache (HF_DATASETS_OFFLINE is set), the embeddings come from the deterministic
+hashing embedder unless RAG_EMBEDDING_FUNCTION says otherwise, and chroma runs in memory.
+
+usage (from rag-backend/):
+    python -m benchmarks.retrieval_eval
+    python -m benchmarks.retrieval_eval --backend quantized --k 1,5,10 --workers 4
+    python -m benchmarks.retrieval_eval --through-tool
+    python -m benchmarks.retrieval_eval --corpus qa   # self-retrieval, latency only
+    python -m benchmarks.retrieval_eval --dataset synthetic --corpus-size 5000   # no dataset cache needed
+"""
+import argparse
+import ast
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+# must be set before config is imported (see main for --backend)
+os.environ.setdefault("CHROMA_MODE", "ephemeral")
+os.environ.setdefault("RAG_EMBEDDING_FUNCTION", "hashing")
+os.environ.setdefault("HF_DATASETS_OFFLINE", "1")
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+# the server warmup would ingest complete_collection while the questions are timed
+os.environ.setdefault("WARMUP_ENABLED", "False")
+
+from benchmarks.common import parse_int_list, quiet, save_results, summarize_latencies, synthetic_qa_corpus  # noqa: E402
+
+# answers that say nothing about which passage is relevant
+UNINFORMATIVE_ANSWERS = {"yes", "no", "yes.", "no."}
+MIN_ANSWER_CHARACTERS = 4
+TOOL_RESULT_PREFIX = "Query results are :"
+SELF_RETRIEVAL_CAVEAT = (
+    "NOTE : --corpus qa is self-retrieval (every document contains its question), recall and MRR are an upper bound, "
+    "use --corpus passages to measure retrieval quality"
+)
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def load_questions(dataset: str, corpus_size: int) -> list[dict[str, Any]]:
+    if dataset == "synthetic":
+        return synthetic_qa_corpus(corpus_size)["test"]
+
+    from chromaDB import get_huggingface_data
+
+    loaded = get_huggingface_data()
+    if loaded["status_code"] != 200:
+        raise SystemExit(
+            f"rag-mini-wikipedia isn't in the local huggingface cache ({loaded['message']}).\n"
+            "load it once with network access (python chromaDB.py) or run with --dataset synthetic"
+        )
+    return list(loaded["data"]["test"])
+
+
+def build_qa_corpus(database, entries: list[dict[str, Any]]) -> list[set[str]]:
+    """stores the entries like enter_data does, returns the relevant ids of every question"""
+    from chromaDB import qa_records
+
+    ids, _, metadatas = qa_records({"test": entries})
+    with quiet():
+        database.store_data({"test": entries}, batch_size=500)
+
+    ids_by_question: dict[str, set[str]] = {}
+    for identifier, metadata in zip(ids, metadatas):
+        ids_by_question.setdefault(normalize(metadata["question"]), set()).add(identifier)
+    return [ids_by_question[normalize(entry["question"])] for entry in entries]
+
+
+def build_passage_corpus(database, entries: list[dict[str, Any]], workers: int) -> list[set[str]]:
+    """chunks and stores the text-corpus passages, returns the ids of the chunks containing each answer (empty : question skipped)"""
+    from chromaDB import HUGGINGFACE_TEXT_CORPUS_CONFIG, get_huggingface_data
+    from chunking import chunk_passages, ingest_passages, passage_pairs
+    from config import settings
+
+    loaded = get_huggingface_data(HUGGINGFACE_TEXT_CORPUS_CONFIG)
+    if loaded["status_code"] != 200:
+        raise SystemExit(f"the text-corpus config isn't in the local huggingface cache ({loaded['message']})")
+    passages = list(loaded["data"]["passages"])
+    with quiet():
+        ingest_passages(database, iter(passages), batch_size=500, workers=workers)
+
+    # same chunks as the ones stored (chunking is deterministic), kept here to look the answers up
+    ids, documents, _ = chunk_passages(list(passage_pairs(passages)), settings.chunk_size_tokens, settings.chunk_overlap_tokens)
+    normalized_documents = [normalize(document) for document in documents]
+
+    relevant = []
+    for entry in entries:
+        answer = normalize(str(entry["answer"]))
+        if len(answer) < MIN_ANSWER_CHARACTERS or answer in UNINFORMATIVE_ANSWERS:
+            relevant.append(set())
+            continue
+        relevant.append({identifier for identifier, document in zip(ids, normalized_documents) if answer in document})
+    return relevant
+
+
+def score(retrieved: list[list[str]], relevant: list[set[str]], k_values: list[int]) -> dict[str, Any]:
+    """recall@k (share of the relevant ids in the top k), hit rate@k (at least one) and MRR over the deepest k"""
+    scores = {}
+    for k in k_values:
+        recall = [len(relevant_ids & set(found[:k])) / len(relevant_ids) for found, relevant_ids in zip(retrieved, relevant)]
+        hits = [bool(relevant_ids & set(found[:k])) for found, relevant_ids in zip(retrieved, relevant)]
+        scores[f"recall@{k}"] = sum(recall) / len(recall)
+        scores[f"hit_rate@{k}"] = sum(hits) / len(hits)
+
+    reciprocal_ranks = []
+    for found, relevant_ids in zip(retrieved, relevant):
+        rank = next((position for position, identifier in enumerate(found, start=1) if identifier in relevant_ids), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+    scores["mrr"] = sum(reciprocal_ranks) / len(reciprocal_ranks)
+    return scores
+
+
+def run_search(database, questions: list[str], k: int, batch_size: int, workers: int) -> tuple[list[list[str]], list[float], float]:
+    """(ids per question, seconds per search call, wall seconds)"""
+    batches = [questions[start : start + batch_size] for start in range(0, len(questions), batch_size)]
+
+    def search(batch):
+        start = time.perf_counter()
+        result = database.search(batch, k)
+        return result["ids"], time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as executor:
+        outputs = list(executor.map(search, batches))
+    wall_seconds = time.perf_counter() - start
+    return [ids for batch_ids, _ in outputs for ids in batch_ids], [seconds for _, seconds in outputs], wall_seconds
+
+
+async def run_tool(collection_name: str, questions: list[str], k: int, workers: int) -> tuple[list[list[str]], list[float], float]:
+    """same as run_search through the context_retriever tool, `workers` calls in flight"""
+    from mcp.shared.memory import create_connected_server_and_client_session
+
+    import server
+
+    logging.getLogger().setLevel(logging.WARNING)
+    retrieved: list[list[str]] = [[] for _ in questions]
+    samples: list[float] = [0.0] * len(questions)
+    semaphore = asyncio.Semaphore(workers)
+
+    async with create_connected_server_and_client_session(server.mcp._mcp_server) as session:
+
+        async def call(position: int, question: str):
+            async with semaphore:
+                start = time.perf_counter()
+                result = await session.call_tool(
+                    "context_retriever",
+                    {"user_query": question, "number_of_relevant_context": k, "name_of_collection": collection_name},
+                )
+                samples[position] = time.perf_counter() - start
+            text = result.content[0].text if result.content else ""
+            if result.isError or not text.startswith(TOOL_RESULT_PREFIX):
+                raise RuntimeError(f"context_retriever failed for {question!r} : {text[:200]}")
+            retrieved[position] = ast.literal_eval(text[len(TOOL_RESULT_PREFIX) :].strip())["ids"][0]
+
+        start = time.perf_counter()
+        await asyncio.gather(*(call(position, question) for position, question in enumerate(questions)))
+        wall_seconds = time.perf_counter() - start
+    return retrieved, samples, wall_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", choices=("huggingface", "synthetic"), default="huggingface")
+    parser.add_argument(
+        "--corpus", choices=("qa", "passages"), default=None, help="default : passages, qa with --dataset synthetic (see above)"
+    )
+    parser.add_argument("--corpus-size", type=int, default=5000, help="entries of the synthetic dataset")
+    parser.add_argument("--backend", choices=("chroma", "quantized"), default=None, help="default : RETRIEVAL_BACKEND")
+    parser.add_argument("--through-tool", action="store_true", help="query through the context_retriever MCP tool")
+    parser.add_argument("--k", default="1,3,5,10")
+    parser.add_argument("--queries", type=int, default=0, help="number of sampled questions (default : all)")
+    parser.add_argument("--batch-size", type=int, default=1, help="questions per search call (not with --through-tool)")
+    parser.add_argument("--workers", type=int, default=1, help="search calls (or tool calls) in parallel")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="result file (default: benchmarks/results/)")
+    args = parser.parse_args()
+    args.corpus = args.corpus or ("qa" if args.dataset == "synthetic" else "passages")
+    if args.corpus == "passages" and args.dataset == "synthetic":
+        parser.error("--corpus passages needs the huggingface text-corpus, the synthetic dataset only has question / answer pairs")
+    if args.through_tool and args.batch_size != 1:
+        parser.error("context_retriever takes one query per call, --batch-size can't be used with --through-tool")
+
+    if args.backend:
+        os.environ["RETRIEVAL_BACKEND"] = args.backend
+    if (args.backend or os.environ.get("RETRIEVAL_BACKEND")) == "quantized":
+        os.environ.setdefault("VECTOR_INDEX_PATH", tempfile.mkdtemp(prefix="retrieval_eval_"))
+
+    from chromaDB import get_vector_database
+    from config import settings
+
+    k_values = sorted(parse_int_list(args.k))
+    entries = load_questions(args.dataset, args.corpus_size)
+    collection_name = f"retrieval_eval_{args.corpus}"
+    database = get_vector_database(collection_name)
+
+    start = time.perf_counter()
+    if args.corpus == "qa":
+        relevant = build_qa_corpus(database, entries)
+    else:
+        relevant = build_passage_corpus(database, entries, settings.chunking_workers)
+    ingest_seconds = time.perf_counter() - start
+
+    evaluated = [position for position, relevant_ids in enumerate(relevant) if relevant_ids]
+    skipped = len(entries) - len(evaluated)
+    if args.queries:
+        evaluated = sorted(random.Random(args.seed).sample(evaluated, min(args.queries, len(evaluated))))
+    questions = [entries[position]["question"] for position in evaluated]
+    relevant = [relevant[position] for position in evaluated]
+    print(
+        f"backend={settings.retrieval_backend} embedder={settings.rag_embedding_function} corpus={args.corpus} "
+        f"documents={database.count()} questions={len(questions)} (skipped {skipped}) "
+        f"ingest={ingest_seconds:.1f}s path={'context_retriever' if args.through_tool else 'search'}"
+    )
+    if args.corpus == "qa":
+        print(SELF_RETRIEVAL_CAVEAT)
+
+    # the first search loads the index, it isn't part of the measurement
+    database.search(questions[0], 1)
+    if args.through_tool:
+        retrieved, samples, wall_seconds = asyncio.run(run_tool(collection_name, questions, k_values[-1], args.workers))
+    else:
+        retrieved, samples, wall_seconds = run_search(database, questions, k_values[-1], args.batch_size, args.workers)
+
+    scores = score(retrieved, relevant, k_values)
+    latency = summarize_latencies(samples)
+    throughput = len(questions) / wall_seconds if wall_seconds else None
+    for k in k_values:
+        print(f"k={k}: recall={scores[f'recall@{k}']:.3f} hit_rate={scores[f'hit_rate@{k}']:.3f}")
+    print(f"mrr@{k_values[-1]}={scores['mrr']:.3f}" + (" (self-retrieval, upper bound)" if args.corpus == "qa" else ""))
+    print(
+        f"latency per {'call' if args.batch_size > 1 else 'query'} : p50={latency['p50_ms']:.2f}ms p99={latency['p99_ms']:.2f}ms, "
+        f"throughput {throughput:.1f} queries/s ({args.workers} workers, batch size {args.batch_size})"
+    )
+
+    output_path = save_results(
+        "retrieval_eval",
+        vars(args),
+        {
+            "backend": settings.retrieval_backend,
+            "embedding_function": settings.rag_embedding_function,
+            "documents": database.count(),
+            "questions": len(questions),
+            "skipped_questions": skipped,
+            "self_retrieval": args.corpus == "qa",
+            "ingest_seconds": ingest_seconds,
+            "scores": scores,
+            "latency": latency,
+            "throughput_qps": throughput,
+        },
+        args.output,
+    )
+    print(f"results written to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# type : ignore
+"""
+startup time benchmark.
+
+- import time of the backend modules, each measured in a fresh interpreter
+- cold start of the MCP server subprocess: spawn `python server.py`, complete the `initialize` handshake and list the tools over stdio
+
+no chroma server is needed, the clients are only created when a tool uses them.
+
+usage (from rag-backend/):
+    python -m benchmarks.startup
+    python -m benchmarks.startup --repeat 10 --modules server,chromaDB
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import save_results, summarize_latencies
+
+BACKEND_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = "chromaDB,server,mcp_client,main"
+
+IMPORT_SNIPPET = "import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+
+
+def subprocess_environment() -> dict[str, str]:
+    return {**os.environ, "ANONYMIZED_TELEMETRY": "False", "PYTHONDONTWRITEBYTECODE": "1"}
+
+
+def measure_import(module: str, repeat: int) -> dict:
+    import_samples, process_samples = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET.format(module=module)],
+            cwd=BACKEND_DIRECTORY,
+            env=subprocess_environment(),
+            capture_output=True,
+            text=True,
+        )
+        process_samples.append(time.perf_counter() - start)
+        if completed.returncode != 0:
+            return {"error": completed.stderr.strip().splitlines()[-1:]}
+        import_samples.append(float(completed.stdout.strip().splitlines()[-1]))
+    return {"import": summarize_latencies(import_samples), "process": summarize_latencies(process_samples)}
+
+
+async def measure_server_cold_start(repeat: int) -> dict:
+    from mcp import ClientSession, StdioServerParameters  # type: ignore
+    from mcp.client.stdio import stdio_client  # type: ignore
+
+    server_parameters = StdioServerParameters(
+        command=sys.executable,
+        args=[os.path.join(BACKEND_DIRECTORY, "server.py")],
+        env=subprocess_environment(),
+        cwd=BACKEND_DIRECTORY,
+    )
+    initialize_samples, list_tools_samples = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        async with stdio_client(server_parameters) as (read_stream, write_stream):
+            async with ClientSession(read_stream, write_stream) as session:
+                await session.initialize()
+                initialize_samples.append(time.perf_counter() - start)
+                await session.list_tools()
+                list_tools_samples.append(time.perf_counter() - start)
+    return {
+        "spawn_to_initialize": summarize_latencies(initialize_samples),
+        "spawn_to_list_tools": summarize_latencies(list_tools_samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", default=DEFAULT_MODULES, help="comma separated modules to import")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--skip-server", action="store_true", help="don't measure the MCP server subprocess")
+    parser.add_argument("--output", default=None, help="result file (default: benchmarks/results/)")
+    args = parser.parse_args()
+
+    results = {"imports": {}}
+    for module in [module.strip() for module in args.modules.split(",") if module.strip()]:
+        measurement = measure_import(module, args.repeat)
+        results["imports"][module] = measurement
+        if "error" in measurement:
+            print(f"import {module}: failed {measurement['error']}")
+        else:
+            print(
+                f"import {module}: p50={measurement['import']['p50_ms']:.0f}ms "
+                f"(process p50={measurement['process']['p50_ms']:.0f}ms)"
+            )
+
+    if not args.skip_server:
+        results["server"] = asyncio.run(measure_server_cold_start(args.repeat))
+        print(
+            f"server.py spawn to initialize p50={results['server']['spawn_to_initialize']['p50_ms']:.0f}ms, "
+            f"to list_tools p50={results['server']['spawn_to_list_tools']['p50_ms']:.0f}ms"
+        )
+
+    output_path = save_results("startup", vars(args), results, args.output)
+    print(f"results written to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
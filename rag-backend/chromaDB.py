@@ -1,36 +1,245 @@
 # type : ignore
 """run this script to store data within chroma db from huggingface"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from functools import lru_cache
 from typing import Any
-from datasets import load_dataset  # type: ignore
-import chromadb  # type: ignore
 from datetime import datetime
-from chromadb.config import Settings  # type: ignore
+from config import settings
 
-client = chromadb.HttpClient(host="localhost", port=9000)  # recommended
-local_client = chromadb.PersistentClient(
-    path="/Users/ayandas/Desktop/zed-proj/shield-takehome-proj/rag-chatbot-v1/rag-backend/chromaDbData"
-)
+# NOTE : chromadb, datasets and the embedding model are imported lazily, importing this module must stay cheap since every MCP server subprocess imports it before answering `initialize`
+
+# NOTE : logging rather than print, this code runs inside the MCP server where stdout is the stdio protocol pipe
+logger = logging.getLogger(__name__)
 
 # Constants
 HUGGINGFACE_DATASET_API = "rag-datasets/rag-mini-wikipedia"
 HUGGINGFACE_LOAD_DATASET_2ND_PARAM = "question-answer"
+# passages of the same wikipedia articles (split "passages"), chunked before they are stored (see chunking.py)
+HUGGINGFACE_TEXT_CORPUS_CONFIG = "text-corpus"
+
+
+def content_hash(document: str, metadata: dict[str, Any]) -> str:
+    """hash of everything that is stored for a row, used to skip rows that didn't change when a corpus is loaded again"""
+    metadata = {key: value for key, value in metadata.items() if key != "content_hash"}
+    payload = json.dumps({"document": document, "metadata": metadata}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def qa_records(data) -> tuple[list[str], list[str], list[dict[str, Any]]]:
+    """
+    ids, documents and metadatas of the `test` split (question / answer / id entries).
+
+    the dataset id is the row id, entries without one get an id derived from their question and answer so reloading them is stable too.
+    a row repeated within `data` is kept once (the last one), one upsert can't carry the same id twice.
+    every metadata carries the content_hash of its row.
+    """
+    rows: dict[str, tuple[str, dict[str, Any]]] = {}
+    for entry in data["test"]:
+        # Combine question and answer for the document
+        document = f"Question: {entry['question']} Answer: {entry['answer']}"
+        metadata = {"author": "ayan das", "question": entry["question"]}
+        metadata["content_hash"] = content_hash(document, metadata)
+
+        if entry.get("id") is not None:
+            identifier = str(entry["id"])
+        else:
+            # NOTE : the answer is part of the id, the same question can come with several answers
+            identifier = hashlib.sha256(f"{entry['question']}\n{entry['answer']}".encode()).hexdigest()[:32]
+        rows.pop(identifier, None)
+        rows[identifier] = (document, metadata)
+    return list(rows), [document for document, _ in rows.values()], [metadata for _, metadata in rows.values()]
+
+
+def plan_sync(
+    ids: list[str], metadatas: list[dict[str, Any]], stored_hashes: dict[str, str]
+) -> dict[str, list]:
+    """
+    compares incoming rows to the stored ones (id -> content_hash) :
+        upsert   : row positions that are new or whose content changed
+        unchanged: row positions already stored as is
+        delete   : stored ids that are not in the incoming data
+    """
+    plan = {"upsert": [], "unchanged": [], "delete": []}
+    incoming_ids = set()
+    for position, (identifier, metadata) in enumerate(zip(ids, metadatas)):
+        incoming_ids.add(identifier)
+        if stored_hashes.get(identifier) == metadata["content_hash"]:
+            plan["unchanged"].append(position)
+        else:
+            plan["upsert"].append(position)
+    plan["delete"] = [identifier for identifier in stored_hashes if identifier not in incoming_ids]
+    return plan
+
+
+# chroma's system setup isn't thread safe and lru_cache doesn't serialize concurrent first calls (warmup threads open clients concurrently)
+_client_lock = threading.RLock()
+
+
+@lru_cache(maxsize=None)
+def get_client():
+    """
+    shared chroma client, created on first use according to settings.chroma_mode :
+        http       : chroma server at settings.chroma_host / settings.chroma_port (recommended when several processes share the data)
+        persistent : embedded in-process client stored at settings.chroma_persist_path, no http hop
+        ephemeral  : embedded in-memory client, nothing is written to disk
+    """
+    import chromadb  # type: ignore
+
+    with _client_lock:
+        match settings.chroma_mode:
+            case "http":
+                chroma_settings = get_http_client_settings()
+                return chromadb.HttpClient(
+                    host=settings.chroma_host,
+                    port=settings.chroma_port,
+                    ssl=settings.chroma_ssl,
+                    headers=chroma_settings.chroma_server_headers,
+                    settings=chroma_settings,
+                )
+            case "persistent":
+                return get_local_client()
+            case "ephemeral":
+                return chromadb.EphemeralClient()
+            case _:
+                raise ValueError(f"unknown chroma mode : {settings.chroma_mode}")
+
+
+def get_http_client_settings():
+    """chroma Settings of the sync and async http clients : server headers (auth) and certificate verification"""
+    from chromadb.config import Settings  # type: ignore
+
+    return Settings(
+        chroma_server_headers=dict(settings.chroma_server_headers) or None,
+        chroma_server_ssl_verify=settings.chroma_ssl_verify,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_local_client():
+    """embedded chroma client persisted at settings.chroma_persist_path, created on first use"""
+    import chromadb  # type: ignore
+
+    with _client_lock:
+        return chromadb.PersistentClient(path=settings.chroma_persist_path)
+
+
+_async_client = None
+_async_client_lock = asyncio.Lock()
+
+
+async def get_async_client():
+    """
+    shared async chroma client for the MCP tools, created on first use according to settings.chroma_mode.
+
+    http mode uses a pooled AsyncHttpClient, the embedded modes run the sync client calls in worker threads (see async_chroma.py)
+    """
+    global _async_client
+    if _async_client is None:
+        async with _async_client_lock:
+            if _async_client is None:
+                from async_chroma import ThreadedAsyncClient, create_async_http_client
+
+                if settings.chroma_mode == "http":
+                    _async_client = await create_async_http_client()
+                else:
+                    _async_client = ThreadedAsyncClient(get_client())
+    return _async_client
+
+
+def __getattr__(name: str) -> Any:
+    # keeps `chromaDB.client` / `chromaDB.local_client` working for scripts written against the old module level clients
+    if name == "client":
+        return get_client()
+    if name == "local_client":
+        return get_local_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@lru_cache(maxsize=None)
+def get_embedding_function():
+    """
+    embedding function shared by every collection handle.
+
+    set RAG_EMBEDDING_FUNCTION=hashing to use the deterministic local embedder instead of chroma's default model (which is downloaded on first use).
+    """
+    if settings.rag_embedding_function == "hashing":
+        from embeddings import HashingEmbeddingFunction
+
+        return HashingEmbeddingFunction()
+
+    from chromadb.utils import embedding_functions  # type: ignore
+
+    return embedding_functions.DefaultEmbeddingFunction()
+
+
+def get_hnsw_configuration(
+    space: str | None = None,
+    max_neighbors: int | None = None,
+    ef_construction: int | None = None,
+    ef_search: int | None = None,
+) -> dict[str, Any]:
+    """
+    hnsw index parameters for a new collection, arguments override settings.chroma_hnsw_* and anything left unset keeps chroma's default.
+
+        space           : distance function, "l2" / "cosine" / "ip"
+        max_neighbors   : graph degree (M), higher means better recall, more memory and slower inserts
+        ef_construction : candidate list size while building, higher means a better graph and slower inserts
+        ef_search       : candidate list size while querying, higher means better recall and slower queries
+    """
+    hnsw = {
+        "space": space or settings.chroma_hnsw_space,
+        "max_neighbors": max_neighbors or settings.chroma_hnsw_max_neighbors,
+        "ef_construction": ef_construction or settings.chroma_hnsw_ef_construction,
+        "ef_search": ef_search or settings.chroma_hnsw_ef_search,
+    }
+    return {key: value for key, value in hnsw.items() if value is not None}
+
+
+def get_collection_configuration(hnsw: dict[str, Any] | None = None) -> dict[str, Any] | None:
+    """`configuration` argument for create / get_or_create_collection, None when every index parameter is left to chroma"""
+    hnsw = get_hnsw_configuration(**(hnsw or {}))
+    return {"hnsw": hnsw} if hnsw else None
 
 
 class ChromaDBVectorDatabase:
     def __init__(
-        self, collection_name: str = "complete_collection", client_instance: Any = None
+        self,
+        collection_name: str = "complete_collection",
+        client_instance: Any = None,
+        embedding_function: Any = None,
+        hnsw: dict[str, Any] | None = None,
     ):
+        """
+        `hnsw` holds index parameters (see get_hnsw_configuration), they are only used when the collection is created,
+        except ef_search which is also applied to an existing collection (chroma picks it up the next time the index is loaded).
+        """
         # Initialize ChromaDB client and create a collection
-        self.client = client_instance
+        self.client = client_instance if client_instance is not None else get_client()
         self.collection = self.client.get_or_create_collection(
             name=collection_name,
+            configuration=get_collection_configuration(hnsw),
             metadata={
                 "description": "chroma db vector collection",
                 "created": str(datetime.now()),
             },
+            embedding_function=embedding_function or get_embedding_function(),
         )
         self.collection_name = collection_name
 
+        ef_search = (hnsw or {}).get("ef_search")
+        if ef_search and self.index_configuration().get("ef_search") != ef_search:
+            self.collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+
+    def index_configuration(self) -> dict[str, Any]:
+        return (self.collection.configuration_json or {}).get("hnsw") or {}
+
+    def count(self) -> int:
+        return self.collection.count()
+
     def get_collection_list(self):
         return self.client.list_collections()
 
@@ -44,82 +253,161 @@ class ChromaDBVectorDatabase:
             },
         )
 
-    def store_data(self, data):
+    def store_data(self, data, batch_size: int = 100):
         """
         Store a list of dictionaries in the ChromaDB collection.
         Each dictionary should have 'question', 'answer', and 'id'.
         """
-        # Extract the test data
-        test_data = list(data["test"])
-
-        # Prepare lists for batch insertion
-        documents = []
-        metadatas = []
-        ids = []
-
-        # Process each entry
-        for entry in test_data:
-            # Combine question and answer for the document
-            document_text = f"Question: {entry['question']} Answer: {entry['answer']}"
-            documents.append(document_text)
-
-            # Create metadata
-            metadata = {"author": "ayan das", "question": entry["question"]}
-            metadatas.append(metadata)
-
-            # Convert ID to string to ensure compatibility
-            ids.append(str(entry["id"]))
-
-        # Print some debug information
-        print(f"Number of documents: {len(documents)}")
-        print(f"Number of metadatas: {len(metadatas)}")
-        print(f"Number of ids: {len(ids)}")
-        print(f"Sample documents: {documents[:5]}")
-        print(f"Sample metadatas: {metadatas[:5]}")
-        print(f"Sample ids: {ids[:5]}")
-
-        # Add documents in batches to avoid potential size limits
-        batch_size = 100
+        ids, documents, metadatas = qa_records(data)
+
+        # Log some debug information
+        logger.debug(f"Number of documents: {len(documents)}")
+        logger.debug(f"Number of metadatas: {len(metadatas)}")
+        logger.debug(f"Number of ids: {len(ids)}")
+        logger.debug(f"Sample documents: {documents[:5]}")
+        logger.debug(f"Sample metadatas: {metadatas[:5]}")
+        logger.debug(f"Sample ids: {ids[:5]}")
+
+        # Add documents in batches to avoid potential size limits, upsert makes loading the same data twice a no-op instead of an error
         for i in range(0, len(documents), batch_size):
             batch_end = min(i + batch_size, len(documents))
-            self.collection.add(
+            self.collection.upsert(
                 documents=documents[i:batch_end],
                 metadatas=metadatas[i:batch_end],
                 ids=ids[i:batch_end],
             )
-            print(f"Added batch {i//batch_size + 1} ({i} to {batch_end})")
+            logger.debug(f"Added batch {i//batch_size + 1} ({i} to {batch_end})")
+
+    def store_records(self, batches, batch_size: int = 100) -> int:
+        """
+        upserts (ids, documents, metadatas) batches as they arrive, e.g. the chunks of chunking.ingest_passages. Returns the number of rows
+        """
+        stored = 0
+        for ids, documents, metadatas in batches:
+            for i in range(0, len(ids), batch_size):
+                self.collection.upsert(
+                    ids=ids[i : i + batch_size],
+                    documents=documents[i : i + batch_size],
+                    metadatas=metadatas[i : i + batch_size],
+                )
+            stored += len(ids)
+        return stored
+
+    def stored_hashes(self, batch_size: int = 1000) -> tuple[dict[str, str], set[str]]:
+        """
+        id -> content_hash of every stored row, read page by page without embeddings.
+        rows stored before hashes existed get theirs computed from the stored document, their ids are returned separately.
+        """
+        from collection_io import iterate_collection
+
+        hashes, missing_hash = {}, set()
+        for batch in iterate_collection(self.collection, batch_size, ["metadatas", "documents"]):
+            for identifier, document, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+                metadata = metadata or {}
+                if "content_hash" in metadata:
+                    hashes[identifier] = metadata["content_hash"]
+                else:
+                    hashes[identifier] = content_hash(document or "", metadata)
+                    missing_hash.add(identifier)
+        return hashes, missing_hash
+
+    def sync_data(self, data, batch_size: int = 100, delete_missing: bool = True) -> dict[str, int]:
+        """
+        delta ingestion : only rows that are new or changed are embedded and upserted, rows missing from `data` are deleted
+        (unless delete_missing is False). Returns the number of added / updated / unchanged / deleted rows.
+        """
+        ids, documents, metadatas = qa_records(data)
+        stored_hashes, missing_hash = self.stored_hashes()
+        plan = plan_sync(ids, metadatas, stored_hashes)
+
+        # unchanged rows written before hashes existed only get the hash added to their metadata, update() doesn't re-embed
+        backfill = [position for position in plan["unchanged"] if ids[position] in missing_hash]
+        for i in range(0, len(backfill), batch_size):
+            positions = backfill[i : i + batch_size]
+            self.collection.update(
+                ids=[ids[position] for position in positions],
+                metadatas=[metadatas[position] for position in positions],
+            )
+
+        for i in range(0, len(plan["upsert"]), batch_size):
+            positions = plan["upsert"][i : i + batch_size]
+            self.collection.upsert(
+                ids=[ids[position] for position in positions],
+                documents=[documents[position] for position in positions],
+                metadatas=[metadatas[position] for position in positions],
+            )
+        if delete_missing:
+            for i in range(0, len(plan["delete"]), batch_size):
+                self.collection.delete(ids=plan["delete"][i : i + batch_size])
+
+        added = sum(ids[position] not in stored_hashes for position in plan["upsert"])
+        return {
+            "added": added,
+            "updated": len(plan["upsert"]) - added,
+            "unchanged": len(plan["unchanged"]),
+            "deleted": len(plan["delete"]) if delete_missing else 0,
+        }
 
     def search(self, query, n_results=5):
         """
         Search for the most relevant documents based on the query.
         Returns the top n_results matching documents.
+        a list of queries is embedded and searched in one call, with one result row per query.
         """
-        results = self.collection.query(query_texts=[query], n_results=n_results)
+        results = self.collection.query(query_texts=query if isinstance(query, list) else [query], n_results=n_results)
         return results
 
     def deleteCollection(self, collection_to_delete: str):
         return self.client.delete_collection(name=collection_to_delete)
 
 
-def get_huggingface_data() -> dict[str, Any] | None:
-    """Make a request to the huggingface dataset api to retrieve the data and send it to chromaDB vector database"""
+def get_vector_database(
+    collection_name: str = "complete_collection",
+    client_instance: Any = None,
+    embedding_function: Any = None,
+    hnsw: dict[str, Any] | None = None,
+):
+    """
+    `store_data` / `search` / `count` backend of a collection according to settings.retrieval_backend :
+        chroma    : ChromaDBVectorDatabase (hnsw only applies here)
+        quantized : memory-mapped QuantizedVectorIndex from vector_index.py, shared per collection within the process
+    """
+    if settings.retrieval_backend == "quantized":
+        from vector_index import QuantizedVectorIndex, get_quantized_index
+
+        if embedding_function is not None:
+            return QuantizedVectorIndex(collection_name, embedding_function=embedding_function)
+        return get_quantized_index(collection_name)
+
+    return ChromaDBVectorDatabase(collection_name, client_instance, embedding_function, hnsw)
+
+
+def get_huggingface_data(dataset_config: str = HUGGINGFACE_LOAD_DATASET_2ND_PARAM, streaming: bool = False) -> dict[str, Any] | None:
+    """
+    Make a request to the huggingface dataset api to retrieve the data and send it to chromaDB vector database
+
+    with streaming the splits are iterables read on demand instead of being downloaded first
+    """
 
     try:
+        from datasets import load_dataset  # type: ignore
+
         return {
             "status": "success",
             "status_code": 200,
             "message": "data loaded successfully",
             "data": load_dataset(
-                HUGGINGFACE_DATASET_API, HUGGINGFACE_LOAD_DATASET_2ND_PARAM
+                HUGGINGFACE_DATASET_API, dataset_config, streaming=streaming
             ),
         }
 
     except Exception as e:
-        print(f"Error: {str(e)}")
+        logger.error(f"Error: {str(e)}")
         return {"status": "error", "status_code": 503, "message": str(e)}
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)
     huggingface_data = get_huggingface_data()
-    chroma_instance = ChromaDBVectorDatabase("complete_collection", client)
+    chroma_instance = get_vector_database("complete_collection")
     chroma_instance.store_data(huggingface_data["data"])
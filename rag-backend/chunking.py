@@ -0,0 +1,168 @@
+# type : ignore
+"""
+passage chunking for the `text-corpus` config of rag-mini-wikipedia (or any stream of {"id", "passage"} entries).
+
+- chunks are built from whole sentences up to settings.chunk_size_tokens tokens, consecutive chunks share up to
+  settings.chunk_overlap_tokens tokens : the trailing sentences that fit, or the last tokens of the final sentence when it is longer
+  than the overlap. A sentence longer than a chunk is cut into overlapping windows
+- tokens are whitespace separated words, about 1.3 word pieces each for english text. The default size stays under the 256
+  word pieces the default embedding model (all-MiniLM-L6-v2) reads, anything beyond is truncated by the model
+- passages are chunked in a process pool, a bounded number of tasks is in flight so the dataset can be streamed,
+  while the calling thread embeds and writes the chunks of the tasks that are done (batches of `batch_size` rows)
+- every chunk is stored under "<passage_id>:<chunk_index>" with its passage id, position and content_hash in the metadata
+"""
+import hashlib
+import multiprocessing
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import batched
+from typing import Any, Iterable, Iterator
+
+from chromaDB import content_hash
+from config import settings
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+Records = tuple[list[str], list[str], list[dict[str, Any]]]
+
+
+def split_sentences(text: str) -> list[str]:
+    return [sentence for sentence in SENTENCE_END.split(text.strip()) if sentence]
+
+
+def chunk_text(text: str, chunk_size: int, chunk_overlap: int) -> list[str]:
+    if chunk_overlap >= chunk_size:
+        raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
+
+    # sentences as lists of tokens, the ones that don't fit in a chunk are cut into windows
+    units = []
+    for sentence in split_sentences(text):
+        tokens = sentence.split()
+        if len(tokens) <= chunk_size:
+            units.append(tokens)
+            continue
+        for start in range(0, len(tokens), chunk_size - chunk_overlap):
+            units.append(tokens[start : start + chunk_size])
+            if start + chunk_size >= len(tokens):
+                break
+
+    chunks, current, current_size = [], [], 0
+    for unit in units:
+        if current and current_size + len(unit) > chunk_size:
+            chunks.append(current)
+            # the next chunk starts with the trailing sentences of this one that fit in the overlap (and leave room for the unit),
+            # or with the last tokens of the final sentence when that one alone is too long
+            budget = min(chunk_overlap, chunk_size - len(unit))
+            carried, carried_size = [], 0
+            for previous in reversed(current):
+                if carried_size + len(previous) > budget:
+                    break
+                carried.insert(0, previous)
+                carried_size += len(previous)
+            if not carried and budget > 0:
+                carried, carried_size = [current[-1][-budget:]], budget
+            current, current_size = carried, carried_size
+        current.append(unit)
+        current_size += len(unit)
+    if current:
+        chunks.append(current)
+    return [" ".join(token for unit in chunk for token in unit) for chunk in chunks]
+
+
+def chunk_passages(passages: list[tuple[str, str]], chunk_size: int, chunk_overlap: int) -> Records:
+    """ids, documents and metadatas of the chunks of (passage_id, passage) pairs, runs in the worker processes"""
+    ids, documents, metadatas = [], [], []
+    for passage_id, passage in passages:
+        chunks = chunk_text(passage, chunk_size, chunk_overlap)
+        for chunk_index, chunk in enumerate(chunks):
+            metadata = {
+                "source": "text-corpus",
+                "passage_id": passage_id,
+                "chunk_index": chunk_index,
+                "chunk_count": len(chunks),
+            }
+            metadata["content_hash"] = content_hash(chunk, metadata)
+            ids.append(f"{passage_id}:{chunk_index}")
+            documents.append(chunk)
+            metadatas.append(metadata)
+    return ids, documents, metadatas
+
+
+def passage_pairs(passages: Iterable[dict[str, Any]]) -> Iterator[tuple[str, str]]:
+    for entry in passages:
+        passage = entry.get("passage") or ""
+        if not passage.strip():
+            continue
+        if entry.get("id") is not None:
+            yield str(entry["id"]), passage
+        else:
+            yield hashlib.sha256(passage.encode()).hexdigest()[:32], passage
+
+
+def iterate_chunk_batches(
+    passages: Iterable[dict[str, Any]],
+    chunk_size: int | None = None,
+    chunk_overlap: int | None = None,
+    workers: int | None = None,
+    passages_per_task: int | None = None,
+) -> Iterator[Records]:
+    """chunks of every passage, in passage order, one Records per task of passages_per_task passages"""
+    chunk_size = chunk_size or settings.chunk_size_tokens
+    chunk_overlap = chunk_overlap if chunk_overlap is not None else settings.chunk_overlap_tokens
+    workers = workers or settings.chunking_workers or os.cpu_count() or 1
+    tasks = batched(passage_pairs(passages), passages_per_task or settings.chunking_passages_per_task)
+
+    if workers == 1:
+        for task in tasks:
+            yield chunk_passages(task, chunk_size, chunk_overlap)
+        return
+
+    # NOTE : spawn rather than fork, the caller (MCP server, fastapi) runs threads that a forked child would inherit mid-state
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        pending = deque()
+        for task in tasks:
+            pending.append(executor.submit(chunk_passages, task, chunk_size, chunk_overlap))
+            # bounded read ahead, the dataset isn't consumed faster than the chunks are stored
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def rebatch(batches: Iterable[Records], batch_size: int) -> Iterator[Records]:
+    """regroups variable sized Records into batches of batch_size rows (the last one can be smaller)"""
+    ids, documents, metadatas = [], [], []
+    for batch_ids, batch_documents, batch_metadatas in batches:
+        ids += batch_ids
+        documents += batch_documents
+        metadatas += batch_metadatas
+        while len(ids) >= batch_size:
+            yield ids[:batch_size], documents[:batch_size], metadatas[:batch_size]
+            ids, documents, metadatas = ids[batch_size:], documents[batch_size:], metadatas[batch_size:]
+    if ids:
+        yield ids, documents, metadatas
+
+
+def ingest_passages(
+    vector_database,
+    passages: Iterable[dict[str, Any]],
+    batch_size: int = 100,
+    chunk_size: int | None = None,
+    chunk_overlap: int | None = None,
+    workers: int | None = None,
+) -> dict[str, Any]:
+    """chunks a stream of passages and writes the chunks to `vector_database` (either backend of get_vector_database)"""
+    counted = {"passages": 0}
+
+    def counting(entries):
+        for entry in entries:
+            counted["passages"] += 1
+            yield entry
+
+    start = time.perf_counter()
+    batches = iterate_chunk_batches(counting(passages), chunk_size, chunk_overlap, workers)
+    chunks = vector_database.store_records(rebatch(batches, batch_size))
+    return {"passages": counted["passages"], "chunks": chunks, "seconds": time.perf_counter() - start}
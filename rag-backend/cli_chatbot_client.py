@@ -2,13 +2,13 @@
 """This is mcp client for CLI communication."""
 import asyncio
 import json
-import chromaDB
-import random
+import uuid
+from conversation_memory import ConversationMemory
+from mcp_client import CONVERSATION_SCOPED_TOOLS, llm_input_schema
 from typing import Optional
 from contextlib import AsyncExitStack
 from mcp import ClientSession, StdioServerParameters  # type: ignore
 from mcp.client.stdio import stdio_client  # type: ignore
-from datetime import datetime
 from anthropic import Anthropic  # type: ignore
 from dotenv import load_dotenv  # type: ignore
 
@@ -23,12 +23,9 @@ class MCPClient:
         self.anthropic = Anthropic()
         # self.message_context = []       # NOTE : must be array of objects
 
-        self.context_history_database = chromaDB.client.get_or_create_collection(
-            name="contextual_data",
-            metadata={
-                "description": "chroma db vector database that stores relevant contextual information to keep track of user query"
-            },
-        )
+        # turns are indexed one by one in the background, see conversation_memory.py
+        self.memory = ConversationMemory()
+        self.conversation_id = uuid.uuid4().hex
 
     async def connect_to_server(self, server_script_path: str):
         """Connect to an MCP server
@@ -63,13 +60,14 @@ class MCPClient:
     async def process_query(self, query: str) -> str:
         """Process a query using Claude and available tools"""
         message_context: list[any] = [{"role": "user", "content": query}]
+        self.memory.remember(self.conversation_id, "user", query)
 
         response = await self.session.list_tools()
         available_tools = [
             {
                 "name": tool.name,
                 "description": tool.description,
-                "input_schema": tool.inputSchema,
+                "input_schema": llm_input_schema(tool),
             }
             for tool in response.tools
         ]
@@ -84,16 +82,21 @@ class MCPClient:
         # Process response and handle tool calls
         tool_results = []
         final_text, assistant_message_content = [], []
+        # only the model's own text is remembered, the tool call lines are just shown
+        answer_text = []
 
         for content in response.content:
             if content.type == "text":
                 final_text.append(content.text)
+                answer_text.append(content.text)
                 assistant_message_content.append(content)
             elif content.type == "tool_use":
                 tool_name = content.name
                 tool_args = content.input
 
-                # Execute tool call (built-in mcp method)
+                # Execute tool call (built-in mcp method), history lookups only see this conversation
+                if tool_name in CONVERSATION_SCOPED_TOOLS:
+                    tool_args = {**tool_args, "conversation_id": self.conversation_id}
                 result = await self.session.call_tool(tool_name, tool_args)
                 tool_results.append({"call": tool_name, "result": result})
                 final_text.append(f"[Calling tool {tool_name} with args {tool_args}]")
@@ -124,26 +127,11 @@ class MCPClient:
                 )
 
                 final_text.append(response.content[0].text)
+                answer_text.append(response.content[0].text)
 
         self.message_context = message_context
-        print(f"length of message context : {len(str(message_context))}")
-        print("started adding contextual history to chroma db")
-        # NOTE : might fail
-        #
-        metadatas = []
-        metadatas.append(
-            {
-                "identificaton": "user query history",
-                "user": "ayan das",
-                "created_at": str(datetime.now()),
-            }
-        )
-        self.context_history_database.add(
-            documents=str(message_context),
-            metadatas=metadatas,
-            ids=str(random.randint(0, 1000000)),
-        )
-        print("finished pushing data to chroma db")
+        # only the answer is new, earlier turns are already indexed
+        self.memory.remember(self.conversation_id, "assistant", "\n".join(answer_text))
         print(f"content within message array : {message_context}")
         return "\n".join(final_text)
 
@@ -157,9 +145,6 @@ class MCPClient:
                 query = input("\nQuery: ").strip()
 
                 if query.lower() == "quit":
-                    self.context_history_database.delete_collection(
-                        name="contextual_data"
-                    )
                     break
 
                 response = await self.process_query(query)
@@ -170,6 +155,7 @@ class MCPClient:
 
     async def cleanup(self):
         """Clean up resources"""
+        await self.memory.close()
         await self.exit_stack.aclose()
 
     def toJson(self, data):
@@ -0,0 +1,233 @@
+# type : ignore
+"""
+paging through, exporting, importing and cloning chroma collections without holding them in memory.
+
+- scan       : cursor paginated reads with an `include` projection (leave out embeddings unless they are needed)
+- export     : streams a collection to a parquet file, page by page (documents, metadata as json, embeddings as fixed size float32 lists)
+- import     : streams a parquet export back into a collection, the stored embeddings are reused so nothing is re-embedded
+- clone      : page by page copy between two collections, again without re-embedding
+
+the cursor is an opaque token wrapping the collection name and an offset. Pages are read with chroma's limit / offset,
+so rows added or deleted while a scan is in progress can shift the following pages.
+
+usage (from rag-backend/):
+    python collection_io.py export complete_collection backups/complete_collection.parquet
+    python collection_io.py import backups/complete_collection.parquet restored_collection
+    python collection_io.py clone complete_collection complete_collection_copy
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any
+
+from chromaDB import get_client, get_embedding_function
+from config import settings
+
+SCAN_INCLUDE_VALUES = ("documents", "metadatas", "embeddings")
+DEFAULT_SCAN_INCLUDE = ["documents", "metadatas"]
+EXPORT_FORMAT_VERSION = 1
+
+
+def encode_cursor(collection_name: str, offset: int) -> str:
+    payload = json.dumps({"collection": collection_name, "offset": offset}).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(collection_name: str, cursor: str | None) -> int:
+    if not cursor:
+        return 0
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        offset = int(payload["offset"])
+    except Exception as e:
+        raise ValueError(f"invalid cursor : {cursor}") from e
+    if payload.get("collection") != collection_name or offset < 0:
+        raise ValueError(f"cursor {cursor} doesn't belong to collection {collection_name}")
+    return offset
+
+
+def scan_arguments(collection_name: str, cursor: str | None, page_size: int, include: list[str] | None) -> dict[str, Any]:
+    """keyword arguments of `collection.get` for one page"""
+    include = list(include) if include is not None else DEFAULT_SCAN_INCLUDE
+    unknown = set(include) - set(SCAN_INCLUDE_VALUES)
+    if unknown:
+        raise ValueError(f"unknown include values {sorted(unknown)}, expected a subset of {list(SCAN_INCLUDE_VALUES)}")
+    return {
+        "offset": decode_cursor(collection_name, cursor),
+        "limit": max(1, min(page_size, settings.collection_scan_max_page_size)),
+        "include": include,
+    }
+
+
+def scan_page(collection_name: str, get_result: dict[str, Any], offset: int, limit: int) -> dict[str, Any]:
+    """json friendly page, `next_cursor` is None once the collection is exhausted"""
+    page = {"ids": get_result["ids"]}
+    for field in SCAN_INCLUDE_VALUES:
+        values = get_result.get(field)
+        if values is not None:
+            page[field] = [value.tolist() for value in values] if field == "embeddings" else values
+    page["next_cursor"] = encode_cursor(collection_name, offset + limit) if len(get_result["ids"]) == limit else None
+    return page
+
+
+def scan_collection(collection, cursor: str | None = None, page_size: int = 100, include: list[str] | None = None) -> dict[str, Any]:
+    """one page of a (sync) collection, pass the returned `next_cursor` to get the following one"""
+    arguments = scan_arguments(collection.name, cursor, page_size, include)
+    return scan_page(collection.name, collection.get(**arguments), arguments["offset"], arguments["limit"])
+
+
+def iterate_collection(collection, batch_size: int, include: list[str]):
+    """yields `collection.get` results of at most batch_size rows until the collection is exhausted"""
+    offset = 0
+    while True:
+        batch = collection.get(offset=offset, limit=batch_size, include=include)
+        if not batch["ids"]:
+            return
+        yield batch
+        if len(batch["ids"]) < batch_size:
+            return
+        offset += batch_size
+
+
+def collection_settings(collection) -> dict[str, Any]:
+    """what is needed to recreate a collection the same way (hnsw parameters, metadata, embedding function)"""
+    return {
+        "name": collection.name,
+        "metadata": collection.metadata,
+        "hnsw": ((collection.configuration_json or {}).get("hnsw") or {}),
+        "embedding_function": get_embedding_function().name(),
+    }
+
+
+def create_target_collection(client, collection_name: str, source_settings: dict[str, Any]):
+    from chromaDB import get_collection_configuration
+
+    hnsw = {
+        key: value
+        for key, value in source_settings.get("hnsw", {}).items()
+        if key in ("space", "max_neighbors", "ef_construction", "ef_search")
+    }
+    return client.get_or_create_collection(
+        name=collection_name,
+        configuration=get_collection_configuration(hnsw),
+        metadata={
+            **(source_settings.get("metadata") or {}),
+            "created": str(datetime.now()),
+            "copied_from": source_settings["name"],
+        },
+        embedding_function=get_embedding_function(),
+    )
+
+
+def export_collection(collection_name: str, path: str, batch_size: int = 1000, include_embeddings: bool = True, client_instance: Any = None) -> int:
+    """
+    writes the collection to a parquet file one row group per batch, memory use is bounded by batch_size. Returns the number of rows.
+    an empty collection gives a file with the schema and the collection settings but no row group (no embedding column either)
+    """
+    import numpy as np
+    import pyarrow as pa  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+
+    client = client_instance if client_instance is not None else get_client()
+    collection = client.get_collection(name=collection_name, embedding_function=get_embedding_function())
+    include = ["documents", "metadatas", "embeddings"] if include_embeddings else ["documents", "metadatas"]
+    schema_metadata = {"collection": json.dumps({**collection_settings(collection), "format_version": EXPORT_FORMAT_VERSION})}
+
+    writer = None
+    exported = 0
+    try:
+        for batch in iterate_collection(collection, batch_size, include):
+            columns = {
+                "id": pa.array(batch["ids"], pa.string()),
+                "document": pa.array(batch["documents"], pa.string()),
+                "metadata": pa.array([json.dumps(metadata) if metadata is not None else None for metadata in batch["metadatas"]], pa.string()),
+            }
+            if include_embeddings:
+                embeddings = np.asarray(batch["embeddings"], dtype=np.float32)
+                columns["embedding"] = pa.FixedSizeListArray.from_arrays(pa.array(embeddings.ravel()), embeddings.shape[1])
+            table = pa.table(columns)
+
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema.with_metadata(schema_metadata))
+            writer.write_table(table.replace_schema_metadata(writer.schema.metadata))
+            exported += len(batch["ids"])
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        empty_schema = pa.schema({"id": pa.string(), "document": pa.string(), "metadata": pa.string()}, metadata=schema_metadata)
+        pq.ParquetWriter(path, empty_schema).close()
+    return exported
+
+
+def import_collection(path: str, collection_name: str | None = None, batch_size: int = 1000, client_instance: Any = None) -> int:
+    """
+    upserts a parquet export into `collection_name` (default : the exported collection's name) one record batch at a time.
+    the stored embeddings are written as is, documents are only embedded again when the export has no embedding column.
+    """
+    import pyarrow.parquet as pq  # type: ignore
+
+    parquet_file = pq.ParquetFile(path)
+    source = json.loads((parquet_file.schema_arrow.metadata or {}).get(b"collection", b"{}"))
+    if source.get("embedding_function") and source["embedding_function"] != get_embedding_function().name():
+        raise ValueError(
+            f"{path} was embedded with {source['embedding_function']}, the current embedding function is "
+            f"{get_embedding_function().name()} (set RAG_EMBEDDING_FUNCTION to match)"
+        )
+
+    client = client_instance if client_instance is not None else get_client()
+    collection = create_target_collection(client, collection_name or source["name"], source)
+    has_embeddings = "embedding" in parquet_file.schema_arrow.names
+
+    imported = 0
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        rows = {
+            "ids": batch.column("id").to_pylist(),
+            "documents": batch.column("document").to_pylist(),
+            "metadatas": [json.loads(metadata) if metadata else None for metadata in batch.column("metadata").to_pylist()],
+        }
+        if has_embeddings:
+            embedding_column = batch.column("embedding")
+            rows["embeddings"] = embedding_column.flatten().to_numpy().reshape(len(batch), embedding_column.type.list_size)
+        collection.upsert(**rows)
+        imported += len(batch)
+    return imported
+
+
+def clone_collection(source_name: str, target_name: str, batch_size: int = 1000, client_instance: Any = None) -> int:
+    """copies every row (with its embedding) to another collection created with the same hnsw parameters"""
+    client = client_instance if client_instance is not None else get_client()
+    source = client.get_collection(name=source_name, embedding_function=get_embedding_function())
+    target = create_target_collection(client, target_name, collection_settings(source))
+
+    copied = 0
+    for batch in iterate_collection(source, batch_size, ["documents", "metadatas", "embeddings"]):
+        target.upsert(ids=batch["ids"], documents=batch["documents"], metadatas=batch["metadatas"], embeddings=batch["embeddings"])
+        copied += len(batch["ids"])
+    return copied
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("export", "import", "clone"))
+    parser.add_argument("source", help="collection name (export, clone) or parquet file (import)")
+    parser.add_argument("target", nargs="?", help="parquet file (export) or collection name (import, clone)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--no-embeddings", action="store_true", help="export without embeddings (they are recomputed on import)")
+    args = parser.parse_args()
+    if args.command == "clone" and not args.target:
+        parser.error("clone needs a target collection name")
+
+    start = time.perf_counter()
+    match args.command:
+        case "export":
+            count = export_collection(args.source, args.target or f"{args.source}.parquet", args.batch_size, not args.no_embeddings)
+        case "import":
+            count = import_collection(args.source, args.target, args.batch_size)
+        case "clone":
+            count = clone_collection(args.source, args.target, args.batch_size)
+    print(f"{args.command} : {count} rows in {time.perf_counter() - start:.2f}s")
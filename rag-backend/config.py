@@ -0,0 +1,125 @@
+# type : ignore
+"""application settings, every field can be overridden with an environment variable of the same name (case insensitive) or through .env"""
+import os
+from typing import Literal
+from pydantic_settings import BaseSettings, SettingsConfigDict  # type: ignore
+
+BASE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file=(
+            os.path.join(os.path.dirname(BASE_DIRECTORY), ".env"),
+            os.path.join(BASE_DIRECTORY, ".env"),
+        ),
+        extra="ignore",
+    )
+
+    server_script_path: str = (
+        "/Users/ayandas/Desktop/zed-proj/shield-takehome-proj/rag-chatbot-v1/rag-backend/server.py"
+    )
+
+    # where MCPClient.log_conversation writes the json transcripts
+    conversation_log_directory: str = os.path.join(BASE_DIRECTORY, "conversations")
+
+    # "stdio" spawns server.py as a subprocess, "memory" runs its FastMCP instance inside the API process (no subprocess, no pipe encoding)
+    mcp_transport: Literal["stdio", "memory"] = "stdio"
+    # log level of the MCP server process (server.py)
+    mcp_server_log_level: Literal["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"] = "INFO"
+
+    # chroma backend : "http" talks to a chroma server, "persistent" embeds chroma in-process at chroma_persist_path, "ephemeral" keeps everything in memory
+    chroma_mode: Literal["http", "persistent", "ephemeral"] = "http"
+    chroma_host: str = "localhost"
+    chroma_port: int = 9000
+    # http mode : https, certificate verification (a ca bundle path, or false) and extra headers such as auth tokens, sent by the sync and async clients
+    chroma_ssl: bool = False
+    chroma_ssl_verify: bool | str | None = None
+    chroma_server_headers: dict[str, str] = {}
+    chroma_persist_path: str = os.path.join(BASE_DIRECTORY, "chromaDbData")
+    # async client used by the MCP tools : connection pool of the http mode, and max concurrent worker threads in the embedded modes
+    chroma_async_max_connections: int = 64
+    chroma_async_max_keepalive_connections: int = 32
+    chroma_async_keepalive_expiry_seconds: float = 30.0
+    chroma_async_timeout_seconds: float | None = 60.0
+    # hnsw index parameters of newly created collections, unset values keep chroma's defaults (l2, 16, 100, 100).
+    # only ef_search can be changed on an existing collection, see benchmarks/hnsw_tuning.py to pick them
+    chroma_hnsw_space: Literal["l2", "cosine", "ip"] | None = None
+    chroma_hnsw_max_neighbors: int | None = None
+    chroma_hnsw_ef_construction: int | None = None
+    chroma_hnsw_ef_search: int | None = None
+    # backend behind get_vector_database() : "chroma" collections, or "quantized" in-process memory-mapped indexes (vector_index.py)
+    retrieval_backend: Literal["chroma", "quantized"] = "chroma"
+    vector_index_path: str = os.path.join(BASE_DIRECTORY, "vectorIndexData")
+    # the scanned int8 vectors take a quarter of float32 (plus 8 bytes per row), float16 half and are closer to exact.
+    # the float32 copy kept for rescoring comes on top of that on disk (see vector_index_rescore)
+    vector_index_quantization: Literal["int8", "float16"] = "int8"
+    vector_index_space: Literal["l2", "cosine", "ip"] = "l2"
+    # corpora at least this large are clustered into ~sqrt(n) lists (IVF) and only the nprobe closest lists are scanned, smaller ones are scanned in full
+    vector_index_ivf_min_size: int = 50000
+    vector_index_nprobe: int = 32
+    # re-rank the best n_results * rescore_candidates quantized hits with the exact float32 vectors, kept in a separate memory-mapped file
+    # that is only written when this is on. Off, an int8 index is a quarter of float32 on disk. On, recall gets closer to exact for more
+    # disk : int8 + float32 is about 1.25x the float32 size, float16 + float32 about 1.5x. Queries only read the candidate rows
+    vector_index_rescore: bool = False
+    vector_index_rescore_candidates: int = 4
+    # "default" uses chroma's all-MiniLM-L6-v2 model, "hashing" the deterministic local embedder in embeddings.py
+    rag_embedding_function: Literal["default", "hashing"] = "default"
+
+    # conversation memory (conversation_memory.py) : every turn is stored once under "<conversation_id>:<turn_index>"
+    conversation_memory_collection: str = "contextual_data"
+    # raw turns kept per conversation, older ones are folded into the conversation's extractive summary (once there are twice as many)
+    conversation_memory_recent_turns: int = 20
+    conversation_memory_summary_max_characters: int = 4000
+    # upper bound on what a history lookup returns, whatever the caller asks for
+    conversation_memory_max_results: int = 10
+    conversation_memory_max_document_characters: int = 1000
+    # turns written to chroma per background upsert
+    conversation_memory_write_batch_size: int = 32
+
+    # upper bound on the page size of collection scans (scan_collection tool, collection_io.py)
+    collection_scan_max_page_size: int = 500
+
+    # admission control of /query (admission.py) : concurrent queries, queued ones beyond that and how long they may wait for a slot.
+    # a full queue answers 429, a timed out wait 503, both with Retry-After
+    admission_max_in_flight: int = 8
+    admission_max_queue: int = 32
+    admission_queue_timeout_seconds: float = 10.0
+
+    # warmup of the MCP server and the api (server.py, main.py) : embedding model, collections and a dummy query each, before /ready answers 200.
+    # empty collections are ingested like the first context_retriever call would
+    warmup_enabled: bool = True
+    warmup_collections: list[str] = ["complete_collection"]
+    warmup_ingest_empty_collections: bool = True
+    # /ready stays unavailable at most this long waiting for the MCP server warmup
+    warmup_timeout_seconds: float = 300.0
+
+    # passage chunking of the text-corpus config (chunking.py), sizes in whitespace separated tokens
+    chunk_size_tokens: int = 160
+    chunk_overlap_tokens: int = 32
+    # chunking processes (0 : one per cpu) and passages handed to a process at a time
+    chunking_workers: int = 0
+    chunking_passages_per_task: int = 64
+
+    # model routing of MCPClient (model_router.py) : "rule" turns call an obvious tool directly, "fast" turns (short questions without
+    # analysis keywords) use the fast model, the rest the heavy one. Disabled, every turn is heavy
+    model_routing_enabled: bool = True
+    router_heavy_model: str = "claude-3-5-sonnet-20241022"
+    router_heavy_max_tokens: int = 3500
+    router_fast_model: str = "claude-3-5-haiku-20241022"
+    router_fast_max_tokens: int = 1024
+    router_fast_max_words: int = 12
+    # model of main.py's formatting agent on fast turns, None keeps the agents sdk default
+    router_fast_format_model: str | None = "gpt-4o-mini"
+
+    # llm backend : "live" calls the providers, "record" calls them and saves every interaction to the cassette, "replay" answers from the cassette only
+    llm_backend: Literal["live", "record", "replay"] = "live"
+    llm_cassette_path: str = os.path.join(BASE_DIRECTORY, "cassettes", "llm_cassette.jsonl")
+    # synthetic latency added to every replayed response
+    llm_replay_latency_ms: float = 0.0
+    llm_replay_latency_jitter_ms: float = 0.0
+    # what to do when a request isn't in the cassette : "error" raises, "echo" answers with the last user message
+    llm_replay_on_miss: Literal["error", "echo"] = "error"
+
+
+settings = Settings()
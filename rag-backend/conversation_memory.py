@@ -0,0 +1,239 @@
+# type : ignore
+"""
+per-turn conversation memory stored in the chroma collection `contextual_data`.
+
+- every turn is written once, under the stable id "<conversation_id>:<turn_index>", by a background task (callers never wait on the embedding)
+- once a conversation has twice settings.conversation_memory_recent_turns raw turns, all but the most recent ones are folded into a single
+  extractive summary document ("<conversation_id>:summary") and deleted, so the rows per conversation (and the lookup cost) stay bounded
+- lookups are filtered by conversation id and capped in both number of results and characters per document
+"""
+import asyncio
+import logging
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from chromaDB import get_client, get_embedding_function
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+SUMMARY_HEADER = "Summary of earlier turns :"
+SUMMARY_SENTENCE_CHARACTERS = 200
+
+
+@dataclass
+class Turn:
+    conversation_id: str
+    role: str
+    content: str
+    created_at: str
+
+
+def turn_text(content: Any) -> str:
+    """
+    text of a message in the anthropic format, tool calls and tool results are skipped (they are retrieval output, not conversation)
+    """
+    if isinstance(content, str):
+        return content.strip()
+    if not isinstance(content, list):
+        return ""
+
+    parts = []
+    for block in content:
+        block_type = block.get("type") if isinstance(block, dict) else getattr(block, "type", None)
+        if block_type != "text":
+            continue
+        parts.append(block["text"] if isinstance(block, dict) else block.text)
+    return "\n".join(part.strip() for part in parts if part and part.strip())
+
+
+def summary_line(turn_document: str, role: str) -> str:
+    first_sentence = SENTENCE_END.split(turn_document.strip(), maxsplit=1)[0]
+    return f"{role}: {first_sentence[:SUMMARY_SENTENCE_CHARACTERS]}"
+
+
+def history_filter(conversation_id: str | None) -> dict[str, Any] | None:
+    return {"conversation_id": conversation_id} if conversation_id else None
+
+
+def format_history(query_results: dict[str, Any], max_document_characters: int | None = None) -> list[dict[str, Any]]:
+    """
+    flattens a chroma query result (single query) into a short list of turns, ordered as they happened, the summary first
+    """
+    max_document_characters = max_document_characters or settings.conversation_memory_max_document_characters
+    history = []
+    for document, metadata, distance in zip(
+        query_results["documents"][0], query_results["metadatas"][0], query_results["distances"][0]
+    ):
+        metadata = metadata or {}
+        history.append(
+            {
+                "role": metadata.get("role", "summary"),
+                "turn_index": metadata.get("turn_index", -1),
+                "content": document[:max_document_characters],
+                "distance": distance,
+            }
+        )
+    return sorted(history, key=lambda turn: turn["turn_index"])
+
+
+class ConversationMemory:
+    def __init__(self, collection_name: str | None = None, client_instance: Any = None):
+        self.collection_name = collection_name or settings.conversation_memory_collection
+        self._client = client_instance
+        self._collection = None
+        self._queue: asyncio.Queue[Turn] | None = None
+        self._writer: asyncio.Task | None = None
+        # next turn index per conversation, only touched by the writer thread
+        self._next_turn_index: dict[str, int] = {}
+        self._stored_turns: dict[str, int] = {}
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            client = self._client if self._client is not None else get_client()
+            self._collection = client.get_or_create_collection(
+                name=self.collection_name,
+                metadata={
+                    "description": "chroma db vector database that stores relevant contexual information to keep track of user and llm query.",
+                    "created": str(datetime.now()),
+                },
+                embedding_function=get_embedding_function(),
+            )
+        return self._collection
+
+    def remember(self, conversation_id: str, role: str, content: Any):
+        """queues a turn for indexing and returns immediately, must be called from the event loop"""
+        text = turn_text(content)
+        if not text:
+            return
+
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._drain())
+        self._queue.put_nowait(Turn(conversation_id, role, text, str(datetime.now())))
+
+    async def flush(self):
+        """waits until every queued turn is written"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self):
+        await self.flush()
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+
+    async def recall(self, conversation_id: str | None, query: str, n_results: int = 5) -> list[dict[str, Any]]:
+        """most relevant turns (and summary) of a conversation for `query`"""
+        return await asyncio.to_thread(self.search, conversation_id, query, n_results)
+
+    def search(self, conversation_id: str | None, query: str, n_results: int = 5) -> list[dict[str, Any]]:
+        query_results = self.collection.query(
+            query_texts=[query],
+            n_results=max(1, min(n_results, settings.conversation_memory_max_results)),
+            where=history_filter(conversation_id),
+        )
+        return format_history(query_results)
+
+    async def _drain(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < settings.conversation_memory_write_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception as e:
+                logger.error(f"Failed to index {len(batch)} conversation turns : {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _load_conversation_state(self, conversation_id: str):
+        # conversations started by an earlier process continue after their last stored turn
+        stored = self.collection.get(where=history_filter(conversation_id), include=["metadatas"])
+        last_turn_index = -1
+        stored_turns = 0
+        for metadata in stored["metadatas"]:
+            if metadata.get("kind") == "summary":
+                last_turn_index = max(last_turn_index, metadata["last_turn_index"])
+            else:
+                last_turn_index = max(last_turn_index, metadata["turn_index"])
+                stored_turns += 1
+        self._next_turn_index[conversation_id] = last_turn_index + 1
+        self._stored_turns[conversation_id] = stored_turns
+
+    def _write(self, batch: list[Turn]):
+        ids, documents, metadatas = [], [], []
+        for turn in batch:
+            if turn.conversation_id not in self._next_turn_index:
+                self._load_conversation_state(turn.conversation_id)
+            turn_index = self._next_turn_index[turn.conversation_id]
+            self._next_turn_index[turn.conversation_id] = turn_index + 1
+            self._stored_turns[turn.conversation_id] += 1
+
+            ids.append(f"{turn.conversation_id}:{turn_index}")
+            documents.append(turn.content)
+            metadatas.append(
+                {
+                    "conversation_id": turn.conversation_id,
+                    "kind": "turn",
+                    "role": turn.role,
+                    "turn_index": turn_index,
+                    "created_at": turn.created_at,
+                }
+            )
+
+        # upsert keeps a retried batch from duplicating turns
+        self.collection.upsert(ids=ids, documents=documents, metadatas=metadatas)
+
+        for conversation_id in {turn.conversation_id for turn in batch}:
+            # folding happens once per `recent_turns` new turns rather than on every write, re-embedding the summary isn't free
+            if self._stored_turns[conversation_id] >= 2 * settings.conversation_memory_recent_turns:
+                self._summarize(conversation_id)
+
+    def _summarize(self, conversation_id: str):
+        """folds the oldest raw turns of a conversation into its summary document"""
+        stored = self.collection.get(
+            where={"$and": [{"conversation_id": conversation_id}, {"kind": "turn"}]},
+            include=["documents", "metadatas"],
+        )
+        turns = sorted(
+            zip(stored["ids"], stored["documents"], stored["metadatas"]), key=lambda turn: turn[2]["turn_index"]
+        )
+        folded = turns[: len(turns) - settings.conversation_memory_recent_turns]
+        if not folded:
+            return
+
+        summary_id = f"{conversation_id}:summary"
+        previous = self.collection.get(ids=[summary_id], include=["documents"])["documents"]
+        lines = previous[0].splitlines()[1:] if previous else []
+        lines += [summary_line(document, metadata["role"]) for _, document, metadata in folded]
+
+        # keep the most recent lines that fit
+        kept, length = [], len(SUMMARY_HEADER)
+        for line in reversed(lines):
+            length += len(line) + 1
+            if length > settings.conversation_memory_summary_max_characters:
+                break
+            kept.append(line)
+        summary = "\n".join([SUMMARY_HEADER, *reversed(kept)])
+
+        self.collection.upsert(
+            ids=[summary_id],
+            documents=[summary],
+            metadatas=[
+                {
+                    "conversation_id": conversation_id,
+                    "kind": "summary",
+                    "last_turn_index": folded[-1][2]["turn_index"],
+                    "created_at": str(datetime.now()),
+                }
+            ],
+        )
+        self.collection.delete(ids=[turn_id for turn_id, _, _ in folded])
+        self._stored_turns[conversation_id] = len(turns) - len(folded)
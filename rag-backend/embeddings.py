@@ -0,0 +1,48 @@
+# type : ignore
+"""embedding functions that can be used by chroma collections in place of chroma's default (all-MiniLM-L6-v2)"""
+import hashlib
+import re
+from typing import Any
+
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings  # type: ignore
+from chromadb.utils.embedding_functions import register_embedding_function  # type: ignore
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+@register_embedding_function
+class HashingEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    deterministic, network free embedder based on the hashing trick.
+
+    every lowercase word token is hashed into one of `dimension` buckets with a +/-1 sign, the resulting
+    bag of words vector is l2 normalized. It has no semantic understanding beyond shared words, but it is
+    stable across processes and machines which makes it suitable for benchmarks and offline evaluation.
+    """
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def __call__(self, input: Documents) -> Embeddings:
+        vectors = np.zeros((len(input), self.dimension), dtype=np.float32)
+        for row, document in enumerate(input):
+            for token in TOKEN_PATTERN.findall(document.lower()):
+                digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dimension
+                vectors[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return list(vectors / norms)
+
+    @staticmethod
+    def name() -> str:
+        return "hashing"
+
+    def get_config(self) -> dict[str, Any]:
+        return {"dimension": self.dimension}
+
+    @staticmethod
+    def build_from_config(config: dict[str, Any]) -> "HashingEmbeddingFunction":
+        return HashingEmbeddingFunction(dimension=config.get("dimension", 384))
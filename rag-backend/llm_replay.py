@@ -0,0 +1,317 @@
+# type : ignore
+"""
+record / replay (cassette) backend for the llm providers.
+
+- `create_anthropic_client()` returns the client used by `MCPClient.call_llm`
+- `get_agents_run_config()` returns the `RunConfig` used for the openai agents `Runner.run` step
+
+both are driven by `settings.llm_backend`:
+    live   : call the providers as usual
+    record : call the providers and append every request/response pair to the cassette
+    replay : never touch the network, answer from the cassette with configurable synthetic latency
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Any
+
+from agents import Model, ModelProvider, ModelResponse, OpenAIProvider, RunConfig, Usage  # type: ignore
+from anthropic import AsyncAnthropic  # type: ignore
+from anthropic.types import Message  # type: ignore
+from openai.types.responses import Response, ResponseCompletedEvent, ResponseOutputItem, ResponseUsage  # type: ignore
+from pydantic import TypeAdapter  # type: ignore
+
+from config import settings
+
+
+def _to_jsonable(value: Any) -> Any:
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    return str(value)
+
+
+class LLMCassette:
+    """
+    json lines file of recorded llm interactions, keyed by a hash of the provider and the request.
+
+    identical requests recorded several times are replayed round robin.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries: dict[str, list[Any]] = {}
+        self.replay_position: dict[str, int] = {}
+
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries.setdefault(entry["key"], []).append(entry["response"])
+
+    @staticmethod
+    def key(provider: str, request: dict[str, Any]) -> str:
+        canonical_request = json.dumps(request, sort_keys=True, default=_to_jsonable)
+        return hashlib.sha256(f"{provider}:{canonical_request}".encode()).hexdigest()
+
+    def lookup(self, key: str) -> Any | None:
+        with self.lock:
+            responses = self.entries.get(key)
+            if not responses:
+                return None
+            position = self.replay_position.get(key, 0)
+            self.replay_position[key] = position + 1
+            return responses[position % len(responses)]
+
+    def record(self, key: str, provider: str, request: dict[str, Any], response: Any):
+        entry = {"key": key, "provider": provider, "request": request, "response": response}
+        line = json.dumps(entry, default=_to_jsonable)
+        with self.lock:
+            self.entries.setdefault(key, []).append(json.loads(line)["response"])
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+
+def synthetic_latency_seconds() -> float:
+    jitter = settings.llm_replay_latency_jitter_ms
+    latency = settings.llm_replay_latency_ms + (random.uniform(-jitter, jitter) if jitter else 0)
+    return max(latency, 0) / 1000
+
+
+OUTPUT_ITEM_ADAPTER = TypeAdapter(ResponseOutputItem)
+
+
+class ReplayMiss(LookupError):
+    """raised in replay mode when a request was never recorded and llm_replay_on_miss is 'error'"""
+
+
+def _last_user_text(messages: list[dict[str, Any]]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user" and isinstance(message.get("content"), str):
+            return message["content"]
+    return ""
+
+
+class _ReplayAnthropicMessages:
+    def __init__(self, cassette: LLMCassette, mode: str, live_client: Any = None):
+        self.cassette = cassette
+        self.mode = mode
+        self.live_client = live_client
+
+    async def create(self, **request: Any):
+        key = LLMCassette.key("anthropic", request)
+
+        if self.mode == "record":
+            response = await self.live_client.messages.create(**request)
+            self.cassette.record(key, "anthropic", request, response.to_dict())
+            return response
+
+        recorded = self.cassette.lookup(key)
+        if recorded is None:
+            if settings.llm_replay_on_miss == "error":
+                raise ReplayMiss(f"no recorded anthropic response for request {key[:12]}")
+            recorded = {
+                "id": f"msg_replay_{key[:12]}",
+                "type": "message",
+                "role": "assistant",
+                "model": request.get("model", "replay"),
+                "content": [
+                    {"type": "text", "text": f"[replay] {_last_user_text(request.get('messages', []))}"}
+                ],
+                "stop_reason": "end_turn",
+                "stop_sequence": None,
+                "usage": {"input_tokens": 0, "output_tokens": 0},
+            }
+
+        # the other requests keep running during the replayed latency, as they do while a live call is awaited
+        await asyncio.sleep(synthetic_latency_seconds())
+        return Message.model_validate(recorded)
+
+
+class ReplayAnthropic:
+    """stands in for `anthropic.AsyncAnthropic`, only `messages.create` is supported"""
+
+    def __init__(self, cassette: LLMCassette, mode: str, live_client: Any = None):
+        self.messages = _ReplayAnthropicMessages(cassette, mode, live_client)
+
+
+class ReplayAgentsModel(Model):
+    """openai agents `Model` that records or replays `get_response` calls"""
+
+    def __init__(self, model_name: str | None, cassette: LLMCassette, mode: str, live_model: Any = None):
+        self.model_name = model_name
+        self.cassette = cassette
+        self.mode = mode
+        self.live_model = live_model
+
+    async def get_response(
+        self,
+        system_instructions,
+        input,
+        model_settings,
+        tools,
+        output_schema,
+        handoffs,
+        tracing,
+        *,
+        previous_response_id=None,
+    ):
+        request = {
+            "model": self.model_name,
+            "system_instructions": system_instructions,
+            "input": input,
+        }
+        key = LLMCassette.key("openai-agents", request)
+
+        if self.mode == "record":
+            response = await self.live_model.get_response(
+                system_instructions,
+                input,
+                model_settings,
+                tools,
+                output_schema,
+                handoffs,
+                tracing,
+                previous_response_id=previous_response_id,
+            )
+            self.cassette.record(
+                key,
+                "openai-agents",
+                request,
+                {
+                    "output": [item.model_dump() for item in response.output],
+                    "usage": {
+                        "requests": response.usage.requests,
+                        "input_tokens": response.usage.input_tokens,
+                        "output_tokens": response.usage.output_tokens,
+                        "total_tokens": response.usage.total_tokens,
+                    },
+                },
+            )
+            return response
+
+        recorded = self.cassette.lookup(key)
+        if recorded is None:
+            if settings.llm_replay_on_miss == "error":
+                raise ReplayMiss(f"no recorded agents response for request {key[:12]}")
+            recorded = {
+                "output": [
+                    {
+                        "id": f"msg_replay_{key[:12]}",
+                        "type": "message",
+                        "role": "assistant",
+                        "status": "completed",
+                        "content": [
+                            {"type": "output_text", "text": f"[replay] {str(input)[:2000]}", "annotations": []}
+                        ],
+                    }
+                ],
+                "usage": {"requests": 1},
+            }
+
+        await asyncio.sleep(synthetic_latency_seconds())
+        return ModelResponse(
+            output=[OUTPUT_ITEM_ADAPTER.validate_python(item) for item in recorded["output"]],
+            usage=Usage(**recorded.get("usage", {})),
+            response_id=None,
+        )
+
+    async def stream_response(
+        self,
+        system_instructions,
+        input,
+        model_settings,
+        tools,
+        output_schema,
+        handoffs,
+        tracing,
+        *,
+        previous_response_id=None,
+    ):
+        """
+        the recorded response as a single `response.completed` event, which is all `Runner.run_streamed` needs to finish a turn.
+        cassettes hold whole responses, so record mode records a non streamed call
+        """
+        response = await self.get_response(
+            system_instructions,
+            input,
+            model_settings,
+            tools,
+            output_schema,
+            handoffs,
+            tracing,
+            previous_response_id=previous_response_id,
+        )
+        yield ResponseCompletedEvent(
+            type="response.completed",
+            sequence_number=0,
+            response=Response(
+                id=response.response_id or "resp_replay",
+                created_at=time.time(),
+                model=self.model_name or "replay",
+                object="response",
+                output=response.output,
+                parallel_tool_calls=False,
+                tool_choice="auto",
+                tools=[],
+                # NOTE : the token details differ between openai versions and aren't read by the runner, only the counts are set
+                usage=ResponseUsage.model_construct(
+                    input_tokens=response.usage.input_tokens,
+                    output_tokens=response.usage.output_tokens,
+                    total_tokens=response.usage.total_tokens,
+                ),
+            ),
+        )
+
+
+class ReplayAgentsModelProvider(ModelProvider):
+    def __init__(self, cassette: LLMCassette, mode: str):
+        self.cassette = cassette
+        self.mode = mode
+        self.live_provider = None
+        if mode == "record":
+            self.live_provider = OpenAIProvider()
+
+    def get_model(self, model_name: str | None):
+        live_model = self.live_provider.get_model(model_name) if self.live_provider else None
+        return ReplayAgentsModel(model_name, self.cassette, self.mode, live_model)
+
+
+_cassette: LLMCassette | None = None
+
+
+def get_cassette() -> LLMCassette:
+    global _cassette
+    if _cassette is None:
+        _cassette = LLMCassette(settings.llm_cassette_path)
+    return _cassette
+
+
+def create_anthropic_client():
+    match settings.llm_backend:
+        case "live":
+            return AsyncAnthropic()
+        case "record":
+            return ReplayAnthropic(get_cassette(), "record", AsyncAnthropic())
+        case "replay":
+            return ReplayAnthropic(get_cassette(), "replay")
+
+
+def get_agents_run_config():
+    """`RunConfig` for `Runner.run`, None keeps the agents sdk defaults"""
+    if settings.llm_backend == "live":
+        return None
+
+    return RunConfig(
+        model_provider=ReplayAgentsModelProvider(get_cassette(), settings.llm_backend),
+        # traces are uploaded to openai, which replay mode must not do
+        tracing_disabled=settings.llm_backend == "replay",
+    )
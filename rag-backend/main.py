@@ -1,36 +1,38 @@
 from fastapi import FastAPI, HTTPException  # type: ignore
 from fastapi.middleware.cors import CORSMiddleware  # type: ignore
 from pydantic import BaseModel  # type: ignore
-from typing import Dict, Any, Union
+from typing import Dict, Any, Optional, Union
+import asyncio
+import time
 from contextlib import asynccontextmanager
 from mcp_client import MCPClient
+from admission import AdmissionController, AdmissionRejected
+from config import settings
+from llm_replay import get_agents_run_config
 from dotenv import load_dotenv  # type: ignore
-from pydantic_settings import BaseSettings  # type: ignore
 from agents import Agent, Runner  # type: ignore
 
 load_dotenv()
 
-
-class Settings(BaseSettings):
-    server_script_path: str = (
-        "/Users/ayandas/Desktop/zed-proj/shield-takehome-proj/rag-chatbot-v1/rag-backend/server.py"
-    )
-
-
-settings = Settings()
+# NOTE : only /query goes through admission control, the other endpoints are cheap and must keep answering under load
+admission = AdmissionController()
 
 final_object_output = [{"title": "", "corresponding_points": [], "conclusion": ""}]
 
 
-async def get_openAI_Agent_list():
+async def get_openAI_Agent_list(model: Optional[str] = None):
+    """`model` overrides the agents sdk default model (fast routed turns use a smaller one)"""
+    model_argument = {"model": model} if model else {}
     principal_software_engineer = Agent(
         name="Software Engineer",
         instructions=f"Convert markdown format data into appropriate JSON serializable data in the following format {final_object_output}. The final response should strictly adhere to the format I have provided. It should be array of object format containing the keys 'title', 'corresponding_points' and 'conclusion'",
+        **model_argument,
     )
 
     professor = Agent(
         name="Professor",
         instructions="You are a helpful assistant who can take raw string data and convert it into easily readable markdown format. Discard any kind of vector embeddings or code that you may recieve.",
+        **model_argument,
     )
 
     return [professor, principal_software_engineer]
@@ -59,7 +61,10 @@ async def lifespan(app: FastAPI):
         This allows us to inherit all the methods within MCPClient (alongside the built in ones and access them).
         """
         app.state.client = client
+        # NOTE : warmup runs in the background so /ping answers right away, /ready reports when it is done
+        warmup_task = asyncio.create_task(client.warm_up())
         yield
+        warmup_task.cancel()
     except Exception as e:
         print(f"Error during lifespan: {e}")
         raise HTTPException(status_code=500, detail="Error during lifespan") from e
@@ -82,6 +87,8 @@ app.add_middleware(
 
 class QueryRequest(BaseModel):
     query: str
+    # turns are remembered per conversation, the client's default conversation is used when omitted
+    conversation_id: Optional[str] = None
 
 
 class Message(BaseModel):
@@ -106,15 +113,51 @@ async def server_check():
     return True
 
 
+# tells load balancers the instance is warm (embedding model loaded, collections opened and queried once)
+@app.get("/ready")
+async def readiness_check():
+    warmup_state = app.state.client.warmup_state
+    if not warmup_state["ready"]:
+        raise HTTPException(status_code=503, detail=warmup_state, headers={"Retry-After": "1"})
+    return warmup_state
+
+
 @app.post("/query")
 async def process_query(request: QueryRequest):
     import json
 
     """Process a query and return the response"""
     try:
-        messages = await app.state.client.process_query(request.query)
-        agent_list = await get_openAI_Agent_list()
-        nlp_response = await Runner.run(agent_list[0], input=str(messages))
+        async with admission.slot():
+            return await answer_query(request)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.reason,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+
+async def answer_query(request: QueryRequest):
+    try:
+        route = await app.state.client.route(request.query)
+        messages = await app.state.client.process_query(
+            request.query, request.conversation_id, route
+        )
+        # rule turns are answered from the tool result, there is nothing to reformat
+        if route.answer is not None:
+            return {"final_response": route.answer}
+
+        agent_list = await get_openAI_Agent_list(
+            settings.router_fast_format_model if route.tier == "fast" else None
+        )
+        format_start = time.perf_counter()
+        nlp_response = await Runner.run(
+            agent_list[0], input=str(messages), run_config=get_agents_run_config()
+        )
+        app.state.client.router.record(
+            route.tier, "format", time.perf_counter() - format_start
+        )
         print(nlp_response.final_output)
         # print(f"{messages}")
         return {"final_response": nlp_response.final_output}
@@ -122,11 +165,20 @@ async def process_query(request: QueryRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """admission control of /query (queue depth, wait / service times) and per tier model routing metrics"""
+    return {
+        "admission": admission.metrics(),
+        "routing": app.state.client.router.metrics(),
+    }
+
+
 @app.get("/tools")
 async def get_tools():
     """Get the list of available tools"""
     try:
-        tools = await app.state.client.get_mcp_tools()
+        tools = app.state.client.tool_catalog or await app.state.client.get_mcp_tools()
         return {
             "tools": [
                 {
@@ -147,7 +199,7 @@ async def get_prompts():
     get list of available prompts
     """
     try:
-        prompts = await app.state.client.get_prompt_list()
+        prompts = app.state.client.prompt_catalog or await app.state.client.get_prompt_list()
         return {
             "prompts": [
                 {
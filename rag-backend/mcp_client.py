@@ -3,19 +3,38 @@
 
 from typing import Optional
 from contextlib import AsyncExitStack
-from chromaDB import client
-from google import genai
-from google.genai import types
+from conversation_memory import ConversationMemory
+from model_router import ModelRouter, Route
+from config import settings
 import traceback
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 from datetime import datetime
+import asyncio
 import json
 import os
+import re
+import time
 import logging
+import uuid
 
-from anthropic import Anthropic
-from anthropic.types import Message
+from llm_replay import create_anthropic_client
+
+# get_list_of_collections renders every collection as "Collection(name=<name>)"
+COLLECTION_NAME = re.compile(r"Collection\(name=([^)]+)\)")
+# tools whose lookups are scoped to the conversation of the turn : the client fills in conversation_id, the llm never sees the argument
+CONVERSATION_SCOPED_TOOLS = {"get_user_query_history"}
+
+
+def llm_input_schema(tool) -> dict:
+    """input schema of a tool as shown to the llm, without the arguments the client fills in itself"""
+    if tool.name not in CONVERSATION_SCOPED_TOOLS:
+        return tool.inputSchema
+    schema = {**tool.inputSchema, "properties": dict(tool.inputSchema.get("properties", {}))}
+    schema["properties"].pop("conversation_id", None)
+    if "required" in schema:
+        schema["required"] = [name for name in schema["required"] if name != "conversation_id"]
+    return schema
 
 
 class MCPClient:
@@ -28,17 +47,19 @@ class MCPClient:
         self.exit_stack = (
             AsyncExitStack()
         )  # combines both synchronous and asynchronous context managers
-        self.llm = Anthropic()
+        self.llm = create_anthropic_client()
         self.tools = []
-        self.messages = []
+        # tool and prompt lists as returned by the server, loaded once (connect_to_server, warm_up) and served by /tools and /prompts
+        self.tool_catalog = []
+        self.prompt_catalog = []
+        self.warmup_state = {"ready": False, "done": False, "seconds": None, "server": None, "errors": {}}
         self.info_logger = logger
-        self.context_history_database = client.get_or_create_collection(
-            name="contextual_data",
-            metadata={
-                "description": "chroma db vector database that stores relevant contexual information to keep track of user query."
-            },
-        )
+        # every user query and final answer is indexed in the background under this conversation id (see conversation_memory.py)
+        self.memory = ConversationMemory()
+        self.conversation_id = uuid.uuid4().hex
         self.model_choice = "claude"
+        # picks the tier of every turn : direct tool dispatch, fast model or heavy model (see model_router.py)
+        self.router = ModelRouter()
 
     async def set_model(self, model_choice: str):
         self.info_logger.info(f"Updated model to {model_choice}")
@@ -51,44 +72,26 @@ class MCPClient:
     # connect to the MCP server
     async def connect_to_server(self, server_script_path: str):
         try:
-            if self.context_history_database.count() > 0:
-                client.delete_collection(name="contextual_data")
-
-            self.context_history_database = client.get_or_create_collection(
-                name="contextual_data",
-                metadata={
-                    "description": "chroma db vector database that stores relevant contexual information to keep track of user and llm query."
-                },
-            )
-            is_python = server_script_path.endswith(".py")
-            is_js = server_script_path.endswith(".js")
-            if not (is_python or is_js):
-                raise ValueError("Server script must be a .py or .js file")
-
-            command = "python" if is_python else "node"
-            server_params = StdioServerParameters(
-                command=command, args=[server_script_path], env=None
-            )
-
-            stdio_transport = await self.exit_stack.enter_async_context(
-                stdio_client(server_params)
-            )
-            self.stdio, self.write = stdio_transport
-            self.session = await self.exit_stack.enter_async_context(
-                ClientSession(self.stdio, self.write)
-            )
-
-            await self.session.initialize()
+            match settings.mcp_transport:
+                case "stdio":
+                    await self.connect_over_stdio(server_script_path)
+                case "memory":
+                    await self.connect_in_memory()
+                case _:
+                    raise ValueError(f"Unknown MCP transport : {settings.mcp_transport}")
 
             # self.logger.info("Connected to MCP server")
-            self.info_logger.info("Connected to MCP server")
+            self.info_logger.info(
+                f"Connected to MCP server ({settings.mcp_transport} transport)"
+            )
 
             mcp_tools = await self.get_mcp_tools()
+            self.tool_catalog = mcp_tools
             self.tools = [
                 {
                     "name": tool.name,
                     "description": tool.description,
-                    "input_schema": tool.inputSchema,
+                    "input_schema": llm_input_schema(tool),
                 }
                 for tool in mcp_tools
             ]
@@ -105,6 +108,43 @@ class MCPClient:
             traceback.print_exc()
             raise
 
+    async def connect_over_stdio(self, server_script_path: str):
+        """spawns the server script as a subprocess and speaks MCP over its stdin/stdout"""
+        is_python = server_script_path.endswith(".py")
+        is_js = server_script_path.endswith(".js")
+        if not (is_python or is_js):
+            raise ValueError("Server script must be a .py or .js file")
+
+        command = "python" if is_python else "node"
+        # pass the environment through so the server subprocess sees the same settings (chroma host, embedder, ...)
+        server_params = StdioServerParameters(
+            command=command, args=[server_script_path], env=dict(os.environ)
+        )
+
+        stdio_transport = await self.exit_stack.enter_async_context(
+            stdio_client(server_params)
+        )
+        self.stdio, self.write = stdio_transport
+        self.session = await self.exit_stack.enter_async_context(
+            ClientSession(self.stdio, self.write)
+        )
+
+        await self.session.initialize()
+
+    async def connect_in_memory(self):
+        """
+        runs the FastMCP server from server.py inside this process and connects to it through in-memory streams.
+
+        messages are passed as objects instead of being json encoded through a pipe, and there is no subprocess.
+        the session is already initialized when it is returned.
+        """
+        from mcp.shared.memory import create_connected_server_and_client_session
+        from server import mcp as tool_server
+
+        self.session = await self.exit_stack.enter_async_context(
+            create_connected_server_and_client_session(tool_server._mcp_server)
+        )
+
     # get mcp tool list
     async def get_mcp_tools(self):
         try:
@@ -122,15 +162,55 @@ class MCPClient:
             self.info_logger.error(f"Error getting MCP prompts: {e}")
             raise
 
+    async def route(self, query: str) -> Route:
+        # NOTE : the collection list is only fetched for queries a collection rule could answer, the others route without a tool call
+        collection_names = await self.collection_names() if self.router.needs_collection_names(query) else None
+        return self.router.route(query, [tool["name"] for tool in self.tools] if self.tools else None, collection_names)
+
+    async def collection_names(self) -> Optional[set[str]]:
+        """names of the existing collections (get_list_of_collections tool), None when they can't be listed"""
+        try:
+            result = await self.session.call_tool("get_list_of_collections", {})
+        except Exception as e:
+            self.info_logger.error(f"Error listing collections: {e}")
+            return None
+        if result.isError:
+            return None
+        return {
+            name
+            for content in result.content
+            if content.type == "text"
+            for name in COLLECTION_NAME.findall(content.text)
+        }
+
     # process query
-    async def process_query(self, query: str):
+    async def process_query(self, query: str, conversation_id: Optional[str] = None, route: Optional[Route] = None):
+        """
+        answers a user query, `route` (default : await self.route(query)) decides the tier. A rule route that could be answered
+        without the llm gets its `answer` set
+        """
+        turn_start = time.perf_counter()
+        route = route or await self.route(query)
+        # NOTE : every turn has its own message list, several /query requests run on this client at once (admission_max_in_flight)
+        messages = [{"role": "user", "content": query}]
+        turn_id = uuid.uuid4().hex[:8]
         try:
-            self.info_logger.info(f"Processing query : {query}")
-            user_message = {"role": "user", "content": query}
-            self.messages = [user_message]
+            self.info_logger.info(f"Processing query : {query} (tier {route.tier}, {route.reason})")
+            conversation_id = conversation_id or self.conversation_id
+            self.memory.remember(conversation_id, "user", query)
+
+            if route.tier == "rule":
+                route.answer = await self.dispatch_tool(route)
+                if route.answer is not None:
+                    messages.append({"role": "assistant", "content": route.answer})
+                    self.memory.remember(conversation_id, "assistant", route.answer)
+                    await self.log_conversation(messages, turn_id)
+                    return messages
 
             while True:
-                response = await self.call_llm()
+                llm_start = time.perf_counter()
+                response = await self.call_llm(messages, route)
+                self.router.record(route.tier, "llm", time.perf_counter() - llm_start, getattr(response, "usage", None))
 
                 # the response is a text message
                 if response.content[0].type == "text" and len(response.content) == 1:
@@ -138,8 +218,11 @@ class MCPClient:
                         "role": "assistant",
                         "content": response.content[0].text,
                     }
-                    self.messages.append(assistant_message)
-                    await self.log_conversation()
+                    messages.append(assistant_message)
+                    self.memory.remember(
+                        conversation_id, "assistant", assistant_message["content"]
+                    )
+                    await self.log_conversation(messages, turn_id)
                     break
 
                 # the response is a tool call
@@ -147,8 +230,8 @@ class MCPClient:
                     "role": "assistant",
                     "content": response.to_dict()["content"],
                 }
-                self.messages.append(assistant_message)
-                await self.log_conversation()
+                messages.append(assistant_message)
+                await self.log_conversation(messages, turn_id)
 
                 for content in response.content:
                     if content.type == "tool_use":
@@ -159,8 +242,8 @@ class MCPClient:
                             f"Calling tool {tool_name} with args {tool_args}"
                         )
                         try:
-                            result = await self.session.call_tool(tool_name, tool_args)
-                            self.messages.append(
+                            result = await self.call_tool(tool_name, tool_args, conversation_id)
+                            messages.append(
                                 {
                                     "role": "user",
                                     "content": [
@@ -172,21 +255,46 @@ class MCPClient:
                                     ],
                                 }
                             )
-                            await self.log_conversation()
+                            await self.log_conversation(messages, turn_id)
                         except Exception as e:
                             self.info_logger.error(
                                 f"Error calling tool {tool_name}: {e}"
                             )
                             raise
 
-            return self.messages
+            return messages
 
         except Exception as e:
             self.info_logger.error(f"Error processing query: {e}")
             raise
+        finally:
+            self.router.record_turn(route.tier, time.perf_counter() - turn_start)
+
+    async def call_tool(self, tool_name: str, tool_args: dict, conversation_id: str):
+        """calls an MCP tool for a turn of `conversation_id`, conversation scoped tools only ever see that conversation"""
+        if tool_name in CONVERSATION_SCOPED_TOOLS:
+            tool_args = {**tool_args, "conversation_id": conversation_id}
+        return await self.session.call_tool(tool_name, tool_args)
+
+    async def dispatch_tool(self, route: Route) -> Optional[str]:
+        """calls the tool of a rule route directly, None (and the route escalated to heavy) when the call fails"""
+        start = time.perf_counter()
+        try:
+            result = await self.session.call_tool(route.tool_name, route.tool_arguments)
+        except Exception as e:
+            result = None
+            self.info_logger.error(f"Error calling tool {route.tool_name}: {e}")
+        self.router.record("rule", "tool", time.perf_counter() - start)
+
+        if result is None or result.isError:
+            self.router.escalate(route, f"{route.tool_name} failed")
+            return None
+        result_text = "\n".join(content.text for content in result.content if content.type == "text")
+        return route.answer_template.replace("{result}", result_text)
 
     # call llm
-    async def call_llm(self):
+    async def call_llm(self, messages: list[dict], route: Optional[Route] = None):
+        """one llm call on the messages of a turn, awaited without blocking the event loop (the other requests keep being admitted)"""
         try:
             self.model_choice = await self.get_model_choice()
             print(f"retrieved choice of model : {self.model_choice}")
@@ -194,21 +302,25 @@ class MCPClient:
                 case "claude":
                     self.info_logger.info("Calling Antrhopic")
                     print("Calling Antrhopic")
-                    return self.llm.messages.create(
-                        model="claude-3-5-sonnet-20241022",
-                        max_tokens=3500,
-                        messages=self.messages,
+                    return await self.llm.messages.create(
+                        model=route.model if route else settings.router_heavy_model,
+                        max_tokens=route.max_tokens if route else settings.router_heavy_max_tokens,
+                        messages=messages,
                         tools=self.tools,
                     )
                 case "gemini":
+                    from google import genai
+                    from google.genai import types
+
                     self.info_logger.info("Calling Gemini")
                     print("Calling Gemini")
-                    self.llm = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-                    self.tools = await self.get_mcp_tools()
-                    gemini_response = self.llm.models.generate_content(
+                    # NOTE : local client and tool list, self.llm and self.tools are shared with the claude turns running concurrently
+                    gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+                    mcp_tools = self.tool_catalog or await self.get_mcp_tools()
+                    gemini_response = await gemini_client.aio.models.generate_content(
                         model="gemini-2.5-pro-exp-03-25",
                         contents=str(
-                            self.messages[0]["content"]
+                            messages[0]["content"]
                         ),  # needs to be a string
                         config=types.GenerateContentConfig(
                             temperature=0,
@@ -230,11 +342,11 @@ class MCPClient:
                                         }
                                     ]
                                 )
-                                for tool in self.tools
+                                for tool in mcp_tools
                             ],
                         ),
                     )
-                    print(f"{self.messages[0]["content"]}")
+                    print(f"{messages[0]["content"]}")
                     print(
                         f"gemini response : {gemini_response.candidates[0].content.parts[0]}"
                     )
@@ -246,9 +358,58 @@ class MCPClient:
             self.info_logger.error(f"Error calling LLM: {e}")
             raise
 
+    async def warm_up(self):
+        """
+        readiness of the whole stack (main.py's /ready) : prompt catalog, conversation memory collection and the embedding model of
+        this process, then the MCP server's own warmup (warmup://status resource). Failing steps are recorded in warmup_state["errors"]
+        and keep warmup_state["ready"] False once warmup is done
+        """
+        start = time.perf_counter()
+        try:
+            self.prompt_catalog = await self.get_prompt_list()
+        except Exception as e:
+            self.warmup_state["errors"]["prompt_catalog"] = str(e)
+
+        if settings.warmup_enabled:
+            try:
+                await asyncio.to_thread(self.memory.search, None, "warmup", 1)
+            except Exception as e:
+                self.warmup_state["errors"]["conversation_memory"] = str(e)
+            self.warmup_state["server"] = await self.wait_for_server_warmup()
+
+        self.warmup_state["seconds"] = round(time.perf_counter() - start, 3)
+        self.warmup_state["done"] = True
+        # NOTE : an instance whose backend was unreachable (or whose collections couldn't be loaded) isn't warm, /ready keeps answering 503
+        self.warmup_state["ready"] = not self.warmup_state["errors"]
+        self.info_logger.info(f"Warmup done in {self.warmup_state['seconds']}s, errors : {self.warmup_state['errors']}")
+
+    async def wait_for_server_warmup(self, poll_interval: float = 0.25):
+        from pydantic import AnyUrl  # type: ignore
+
+        deadline = time.perf_counter() + settings.warmup_timeout_seconds
+        status = None
+        while time.perf_counter() < deadline:
+            try:
+                result = await self.session.read_resource(AnyUrl("warmup://status"))
+                status = json.loads(result.contents[0].text)
+            except Exception as e:
+                # servers without the resource have nothing to wait for
+                if "Unknown resource" not in str(e):
+                    self.warmup_state["errors"]["server"] = str(e)
+                return None
+            if status["status"] == "failed":
+                self.warmup_state["errors"]["server"] = status["errors"]
+                return status
+            if status["status"] in ("ready", "disabled"):
+                return status
+            await asyncio.sleep(poll_interval)
+        self.warmup_state["errors"]["server"] = f"warmup not done after {settings.warmup_timeout_seconds}s"
+        return status
+
     # cleanup
     async def cleanup(self):
         try:
+            await self.memory.close()
             await self.exit_stack.aclose()
             self.info_logger.info("Disconnected from MCP server")
         except Exception as e:
@@ -256,15 +417,12 @@ class MCPClient:
             traceback.print_exc()
             raise
 
-    async def log_conversation(self):
-        os.makedirs(
-            "/Users/ayandas/Desktop/zed-proj/shield-takehome-proj/rag-chatbot-v1/rag-backend/conversations",
-            exist_ok=True,
-        )
+    async def log_conversation(self, messages: list[dict], turn_id: str):
+        os.makedirs(settings.conversation_log_directory, exist_ok=True)
 
         serializable_conversation = []
 
-        for message in self.messages:
+        for message in messages:
             try:
                 serializable_message = {"role": message["role"], "content": []}
 
@@ -293,7 +451,9 @@ class MCPClient:
                 raise
 
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        filepath = os.path.join("conversations", f"conversation_{timestamp}.json")
+        filepath = os.path.join(
+            settings.conversation_log_directory, f"conversation_{timestamp}_{turn_id}.json"
+        )
 
         try:
             with open(filepath, "w") as f:
@@ -0,0 +1,137 @@
+# type : ignore
+"""
+per turn model routing for MCPClient, every user query gets one of three tiers :
+
+- rule  : explicit tool commands ("/echo ...", "echo: ...", "/collections", "list collections", "/count <collection>") and count
+          questions naming an existing collection are matched by a regular expression and the tool is called directly, the answer
+          is built from the tool result without any llm call (and without the formatting pass)
+- fast  : short single questions without analysis keywords go to settings.router_fast_model with a small max_tokens
+- heavy : everything else, settings.router_heavy_model (the model every turn used before)
+
+a rule turn whose tool call fails is escalated to heavy. Tool calls made by the llm inside a turn stay on the turn's tier.
+metrics are kept per tier : turns, llm / tool calls, tokens and latency percentiles (exposed by main.py's /metrics).
+"""
+import re
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Any
+
+from admission import METRICS_WINDOW, percentiles
+from config import settings
+
+TIERS = ("rule", "fast", "heavy")
+
+# anything that asks for reasoning, several steps or the conversation so far stays on the heavy model
+HEAVY_HINTS = re.compile(
+    r"\b(explain|why|compare|comparison|difference|differences|analy[sz]e|analysis|summari[sz]e|summary|step|steps|reason|"
+    r"evaluate|pros|cons|previous|earlier|history|above|detail|detailed|write|essay|code)\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class Rule:
+    name: str
+    pattern: re.Pattern
+    tool_name: str
+    # tool arguments from the match
+    arguments: Any
+    # answer built from the match and the tool result text
+    answer: str
+    # the rule only applies when the "name_of_collection" argument is an existing collection
+    needs_collection: bool = False
+
+
+# NOTE : a rule answer skips the llm, so a question that merely looks like a command must not match. echo and the collection list
+# need an explicit command, counts have to name an existing collection (checked by MCPClient.route, see needs_collection_names)
+RULES = [
+    Rule("echo", re.compile(r"^\s*(?:/echo\s+|echo:\s*)(?P<message>.+?)\s*$", re.IGNORECASE | re.DOTALL), "echo",
+         lambda match: {"message": match["message"]}, "{result}"),
+    Rule("list_collections",
+         re.compile(
+             r"^\s*(?:/collections|(?:please\s+)?(?:list|show)\s+(?:(?:all|the|my)\s+)*(?:(?:vector|chroma|database)\s+)?collections)\s*[?.!]?\s*$",
+             re.IGNORECASE,
+         ),
+         "get_list_of_collections", lambda match: {}, "Available collections : {result}"),
+    Rule("count_collection",
+         re.compile(
+             r"^\s*(?:/count\s+(?P<name_command>[\w.-]{3,})|(?:how many|count)\b[\w\s]*?\b(?:collection\s+['\"]?(?P<name>[\w.-]{3,})['\"]?|['\"]?(?P<name_before>[\w.-]{3,})['\"]?\s+collection))\s*[?.!]?\s*$",
+             re.IGNORECASE,
+         ),
+         "get_collection_data_count",
+         lambda match: {"name_of_collection": match["name_command"] or match["name"] or match["name_before"]},
+         "Collection {name} contains {result} entries.", needs_collection=True),
+]
+
+
+@dataclass
+class Route:
+    tier: str
+    reason: str
+    model: str | None = None
+    max_tokens: int | None = None
+    tool_name: str | None = None
+    tool_arguments: dict[str, Any] = field(default_factory=dict)
+    answer_template: str | None = None
+    # set by MCPClient.process_query when a rule turn was answered without the llm
+    answer: str | None = None
+
+
+class ModelRouter:
+    def __init__(self):
+        self._counters: dict[str, dict[str, int]] = {tier: defaultdict(int) for tier in TIERS}
+        self._latencies: dict[str, dict[str, deque]] = {
+            tier: defaultdict(lambda: deque(maxlen=METRICS_WINDOW)) for tier in TIERS
+        }
+
+    def needs_collection_names(self, query: str) -> bool:
+        """whether route() needs the existing collection names to decide on `query`"""
+        return settings.model_routing_enabled and any(rule.needs_collection and rule.pattern.match(query) for rule in RULES)
+
+    def route(self, query: str, tool_names: list[str] | None = None, collection_names: set[str] | None = None) -> Route:
+        """`collection_names` : existing collections, rules that need one don't apply without them"""
+        if settings.model_routing_enabled:
+            for rule in RULES:
+                match = rule.pattern.match(query)
+                if not match or (tool_names is not None and rule.tool_name not in tool_names):
+                    continue
+                arguments = rule.arguments(match)
+                if rule.needs_collection and arguments["name_of_collection"] not in (collection_names or ()):
+                    continue
+                return Route(
+                    "rule", rule.name, tool_name=rule.tool_name, tool_arguments=arguments,
+                    answer_template=rule.answer.replace("{name}", arguments.get("name_of_collection", "")),
+                )
+
+            words = len(query.split())
+            if words <= settings.router_fast_max_words and query.count("?") <= 1 and not HEAVY_HINTS.search(query):
+                return Route("fast", f"{words} words, no analysis keywords", settings.router_fast_model, settings.router_fast_max_tokens)
+        return Route("heavy", "default", settings.router_heavy_model, settings.router_heavy_max_tokens)
+
+    def escalate(self, route: Route, reason: str):
+        """turns a route into a heavy one in place (a rule whose tool call failed)"""
+        self._counters[route.tier]["escalated"] += 1
+        route.tier, route.reason = "heavy", reason
+        route.model, route.max_tokens = settings.router_heavy_model, settings.router_heavy_max_tokens
+
+    def record(self, tier: str, stage: str, seconds: float, usage: Any = None):
+        """one llm call, tool dispatch or formatting pass (stage) of a turn on `tier`, with the token usage of llm calls"""
+        self._counters[tier][f"{stage}_calls"] += 1
+        self._latencies[tier][stage].append(seconds)
+        if usage is not None:
+            self._counters[tier]["input_tokens"] += getattr(usage, "input_tokens", 0) or 0
+            self._counters[tier]["output_tokens"] += getattr(usage, "output_tokens", 0) or 0
+
+    def record_turn(self, tier: str, seconds: float):
+        self._counters[tier]["turns"] += 1
+        self._latencies[tier]["turn"].append(seconds)
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            tier: {
+                **self._counters[tier],
+                **{f"{stage}_latency": percentiles(samples) for stage, samples in self._latencies[tier].items()},
+            }
+            for tier in TIERS
+        }
+
@@ -1,24 +1,42 @@
 # type:ignore
 from mcp.server.fastmcp import FastMCP
 from mcp.server.fastmcp.prompts import base
-from fastmcp import Client
-from chromaDB import client, ChromaDBVectorDatabase, get_huggingface_data
+from chromaDB import get_client, get_async_client, get_vector_database, get_huggingface_data, get_embedding_function, get_collection_configuration, HUGGINGFACE_LOAD_DATASET_2ND_PARAM, HUGGINGFACE_TEXT_CORPUS_CONFIG
+from config import settings
+from conversation_memory import format_history, history_filter
+from collection_io import clone_collection, scan_arguments, scan_page
+from singleflight import SingleFlight, normalize_query
 from datetime import datetime
-from typing import Any, List, Dict, Union
-import anthropic
-import chromadb
+from typing import Any, List, Dict, Literal, Union
 import asyncio
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+
+# NOTE : heavy imports (chromadb, datasets, anthropic) are deferred to the tools that need them so the server can answer `initialize` quickly
+
+# NOTE : never print in this process, with the stdio transport stdout is the protocol pipe (logs go to stderr)
+logger = logging.getLogger(__name__)
+
+# concurrent identical calls run once : ingestion is keyed per collection (and mode / dataset config), searches per collection and normalized query
+ingestion_flight = SingleFlight()
+search_flight = SingleFlight()
+# one ingestion at a time per collection whatever its mode or dataset config, a full load next to a delta sync (or the other config) would mix rows
+ingestion_locks : dict[str, asyncio.Lock] = {}
 
 # helper functions
-def check_collection_data_count(collection_name : str) -> dict[str, Any]:
+def check_collection_data_count(collection_name : str, hnsw : dict[str, Any] | None = None) -> dict[str, Any]:
     '''
     if it's a newly created collection, the count will be zero
     '''
-    chroma_collection = client.get_or_create_collection(name=collection_name,
+    chroma_collection = get_client().get_or_create_collection(name=collection_name,
+        configuration=get_collection_configuration(hnsw),
         metadata={
             "description" : "chroma db vector collection",
             "created" : str(datetime.now())
-        }
+        },
+        embedding_function=get_embedding_function()
     )
 
     # NOTE : chroma_collection isn't really needed in this scenario
@@ -27,56 +45,262 @@ def check_collection_data_count(collection_name : str) -> dict[str, Any]:
         "collection" : chroma_collection
     }
 
+async def get_async_collection(collection_name : str, create : bool = False):
+    '''
+    async handle of a collection through the shared (pooled) async client, `create` mirrors the get_or_create of ChromaDBVectorDatabase
+    '''
+    client = await get_async_client()
+    if create:
+        # get_or_create is a write on the chroma server (much slower than a read), so only fall back to it when the collection is missing
+        try:
+            return await client.get_collection(name=collection_name, embedding_function=get_embedding_function())
+        except Exception:
+            pass
+        return await client.get_or_create_collection(name=collection_name,
+            configuration=get_collection_configuration(),
+            metadata={
+                "description" : "chroma db vector collection",
+                "created" : str(datetime.now())
+            },
+            embedding_function=get_embedding_function()
+        )
+    return await client.get_collection(name=collection_name, embedding_function=get_embedding_function())
+
+async def query_collection(collection_instance, query_texts : list[str], **kwargs):
+    '''
+    collection query with the query embeddings computed in a worker thread, chroma's AsyncCollection would run the embedding model on the event loop
+    '''
+    query_embeddings = await asyncio.to_thread(get_embedding_function(), query_texts)
+    return await collection_instance.query(query_embeddings=query_embeddings, **kwargs)
+
+def ingest_huggingface_data(collection_name : str, hnsw : dict[str, Any] | None = None, mode : str = "full", dataset_config : str = HUGGINGFACE_LOAD_DATASET_2ND_PARAM) -> str:
+    '''
+    blocking part of `enter_data` (dataset download, embedding and inserts), run in a worker thread by the async tools
+
+    mode "full" only loads into an empty collection, "delta" syncs any collection with the dataset (see ChromaDBVectorDatabase.sync_data)
+    '''
+    if dataset_config == HUGGINGFACE_TEXT_CORPUS_CONFIG:
+        return ingest_text_corpus(collection_name, hnsw, mode)
+    if mode == "delta":
+        return sync_huggingface_data(collection_name, hnsw)
+
+    if settings.retrieval_backend == "quantized":
+        collection_info = {"collection_count" : get_vector_database(collection_name).count()}
+    else:
+        collection_info = check_collection_data_count(collection_name, hnsw)
+    load_data = get_huggingface_data()
+
+    try:
+
+        if collection_info["collection_count"] == 0 and load_data["status_code"] == 200:
+            chroma_instance = get_vector_database(collection_name, hnsw=hnsw)
+            chroma_instance.store_data(load_data["data"])
+            return f"Successfully loaded data into collection {collection_name}"
+
+        elif collection_info["collection_count"] > 0:
+            return f"{collection_name} already contains data of size {collection_info["collection_count"]}."
+
+        elif load_data["status_code"] == 503:
+            return f"Failed to load huggingface data due to {load_data["message"]}."
+        else:
+            return "Tool failed to execute due to some unknown error. Please try again."
+    except Exception as e:
+        return f"Error occured due to {e}"
+
+def ingest_text_corpus(collection_name : str, hnsw : dict[str, Any] | None = None, mode : str = "full") -> str:
+    '''
+    streams the text-corpus passages through the chunking pipeline (chunking.py) into an empty collection
+    '''
+    from chunking import ingest_passages
+
+    if mode == "delta":
+        return f"delta mode is only available for the {HUGGINGFACE_LOAD_DATASET_2ND_PARAM} dataset config, chunks are stored under stable ids so a full load can be repeated on an emptied collection instead."
+    vector_database = get_vector_database(collection_name, hnsw=hnsw)
+    collection_count = vector_database.count()
+    if collection_count > 0:
+        return f"{collection_name} already contains data of size {collection_count}."
+
+    load_data = get_huggingface_data(HUGGINGFACE_TEXT_CORPUS_CONFIG, streaming=True)
+    if load_data["status_code"] != 200:
+        return f"Failed to load huggingface data due to {load_data["message"]}."
+    try:
+        counts = ingest_passages(vector_database, load_data["data"]["passages"])
+        return f"Successfully loaded {counts["chunks"]} chunks of {counts["passages"]} passages into collection {collection_name} in {counts["seconds"]:.1f}s"
+    except Exception as e:
+        return f"Error occured due to {e}"
+
+def sync_huggingface_data(collection_name : str, hnsw : dict[str, Any] | None = None) -> str:
+    load_data = get_huggingface_data()
+    if load_data["status_code"] != 200:
+        return f"Failed to load huggingface data due to {load_data["message"]}."
+    try:
+        counts = get_vector_database(collection_name, hnsw=hnsw).sync_data(load_data["data"])
+        return (
+            f"Synchronized collection {collection_name} : {counts["added"]} added, {counts["updated"]} updated, "
+            f"{counts["deleted"]} deleted, {counts["unchanged"]} unchanged."
+        )
+    except Exception as e:
+        return f"Error occured due to {e}"
+
+# filled by warm_up, read by clients through the warmup://status resource (main.py's /ready waits for it)
+warmup_state : dict[str, Any] = {"status" : "pending", "steps" : {}, "errors" : {}, "seconds" : None}
+
+async def warm_up():
+    '''
+    pays the first query costs up front : embedding model load, collection lookup (and ingestion of an empty one, as context_retriever
+    would do), and a dummy query per configured collection so the index segments are read into memory.
+    a failing step is recorded and the others still run, the status ends "failed" instead of "ready" (main.py's /ready stays 503)
+    '''
+    warmup_state["status"] = "running"
+    start = time.perf_counter()
+
+    async def step(name, work):
+        step_start = time.perf_counter()
+        try:
+            await work()
+        except Exception as e:
+            warmup_state["errors"][name] = str(e) or type(e).__name__
+        warmup_state["steps"][name] = round(time.perf_counter() - step_start, 3)
+
+    # NOTE : model load is blocking and can take seconds, it stays off the event loop
+    await step("embedding_function", lambda: asyncio.to_thread(lambda: get_embedding_function()(["warmup"])))
+    for collection_name in settings.warmup_collections:
+        await step(f"collection:{collection_name}", lambda: warm_up_collection(collection_name))
+
+    warmup_state["seconds"] = round(time.perf_counter() - start, 3)
+    warmup_state["status"] = "failed" if warmup_state["errors"] else "ready"
+
+async def warm_up_collection(collection_name : str):
+    if settings.retrieval_backend == "quantized":
+        vector_index = get_vector_database(collection_name)
+        if vector_index.count() == 0 and settings.warmup_ingest_empty_collections:
+            ingestion_message = await enter_data_to_new_collection(collection_name)
+            if vector_index.count() == 0:
+                raise RuntimeError(ingestion_message)
+        if vector_index.count() > 0:
+            await asyncio.to_thread(vector_index.search, "warmup", 1)
+        return
+
+    from chromadb.errors import NotFoundError
+
+    try:
+        collection_instance = await get_async_collection(collection_name, create=settings.warmup_ingest_empty_collections)
+    except NotFoundError:
+        # missing collection and no ingestion, nothing to warm. Anything else (backend unreachable, ...) fails the step
+        return
+    if await collection_instance.count() == 0 and settings.warmup_ingest_empty_collections:
+        ingestion_message = await enter_data_to_new_collection(collection_name)
+        if await collection_instance.count() == 0:
+            raise RuntimeError(ingestion_message)
+    if await collection_instance.count() > 0:
+        await query_collection(collection_instance, ["warmup"], n_results=1)
+
+@asynccontextmanager
+async def server_lifespan(app):
+    '''
+    starts the warmup in the background, `initialize` is answered right away. Runs once per process (the in-memory transport opens a session per client)
+    '''
+    if settings.warmup_enabled and warmup_state["status"] == "pending":
+        warmup_state["task"] = asyncio.create_task(warm_up())
+    yield {}
+
 mcp = FastMCP(
     name="Rag-Chatbot-Server",
+    lifespan=server_lifespan,
     port=8081,
     host="127.0.0.1",   # set default SSE host
-    log_level="DEBUG",
+    log_level=settings.mcp_server_log_level,   # NOTE : DEBUG logs (and renders) every chroma http request, which costs more than the request itself
     on_duplicate_tools="warn"   # Warn if tools with the same name are registered (options: 'error', 'warn', 'ignore')
 )
 
 # define list of relevant tools
 @mcp.tool(description="A simple echo tool")
-def echo(message: str) -> str:
+async def echo(message: str) -> str:
     return f"Echo: {message}"
 
 @mcp.tool(
     name="context_retriever",
     description="seaches chroma DB to retrieve relevant context and allows control over number of relevant context user wants to retrieve (default : 3) of a particular collection. If the collection doesn't exist, new data will be created and inserted before search query is performed."
 )
-def retrieve_relevant_context(user_query : str = "", number_of_relevant_context : int = 3, name_of_collection : str = "complete_collection"):
-    collection_instance = ChromaDBVectorDatabase(name_of_collection, client)
-    if client.get_collection(name=name_of_collection).count() == 0:
-        enter_data_to_new_collection(name_of_collection)
+async def retrieve_relevant_context(user_query : str = "", number_of_relevant_context : int = 3, name_of_collection : str = "complete_collection"):
+    search_key = (settings.retrieval_backend, name_of_collection, number_of_relevant_context, normalize_query(user_query))
+    if settings.retrieval_backend == "quantized":
+        return await search_flight.do(search_key, lambda: retrieve_from_vector_index(user_query, number_of_relevant_context, name_of_collection))
+    return await search_flight.do(search_key, lambda: retrieve_from_collection(user_query, number_of_relevant_context, name_of_collection))
+
+async def retrieve_from_collection(user_query : str, number_of_relevant_context : int, name_of_collection : str):
+    '''
+    context_retriever on chroma, an empty collection is loaded first (concurrent callers share one load, see enter_data)
+    '''
+    collection_instance = await get_async_collection(name_of_collection, create=True)
+    if await collection_instance.count() == 0:
+        await enter_data_to_new_collection(name_of_collection)
     try:
-        query_results = collection_instance.search(user_query, number_of_relevant_context)
+        query_results = await query_collection(collection_instance, [user_query], n_results=number_of_relevant_context)
         return f"Query results are : \n {query_results}"
         # else:
         #     return "Collection does not exist"
     except Exception as e:
-        print(f"error occured : {e}")
+        logger.error(f"error occured : {e}")
+        return f"error message : {e}"
+
+async def retrieve_from_vector_index(user_query : str, number_of_relevant_context : int, name_of_collection : str):
+    '''
+    context_retriever on the in-process quantized index (RETRIEVAL_BACKEND=quantized), no chroma round trip
+    '''
+    vector_index = get_vector_database(name_of_collection)
+    if vector_index.count() == 0:
+        await enter_data_to_new_collection(name_of_collection)
+    try:
+        query_results = await asyncio.to_thread(vector_index.search, user_query, number_of_relevant_context)
+        return f"Query results are : \n {query_results}"
+    except Exception as e:
+        logger.error(f"error occured : {e}")
         return f"error message : {e}"
 
 @mcp.tool(
     name="peek_at_database",
     description="allows for users to retrieve the topmost levels of data. (Default : 3) from the collection you want to retrieve from (default collection name : complete_collection)."
 )
-def get_topmost_data(number_of_rows : int
+async def get_topmost_data(number_of_rows : int
     = 3, name_of_collection : str = "complete_collection"):
     try:
-        collection_instance = client.get_collection(name=name_of_collection)
-        return collection_instance.peek(limit=number_of_rows)
+        collection_instance = await get_async_collection(name_of_collection)
+        return await collection_instance.peek(limit=number_of_rows)
     except Exception as e:
         return f"Failed to retrieve topmost data due to : {e}"
 
+@mcp.tool(
+    name="scan_collection",
+    description="pages through every row of a collection. Pass the returned next_cursor to get the following page (it is null after the last page). include selects the fields to return among documents, metadatas and embeddings (default : documents and metadatas, leave embeddings out unless they are needed)."
+)
+async def scan_collection(name_of_collection : str = "complete_collection", cursor : str = "", page_size : int = 20, include : list[str] | None = None):
+    try:
+        arguments = scan_arguments(name_of_collection, cursor, page_size, include)
+        collection_instance = await get_async_collection(name_of_collection)
+        return scan_page(name_of_collection, await collection_instance.get(**arguments), arguments["offset"], arguments["limit"])
+    except Exception as e:
+        return f"Failed to scan collection due to : {e}"
+
+@mcp.tool(
+    name="clone_collection",
+    description="copies every row of a collection, including the stored embeddings (nothing is re-embedded), into a new collection with the same index settings."
+)
+async def clone_collection_to(source_collection : str, new_collection_name : str) -> str:
+    try:
+        copied = await asyncio.to_thread(clone_collection, source_collection, new_collection_name)
+        return f"successfully copied {copied} rows from {source_collection} to {new_collection_name}"
+    except Exception as e:
+        return f"Failed to clone collection due to {e}"
+
 @mcp.tool(
     name="modify_collection_name",
     description="allows user to modify the name of an existing collection"
 )
-def modify_existing_collection(original_collection : str, new_collection_name : str):
+async def modify_existing_collection(original_collection : str, new_collection_name : str):
     try:
-        current_collection = client.get_collection(original_collection)
-        current_collection.modify(name=new_collection_name)
+        current_collection = await get_async_collection(original_collection)
+        await current_collection.modify(name=new_collection_name)
         return f"successfully changed {original_collection} to {new_collection_name}"
     except Exception as e:
         return f"Failed to change collection name due to {e}"
@@ -85,9 +309,9 @@ def modify_existing_collection(original_collection : str, new_collection_name :
     name="get_list_of_collections",
     description="allows for retrieval of list of availble collections"
 )
-def get_collection_list() -> Union[str, Any]:
+async def get_collection_list() -> Union[str, Any]:
     try:
-        return client.list_collections()
+        return await (await get_async_client()).list_collections()
     except Exception as e:
         return f"Failed to retrieve list of collections due to {e}"
 
@@ -95,52 +319,52 @@ def get_collection_list() -> Union[str, Any]:
     name="delete_collection_by_name",
     description="delete a particular collection based on the provided name"
 )
-def delete_collection_by_name(collection_name : str):
-    client.delete_collection(name=collection_name)
+async def delete_collection_by_name(collection_name : str):
+    await (await get_async_client()).delete_collection(name=collection_name)
 
 @mcp.tool(
     name="enter_data",
-    description="This tool will re-enter fresh batch of data on a newly created collection."
+    description="This tool will re-enter fresh batch of data on a newly created collection. dataset_config 'question-answer' (default) stores question / answer pairs, 'text-corpus' stores the wikipedia passages split into overlapping chunks. With mode 'delta' it instead brings an existing collection up to date with the dataset : only new or changed rows are embedded, removed rows are deleted. Optional hnsw index parameters (space : l2, cosine or ip, max_neighbors, ef_construction, ef_search) are applied when the collection is created, leave them unset for the defaults. Calls on a collection that is already being loaded wait for that load : one with the same mode and dataset_config gets its result (its own hnsw parameters are ignored), any other runs after it."
 )
-def enter_data_to_new_collection(collection_name : str) -> str:
-    collection_info = check_collection_data_count(collection_name)
-    load_data = get_huggingface_data()
+async def enter_data_to_new_collection(collection_name : str, mode : Literal["full", "delta"] = "full", dataset_config : Literal["question-answer", "text-corpus"] = "question-answer", space : str | None = None, max_neighbors : int | None = None, ef_construction : int | None = None, ef_search : int | None = None) -> str:
+    hnsw = {"space" : space, "max_neighbors" : max_neighbors, "ef_construction" : ef_construction, "ef_search" : ef_search}
+    collection_key = collection_name.strip()
 
-    try:
+    async def ingest():
+        # NOTE : a different mode / config waits for the running load, then sees the rows it wrote (a full load of a filled collection is a no-op)
+        async with ingestion_locks.setdefault(collection_key, asyncio.Lock()):
+            return await asyncio.to_thread(ingest_huggingface_data, collection_name, hnsw, mode, dataset_config)
 
-        if collection_info["collection_count"] == 0 and load_data["status_code"] == 200:
-            chroma_instance = ChromaDBVectorDatabase(collection_name, client)
-            chroma_instance.store_data(load_data["data"])
-            return f"Successfully loaded data into collection {collection_name}"
-
-        elif collection_info["collection_count"] > 0:
-            return f"{collection_name} already contains data of size {collection_info["collection_count"]}."
-
-        elif load_data["status_code"] == 503:
-            return f"Failed to load huggingface data due to {load_data["message"]}."
-        else:
-            return "Tool failed to execute due to some unknown error. Please try again."
-    except Exception as e:
-        return f"Error occured due to {e}"
+    # a second identical call while one is running waits for it instead of downloading and inserting the dataset again
+    return await ingestion_flight.do((collection_key, mode, dataset_config), ingest)
 
 @mcp.tool(
     name="get_collection_data_count",
     description="returns the number of data contained within a particular collection"
 )
-def get_collection_data_count(name_of_collection : str) -> int:
-    return client.get_collection(name=name_of_collection.strip().replace(" ", "")).count()
+async def get_collection_data_count(name_of_collection : str) -> int:
+    if settings.retrieval_backend == "quantized":
+        return get_vector_database(name_of_collection.strip().replace(" ", "")).count()
+    collection_instance = await get_async_collection(name_of_collection.strip().replace(" ", ""))
+    return await collection_instance.count()
 
 # TODO : look into ways to reduce the size of the description
 @mcp.tool(
     name="get_user_query_history",
-    description="""the user queries alongside llm response for the current session is stored within the chroma db collection 'contextual_data'. Can be used to search and retrieve the relevant data stored here for follow-up queries from the user for query history. If your unsure of the user query, use this tool to retrieve previous query related contextual information before attempting to answer. Keep responses brief and utilize previous conversation history stored within the 'contextual_data' to formulate your responses.
+    description="""the user queries alongside llm responses of the current conversation are stored within the chroma db collection 'contextual_data'. Can be used to search and retrieve the relevant turns of this conversation for follow-up queries from the user. If your unsure of the user query, use this tool to retrieve previous query related contextual information before attempting to answer. Keep responses brief and utilize the conversation history to formulate your responses.
     """
 )
-def retrieve_user_query_history(user_query:str, collection_name : str="contextual_data", n_results:int=5):
-    return client.get_collection(collection_name).query(
-        query_texts=[user_query],
-        n_results=n_results
-    )[:100]
+async def retrieve_user_query_history(user_query:str, collection_name : str=settings.conversation_memory_collection, n_results:int=5, conversation_id : str = ""):
+    # NOTE : the number of results and the size of every returned turn are capped, so the tool output stays small however long the session gets.
+    # MCPClient always passes the conversation of the turn (and hides the argument from the llm), an empty id searches every conversation
+    collection_instance = await get_async_collection(collection_name, create=True)
+    query_results = await query_collection(
+        collection_instance,
+        [user_query],
+        n_results=max(1, min(n_results, settings.conversation_memory_max_results)),
+        where=history_filter(conversation_id),
+    )
+    return format_history(query_results)
 
 
 # define list of relevant prompts
@@ -160,6 +384,14 @@ def convert_to_NLP(vector_data:str="placeholder data") -> str | Any:
         }
     ])
 
+@mcp.resource(
+    "warmup://status",
+    description="warmup progress of the retrieval stack : status (disabled, pending, running, ready or failed), seconds per step and step errors"
+)
+def get_warmup_status() -> str:
+    status = warmup_state["status"] if settings.warmup_enabled else "disabled"
+    return json.dumps({**{key : value for key, value in warmup_state.items() if key != "task"}, "status" : status})
+
 @mcp.prompt(
     name="track_context_history",
     description="fetch previous query related history from the collection 'contextual_data'."
@@ -175,8 +407,11 @@ def fetch_conversation_history(query : str) -> list[base.Message]:
     name="count_claude_message_tokens",
     description="returns the total input token that is being used for the current query within the present chat session."
 )
-def count_claude_message_tokens(current_query : str) -> int:
-    return anthropic.Anthropic().messages.count_tokens(
+async def count_claude_message_tokens(current_query : str) -> int:
+    # NOTE : sync tools run on the event loop (no thread pool), with the in-memory transport a blocking call would stall the api
+    from anthropic import AsyncAnthropic
+
+    token_count = await AsyncAnthropic().messages.count_tokens(
         model="claude-3-7-sonnet-20250219",
         messages=[
             {
@@ -184,7 +419,8 @@ def count_claude_message_tokens(current_query : str) -> int:
                 "content" : current_query
             }
         ]
-    ).json()["input_tokens"]
+    )
+    return token_count.input_tokens
 
 if __name__ == "__main__":
     mcp.run(transport='stdio')
@@ -0,0 +1,42 @@
+# type : ignore
+"""
+request coalescing : concurrent calls that share a key run the work once, every caller gets the same result (or exception).
+
+nothing is cached, a key is forgotten as soon as its call finishes, so a call that starts afterwards does the work again.
+the work runs in its own task, a caller that gets cancelled (client disconnect, timeout) doesn't cancel it for the others.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Task] = {}
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """awaits fn() unless a call with the same key is already in flight, in which case its result is awaited instead"""
+        self.stats["calls"] += 1
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # NOTE : marks the exception as retrieved, every caller may have been cancelled before it was raised
+        if not task.cancelled():
+            task.exception()
+
+
+def normalize_query(query: str) -> str:
+    """collapses whitespace only, the embedding models are case sensitive so the case is kept"""
+    return " ".join(query.split())
@@ -0,0 +1,10 @@
+# type : ignore
+from unittest import mock
+
+from config import settings
+
+
+def patch_settings(test, **overrides):
+    """overrides settings fields for the length of one test, the test's cleanup puts them back"""
+    for name, value in overrides.items():
+        test.enterContext(mock.patch.object(settings, name, value))
@@ -0,0 +1,83 @@
+# type : ignore
+"""run from rag-backend/ : python -m unittest discover tests"""
+import os
+import threading
+import unittest
+from unittest import mock
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+from chromadb.api.async_fastapi import AsyncFastAPI  # type: ignore
+
+import chromaDB
+from async_chroma import install_connection_pool
+from config import settings
+
+
+class ConnectionPoolTest(unittest.IsolatedAsyncioTestCase):
+    def test_chromadb_keeps_a_client_cache_per_event_loop(self):
+        # install_connection_pool seeds this private cache, a chromadb upgrade that drops it has to be noticed here
+        self.assertIsInstance(getattr(AsyncFastAPI, "_clients", None), dict)
+        self.assertTrue(callable(getattr(AsyncFastAPI, "_get_client", None)))
+
+    async def test_pooled_client_keeps_chroma_headers_and_verification(self):
+        with (
+            mock.patch.object(settings, "chroma_server_headers", {"x-chroma-token": "secret"}),
+            mock.patch.object(settings, "chroma_ssl_verify", "/etc/ssl/certs/ca-certificates.crt"),
+            mock.patch.dict(AsyncFastAPI._clients, clear=True),
+        ):
+            self.assertTrue(install_connection_pool(chromaDB.get_http_client_settings()))
+            (client,) = AsyncFastAPI._clients.values()
+            try:
+                self.assertEqual(client.headers["x-chroma-token"], "secret")
+                self.assertEqual(client.headers["Content-Type"], "application/json")
+                self.assertEqual(client.timeout.read, settings.chroma_async_timeout_seconds)
+                self.assertEqual(client._transport._pool._max_connections, settings.chroma_async_max_connections)
+            finally:
+                await client.aclose()
+
+
+class QueryEmbeddingTest(unittest.IsolatedAsyncioTestCase):
+    async def test_query_embeddings_are_computed_off_the_event_loop(self):
+        import server
+
+        loop_thread = threading.get_ident()
+        embedding_threads = []
+
+        def embed(texts):
+            embedding_threads.append(threading.get_ident())
+            return [[0.0, 1.0] for _ in texts]
+
+        class RecordingCollection:
+            async def query(self, **kwargs):
+                self.kwargs = kwargs
+                return {}
+
+        collection = RecordingCollection()
+        with mock.patch.object(server, "get_embedding_function", return_value=embed):
+            await server.query_collection(collection, ["what is a cat"], n_results=2)
+
+        self.assertNotEqual(embedding_threads, [loop_thread])
+        self.assertEqual(collection.kwargs, {"query_embeddings": [[0.0, 1.0]], "n_results": 2})
+
+
+class AsyncToolsTest(unittest.IsolatedAsyncioTestCase):
+    def test_tools_are_coroutines(self):
+        # sync tools are called on the event loop, a blocking one stalls every session of the process
+        import server
+
+        for tool in server.mcp._tool_manager.list_tools():
+            self.assertTrue(tool.is_async, tool.name)
+
+    async def test_token_count_uses_the_async_client(self):
+        import server
+
+        client = mock.Mock()
+        client.messages.count_tokens = mock.AsyncMock(return_value=mock.Mock(input_tokens=12))
+        with mock.patch("anthropic.AsyncAnthropic", return_value=client):
+            self.assertEqual(await server.count_claude_message_tokens("how many tokens is this"), 12)
+        client.messages.count_tokens.assert_awaited_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+# type : ignore
+"""run from rag-backend/ : python -m unittest discover tests"""
+import random
+import unittest
+
+from chunking import chunk_text
+
+
+def passage(sentences: int, seed: int = 0) -> str:
+    generator = random.Random(seed)
+    words = "the river carried stone and light past every quiet town".split()
+    return " ".join(
+        " ".join(generator.choice(words) for _ in range(generator.randint(4, 30))) + "." for _ in range(sentences)
+    )
+
+
+def shared_tokens(first: list[str], second: list[str], chunk_overlap: int) -> int:
+    return max((size for size in range(1, chunk_overlap + 1) if first[-size:] == second[:size]), default=0)
+
+
+class ChunkOverlapTest(unittest.TestCase):
+    def test_consecutive_chunks_overlap(self):
+        # sentences of up to 30 tokens, most of them longer than the overlap
+        for chunk_size, chunk_overlap in ((50, 10), (160, 32)):
+            chunks = [chunk.split() for chunk in chunk_text(passage(60), chunk_size, chunk_overlap)]
+            self.assertGreater(len(chunks), 2)
+            for first, second in zip(chunks, chunks[1:]):
+                self.assertLessEqual(len(second), chunk_size)
+                self.assertGreater(shared_tokens(first, second, chunk_overlap), 0, (first, second))
+
+    def test_long_last_sentence_carries_its_tail(self):
+        text = " ".join(f"a{index}" for index in range(20)) + ". " + " ".join(f"b{index}" for index in range(40)) + "."
+        first, second = (chunk.split() for chunk in chunk_text(text, 50, 10))
+        self.assertEqual(second[:10], first[-10:])
+
+    def test_no_overlap_when_disabled(self):
+        chunks = [chunk.split() for chunk in chunk_text(passage(30), 50, 0)]
+        self.assertEqual(sum(len(chunk) for chunk in chunks), len(passage(30).split()))
+
+
+if __name__ == "__main__":
+    unittest.main()
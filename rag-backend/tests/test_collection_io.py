@@ -0,0 +1,109 @@
+# type : ignore
+"""run from rag-backend/ : python -m unittest discover tests"""
+import os
+import shutil
+import tempfile
+import unittest
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import chromadb  # type: ignore
+
+import chromaDB
+from collection_io import clone_collection, encode_cursor, export_collection, import_collection, scan_collection
+from tests import patch_settings
+
+
+class CollectionIOTest(unittest.TestCase):
+    def setUp(self):
+        patch_settings(self, rag_embedding_function="hashing", chroma_hnsw_space=None)
+        chromaDB.get_embedding_function.cache_clear()
+        self.addCleanup(chromaDB.get_embedding_function.cache_clear)
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.client = chromadb.EphemeralClient()
+        for name in [collection.name for collection in self.client.list_collections()]:
+            self.client.delete_collection(name)
+
+        self.source = self.client.create_collection(
+            "source",
+            configuration={"hnsw": {"space": "cosine", "max_neighbors": 8}},
+            embedding_function=chromaDB.get_embedding_function(),
+        )
+        self.source.add(
+            ids=[f"row-{index:02d}" for index in range(25)],
+            documents=[f"document number {index}" for index in range(25)],
+            metadatas=[{"position": index} for index in range(25)],
+        )
+
+    def rows(self, collection) -> dict[str, tuple]:
+        stored = collection.get(include=["documents", "metadatas", "embeddings"])
+        return {
+            identifier: (document, metadata, [round(float(value), 5) for value in embedding])
+            for identifier, document, metadata, embedding in zip(
+                stored["ids"], stored["documents"], stored["metadatas"], stored["embeddings"]
+            )
+        }
+
+    def test_scan_pages_through_every_row_once(self):
+        seen, cursor, pages = [], None, 0
+        while True:
+            page = scan_collection(self.source, cursor, page_size=10, include=["documents"])
+            seen += page["ids"]
+            pages += 1
+            self.assertNotIn("embeddings", page)
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual(sorted(seen), sorted(self.source.get(include=[])["ids"]))
+
+    def test_scan_rejects_foreign_or_invalid_cursors(self):
+        with self.assertRaises(ValueError):
+            scan_collection(self.source, "not a cursor")
+        with self.assertRaises(ValueError):
+            scan_collection(self.source, encode_cursor("other_collection", 10))
+        with self.assertRaises(ValueError):
+            scan_collection(self.source, include=["distances"])
+
+    def test_cursor_past_the_end_gives_an_empty_last_page(self):
+        page = scan_collection(self.source, encode_cursor("source", 100), page_size=10)
+        self.assertEqual(page["ids"], [])
+        self.assertIsNone(page["next_cursor"])
+
+    def test_export_import_round_trip(self):
+        path = os.path.join(self.directory, "source.parquet")
+        self.assertEqual(export_collection("source", path, batch_size=10, client_instance=self.client), 25)
+        self.assertEqual(import_collection(path, "restored", batch_size=7, client_instance=self.client), 25)
+
+        restored = self.client.get_collection("restored")
+        self.assertEqual(self.rows(restored), self.rows(self.source))
+        self.assertEqual(restored.metadata["copied_from"], "source")
+        self.assertEqual(restored.configuration_json["hnsw"]["space"], "cosine")
+
+    def test_import_refuses_another_embedding_function(self):
+        path = os.path.join(self.directory, "source.parquet")
+        export_collection("source", path, client_instance=self.client)
+        patch_settings(self, rag_embedding_function="default")
+        chromaDB.get_embedding_function.cache_clear()
+        with self.assertRaises(ValueError):
+            import_collection(path, "restored", client_instance=self.client)
+        self.assertNotIn("restored", [collection.name for collection in self.client.list_collections()])
+
+    def test_empty_collection_export_can_be_imported(self):
+        self.client.create_collection("empty", embedding_function=chromaDB.get_embedding_function())
+        path = os.path.join(self.directory, "empty.parquet")
+        self.assertEqual(export_collection("empty", path, client_instance=self.client), 0)
+        self.assertEqual(import_collection(path, "empty_restored", client_instance=self.client), 0)
+        self.assertEqual(self.client.get_collection("empty_restored").count(), 0)
+
+    def test_clone_copies_rows_and_index_settings(self):
+        self.assertEqual(clone_collection("source", "copy", batch_size=10, client_instance=self.client), 25)
+        copy = self.client.get_collection("copy")
+        self.assertEqual(self.rows(copy), self.rows(self.source))
+        self.assertEqual(copy.configuration_json["hnsw"]["max_neighbors"], 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+# type : ignore
+"""run from rag-backend/ : python -m unittest discover tests"""
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from contextlib import asynccontextmanager
+from unittest import mock
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import chromaDB
+from admission import AdmissionController, AdmissionRejected
+from tests import patch_settings
+
+LLM_LATENCY_SECONDS = 0.3
+
+
+class ConcurrentQueriesTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patch_settings(
+            self,
+            chroma_mode="ephemeral",
+            rag_embedding_function="hashing",
+            mcp_transport="memory",
+            warmup_enabled=False,
+            llm_backend="replay",
+            llm_cassette_path=os.path.join(tempfile.mkdtemp(), "cassette.jsonl"),
+            llm_replay_on_miss="echo",
+            llm_replay_latency_ms=LLM_LATENCY_SECONDS * 1000,
+            conversation_log_directory=tempfile.mkdtemp(),
+        )
+        self.enterContext(mock.patch.object(chromaDB, "_async_client", None))
+        for cached in (chromaDB.get_client, chromaDB.get_embedding_function):
+            cached.cache_clear()
+            self.addCleanup(cached.cache_clear)
+
+    @asynccontextmanager
+    async def connected_client(self):
+        from mcp_client import MCPClient
+
+        client = MCPClient()
+        await client.connect_to_server("server.py")
+        try:
+            yield client
+        finally:
+            await client.cleanup()
+
+    async def test_turns_overlap_and_keep_their_messages(self):
+        queries = [f"what is the capital of country number {index}" for index in range(4)]
+        async with self.connected_client() as client:
+            start = time.perf_counter()
+            results = await asyncio.gather(*(client.process_query(query) for query in queries))
+            elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, 2 * LLM_LATENCY_SECONDS)
+        for query, messages in zip(queries, results):
+            self.assertEqual(messages[0]["content"], query)
+            self.assertEqual(messages[-1]["content"], f"[replay] {query}")
+
+    async def test_requests_are_shed_while_the_llm_is_awaited(self):
+        admission = AdmissionController(max_in_flight=1, max_queue=0)
+
+        async with self.connected_client() as client:
+
+            async def admitted_query():
+                async with admission.slot():
+                    await client.process_query("what is the capital of france")
+
+            running = asyncio.create_task(admitted_query())
+            await asyncio.sleep(LLM_LATENCY_SECONDS / 3)
+            start = time.perf_counter()
+            with self.assertRaises(AdmissionRejected) as rejected:
+                await admission.acquire()
+            rejected_after = time.perf_counter() - start
+            self.assertFalse(running.done())
+            await running
+
+        self.assertEqual(rejected.exception.status_code, 429)
+        self.assertLess(rejected_after, 0.05)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+# type : ignore
+"""run from rag-backend/ : python -m unittest discover tests"""
+import contextlib
+import io
+import os
+import unittest
+import uuid
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from unittest import mock
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import chromaDB
+from tests import patch_settings
+
+
+class ConversationIsolationTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patch_settings(
+            self,
+            chroma_mode="ephemeral",
+            rag_embedding_function="hashing",
+            mcp_transport="memory",
+            llm_backend="replay",
+            warmup_enabled=False,
+        )
+        self.enterContext(mock.patch.object(chromaDB, "_async_client", None))
+        for cached in (chromaDB.get_client, chromaDB.get_embedding_function):
+            cached.cache_clear()
+            self.addCleanup(cached.cache_clear)
+
+        self.first, self.second = uuid.uuid4().hex, uuid.uuid4().hex
+
+    @asynccontextmanager
+    async def connected_client(self):
+        # NOTE : the MCP session has to be closed by the task that opened it, so it can't live in asyncSetUp / cleanups
+        from mcp_client import MCPClient
+
+        client = MCPClient()
+        await client.connect_to_server("server.py")
+        try:
+            client.memory.remember(self.first, "user", "my dog is called Rex")
+            client.memory.remember(self.second, "user", "my cat is called Tom")
+            await client.memory.flush()
+            yield client
+        finally:
+            await client.cleanup()
+
+    async def test_history_tool_only_sees_the_turn_conversation(self):
+        # the llm can't pick another conversation, the client overrides whatever id it passes
+        async with self.connected_client() as client:
+            result = await client.call_tool(
+                "get_user_query_history", {"user_query": "what is my pet called", "conversation_id": self.second}, self.first
+            )
+        text = "\n".join(content.text for content in result.content)
+        self.assertIn("Rex", text)
+        self.assertNotIn("Tom", text)
+
+    async def test_conversation_id_is_hidden_from_the_llm(self):
+        async with self.connected_client() as client:
+            (history_tool,) = [tool for tool in client.tools if tool["name"] == "get_user_query_history"]
+        self.assertNotIn("conversation_id", history_tool["input_schema"]["properties"])
+
+    async def test_recall_is_scoped(self):
+        async with self.connected_client() as client:
+            turns = await client.memory.recall(self.second, "what is my pet called")
+        self.assertEqual([turn["content"] for turn in turns], ["my cat is called Tom"])
+
+
+class CliAssistantTurnTest(unittest.IsolatedAsyncioTestCase):
+    async def test_only_the_model_text_is_remembered(self):
+        import cli_chatbot_client
+
+        with mock.patch.object(cli_chatbot_client, "Anthropic"), mock.patch.object(cli_chatbot_client, "ConversationMemory"):
+            client = cli_chatbot_client.MCPClient()
+        tool_use = SimpleNamespace(type="tool_use", name="echo", input={"text": "hi"}, id="toolu_1")
+        client.anthropic.messages.create.side_effect = [
+            SimpleNamespace(content=[SimpleNamespace(type="text", text="let me check"), tool_use]),
+            SimpleNamespace(content=[SimpleNamespace(type="text", text="it says hi")]),
+        ]
+        client.session = mock.AsyncMock()
+        client.session.list_tools.return_value = SimpleNamespace(tools=[])
+        client.session.call_tool.return_value = SimpleNamespace(content=[])
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            shown = await client.process_query("say hi")
+
+        self.assertIn("[Calling tool echo with args", shown)
+        client.memory.remember.assert_called_with(client.conversation_id, "assistant", "let me check\nit says hi")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+# type : ignore
+"""run from rag-backend/ : python -m unittest discover tests"""
+import os
+import unittest
+import uuid
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import chromadb  # type: ignore
+
+from chromaDB import ChromaDBVectorDatabase, get_collection_configuration, get_hnsw_configuration
+from embeddings import HashingEmbeddingFunction
+from tests import patch_settings
+
+
+class HnswConfigurationTest(unittest.TestCase):
+    def setUp(self):
+        patch_settings(
+            self,
+            chroma_hnsw_space=None,
+            chroma_hnsw_max_neighbors=None,
+            chroma_hnsw_ef_construction=None,
+            chroma_hnsw_ef_search=None,
+        )
+        self.client = chromadb.EphemeralClient()
+        self.collection_name = f"hnsw_{uuid.uuid4().hex}"
+
+    def database(self, hnsw=None) -> ChromaDBVectorDatabase:
+        return ChromaDBVectorDatabase(self.collection_name, self.client, HashingEmbeddingFunction(), hnsw)
+
+    def test_unset_parameters_are_left_to_chroma(self):
+        self.assertEqual(get_hnsw_configuration(), {})
+        self.assertIsNone(get_collection_configuration())
+
+    def test_arguments_override_settings(self):
+        patch_settings(self, chroma_hnsw_space="ip", chroma_hnsw_ef_search=40)
+        self.assertEqual(get_hnsw_configuration(space="cosine"), {"space": "cosine", "ef_search": 40})
+
+    def test_new_collection_gets_every_parameter(self):
+        hnsw = {"space": "cosine", "max_neighbors": 12, "ef_construction": 80, "ef_search": 30}
+        configuration = self.database(hnsw).index_configuration()
+        self.assertEqual({key: configuration[key] for key in hnsw}, hnsw)
+
+    def test_settings_apply_to_a_new_collection(self):
+        patch_settings(self, chroma_hnsw_space="ip", chroma_hnsw_max_neighbors=10)
+        configuration = self.database().index_configuration()
+        self.assertEqual((configuration["space"], configuration["max_neighbors"]), ("ip", 10))
+
+    def test_existing_collection_only_takes_ef_search(self):
+        created = self.database({"space": "cosine", "max_neighbors": 12, "ef_construction": 80}).index_configuration()
+
+        reopened = self.database({"space": "l2", "max_neighbors": 32, "ef_construction": 200, "ef_search": 55})
+        configuration = reopened.index_configuration()
+        self.assertEqual(configuration["ef_search"], 55)
+        for key in ("space", "max_neighbors", "ef_construction"):
+            self.assertEqual(configuration[key], created[key])
+        # the new ef_search is stored, not only kept on this instance
+        self.assertEqual(self.client.get_collection(self.collection_name).configuration_json["hnsw"]["ef_search"], 55)
+
+    def test_reopening_without_parameters_changes_nothing(self):
+        created = self.database({"space": "cosine", "ef_search": 30}).index_configuration()
+        self.assertEqual(self.database().index_configuration(), created)
+
+
+if __name__ == "__main__":
+    unittest.main()
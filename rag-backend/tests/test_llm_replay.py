@@ -0,0 +1,38 @@
+# type : ignore
+"""run from rag-backend/ : python -m unittest discover tests"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from agents import Agent, Runner  # type: ignore
+
+import llm_replay
+from tests import patch_settings
+
+
+class ReplayStreamingTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patch_settings(
+            self,
+            llm_backend="replay",
+            llm_replay_on_miss="echo",
+            llm_cassette_path=os.path.join(tempfile.mkdtemp(), "cassette.jsonl"),
+        )
+        self.enterContext(mock.patch.object(llm_replay, "_cassette", None))
+
+    async def test_streamed_run_gets_the_replayed_response(self):
+        agent = Agent(name="Professor", instructions="answer in one sentence")
+        run_config = llm_replay.get_agents_run_config()
+
+        streamed = Runner.run_streamed(agent, "what is a vector index", run_config=run_config)
+        events = [event async for event in streamed.stream_events()]
+        replayed = await Runner.run(agent, "what is a vector index", run_config=run_config)
+
+        self.assertTrue(events)
+        self.assertIn("what is a vector index", streamed.final_output)
+        self.assertEqual(streamed.final_output, replayed.final_output)
+
+
+if __name__ == "__main__":
+    unittest.main()
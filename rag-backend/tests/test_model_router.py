@@ -0,0 +1,49 @@
+# type : ignore
+"""run from rag-backend/ : python -m unittest discover tests"""
+import unittest
+
+from model_router import ModelRouter
+
+TOOL_NAMES = ["echo", "get_list_of_collections", "get_collection_data_count", "context_retriever"]
+COLLECTION_NAMES = {"complete_collection", "contextual_data"}
+
+
+class RuleRoutingTest(unittest.TestCase):
+    def setUp(self):
+        self.router = ModelRouter()
+
+    def route(self, query, collection_names=COLLECTION_NAMES):
+        return self.router.route(query, TOOL_NAMES, collection_names)
+
+    def test_explicit_commands_are_rules(self):
+        self.assertEqual(self.route("/echo hello there").tool_arguments, {"message": "hello there"})
+        self.assertEqual(self.route("echo: hello").tool_arguments, {"message": "hello"})
+        self.assertEqual(self.route("/collections").tool_name, "get_list_of_collections")
+        self.assertEqual(self.route("list all collections").tool_name, "get_list_of_collections")
+        self.assertEqual(self.route("/count complete_collection").tool_arguments, {"name_of_collection": "complete_collection"})
+        self.assertEqual(
+            self.route("how many entries are in collection complete_collection?").tool_arguments,
+            {"name_of_collection": "complete_collection"},
+        )
+
+    def test_natural_language_questions_are_not_rules(self):
+        for query in (
+            "Echo and Narcissus: who was Echo in Greek myth?",
+            "echo the sentiment of the article about whales",
+            "what are the Smithsonian collections?",
+            "show me the Smithsonian collections",
+            "how many paintings are in the Louvre collection?",
+        ):
+            with self.subTest(query=query):
+                self.assertNotEqual(self.route(query).tier, "rule")
+
+    def test_count_needs_an_existing_collection(self):
+        query = "how many entries are in collection complete_collection?"
+        self.assertTrue(self.router.needs_collection_names(query))
+        self.assertNotEqual(self.route(query, None).tier, "rule")
+        self.assertNotEqual(self.route(query, {"other_collection"}).tier, "rule")
+        self.assertFalse(self.router.needs_collection_names("who was Echo in Greek myth?"))
+
+
+if __name__ == "__main__":
+    unittest.main()
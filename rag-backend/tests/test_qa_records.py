@@ -0,0 +1,46 @@
+# type : ignore
+"""run from rag-backend/ : python -m unittest discover tests"""
+import contextlib
+import io
+import os
+import unittest
+import uuid
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import chromadb  # type: ignore
+
+from chromaDB import ChromaDBVectorDatabase, qa_records
+from embeddings import HashingEmbeddingFunction
+
+SHARED_QUESTION = {
+    "test": [
+        {"question": "Who wrote it?", "answer": "Mark Twain"},
+        {"question": "Who wrote it?", "answer": "Jane Austen"},
+        {"question": "Who wrote it?", "answer": "Mark Twain"},
+    ]
+}
+
+
+class QARecordsTest(unittest.TestCase):
+    def test_rows_sharing_a_question_get_their_own_id(self):
+        ids, documents, _ = qa_records(SHARED_QUESTION)
+        self.assertEqual(len(ids), 2)
+        self.assertEqual(len(set(ids)), 2)
+        self.assertEqual(sorted(document.split("Answer: ")[1] for document in documents), ["Jane Austen", "Mark Twain"])
+
+    def test_ids_are_stable(self):
+        self.assertEqual(qa_records(SHARED_QUESTION)[0], qa_records(SHARED_QUESTION)[0])
+
+    def test_rows_sharing_a_question_can_be_stored(self):
+        database = ChromaDBVectorDatabase(f"qa_{uuid.uuid4().hex}", chromadb.EphemeralClient(), HashingEmbeddingFunction())
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            database.store_data(SHARED_QUESTION)
+        # stdout is the protocol pipe of the stdio MCP server that ingests
+        self.assertEqual(stdout.getvalue(), "")
+        self.assertEqual(database.collection.count(), 2)
+        self.assertEqual(database.sync_data(SHARED_QUESTION)["unchanged"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+# type : ignore
+"""run from rag-backend/ : python -m unittest discover tests"""
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+
+from singleflight import SingleFlight
+
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.flight = SingleFlight()
+        self.runs = 0
+
+    async def work(self, result="done", seconds=0.05):
+        self.runs += 1
+        await asyncio.sleep(seconds)
+        return result
+
+    async def test_concurrent_calls_share_one_run(self):
+        results = await asyncio.gather(*(self.flight.do("key", self.work) for _ in range(10)))
+        self.assertEqual(self.runs, 1)
+        self.assertEqual(results, ["done"] * 10)
+        self.assertEqual(self.flight.stats, {"calls": 10, "coalesced": 9})
+
+    async def test_leader_exception_reaches_every_caller(self):
+        async def failing():
+            self.runs += 1
+            await asyncio.sleep(0.05)
+            raise ValueError("no dataset")
+
+        results = await asyncio.gather(*(self.flight.do("key", failing) for _ in range(5)), return_exceptions=True)
+        self.assertEqual(self.runs, 1)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(self.flight.in_flight(), 0)
+        # the failure isn't remembered, the next call runs again
+        self.assertEqual(await self.flight.do("key", self.work), "done")
+        self.assertEqual(self.runs, 2)
+
+    async def test_cancelled_caller_leaves_the_shared_run_alone(self):
+        leader = asyncio.create_task(self.flight.do("key", self.work))
+        follower = asyncio.create_task(self.flight.do("key", self.work))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await follower
+        self.assertEqual(await leader, "done")
+        self.assertEqual(self.runs, 1)
+
+    async def test_key_runs_again_after_completion(self):
+        self.assertEqual(await self.flight.do("key", self.work), "done")
+        self.assertEqual(self.flight.in_flight(), 0)
+        self.assertEqual(await self.flight.do("key", lambda: self.work("again")), "again")
+        self.assertEqual(self.runs, 2)
+
+    async def test_different_keys_run_separately(self):
+        await asyncio.gather(self.flight.do("first", self.work), self.flight.do("second", self.work))
+        self.assertEqual(self.runs, 2)
+
+
+class IngestionFlightTest(unittest.IsolatedAsyncioTestCase):
+    async def test_loads_of_one_collection_never_overlap(self):
+        import server
+
+        running, overlapping, calls = [], [], []
+        lock = threading.Lock()
+
+        def ingest(collection_name, hnsw, mode, dataset_config):
+            with lock:
+                running.append(collection_name)
+                overlapping.append(len(running))
+                calls.append((mode, dataset_config))
+            time.sleep(0.05)
+            with lock:
+                running.remove(collection_name)
+            return f"{mode} {dataset_config}"
+
+        with mock.patch.object(server, "ingest_huggingface_data", ingest), mock.patch.dict(server.ingestion_locks, clear=True):
+            results = await asyncio.gather(
+                server.enter_data_to_new_collection("books"),
+                server.enter_data_to_new_collection(" books "),
+                server.enter_data_to_new_collection("books", mode="delta"),
+                server.enter_data_to_new_collection("books", dataset_config="text-corpus"),
+            )
+
+        # the identical full loads ran once, the other mode and config after it, one at a time
+        self.assertEqual(sorted(calls), [("delta", "question-answer"), ("full", "question-answer"), ("full", "text-corpus")])
+        self.assertEqual(max(overlapping), 1)
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[2:], ["delta question-answer", "full text-corpus"])
+
+
+if __name__ == "__main__":
+    unittest.main()
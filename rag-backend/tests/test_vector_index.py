@@ -0,0 +1,125 @@
+# type : ignore
+"""run from rag-backend/ : python -m unittest discover tests"""
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from embeddings import HashingEmbeddingFunction
+from vector_index import QuantizedVectorIndex
+
+
+def corpus(version: int, size: int) -> dict:
+    return {"test": [{"id": row, "question": f"question {row}", "answer": f"version {version} answer {row}"} for row in range(size)]}
+
+
+class ConcurrentRebuildTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.index = QuantizedVectorIndex("rebuilt", self.directory, HashingEmbeddingFunction())
+        self.index.sync_data(corpus(0, 50))
+
+    def test_searches_during_rebuilds_see_one_version(self):
+        errors, results = [], []
+        done = threading.Event()
+
+        def search():
+            while not done.is_set():
+                try:
+                    results.append(self.index.search(["question 3", "question 40"], n_results=5))
+                except Exception as e:
+                    errors.append(e)
+
+        readers = [threading.Thread(target=search) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        try:
+            # every rebuild changes all the documents and the row count
+            for version in range(1, 15):
+                self.index.sync_data(corpus(version, 50 + 7 * version))
+        finally:
+            done.set()
+            for reader in readers:
+                reader.join()
+
+        self.assertEqual(errors, [])
+        self.assertTrue(results)
+        for result in results:
+            versions = {document.split(" Answer: version ")[1].split()[0] for row in result["documents"] for document in row}
+            self.assertEqual(len(versions), 1, result["documents"])
+            for ids, documents in zip(result["ids"], result["documents"]):
+                self.assertEqual([document.rsplit(" ", 1)[1] for document in documents], ids)
+
+
+class OtherProcessTest(unittest.TestCase):
+    def test_rebuild_by_another_instance_is_picked_up(self):
+        # two instances on one directory stand for two processes (the cli and a server), each with its own cached index
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        server_index = QuantizedVectorIndex("shared", directory, HashingEmbeddingFunction())
+        cli_index = QuantizedVectorIndex("shared", directory, HashingEmbeddingFunction())
+        self.assertEqual(server_index.count(), 0)
+
+        cli_index.store_data(corpus(0, 20))
+        self.assertEqual(server_index.count(), 20)
+        old_records = server_index.records
+
+        cli_index.sync_data(corpus(1, 30))
+        result = server_index.search("question 25", n_results=1)
+        self.assertEqual(result["ids"], [["25"]])
+        self.assertIn("version 1", result["documents"][0][0])
+        self.assertIsNot(server_index.records, old_records)
+
+
+class EmptyListsTest(unittest.TestCase):
+    def test_only_empty_lists_probed_gives_no_results(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        index = QuantizedVectorIndex("empty_lists", directory, HashingEmbeddingFunction())
+        index.store_data(corpus(0, 20))
+        # what an ivf index returns when the closest lists have no member
+        with mock.patch.object(QuantizedVectorIndex, "candidate_rows", return_value=[(4, 4), (9, 9)]):
+            result = index.search(["question 3", "question 4"], n_results=3)
+        self.assertEqual(result, {"ids": [[], []], "documents": [[], []], "metadatas": [[], []], "distances": [[], []]})
+
+
+class StreamedIngestionTest(unittest.TestCase):
+    def test_store_records_spills_and_cleans_up(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        index = QuantizedVectorIndex("streamed", directory, HashingEmbeddingFunction())
+
+        def batches(first, last):
+            for start in range(first, last, 10):
+                ids = [f"chunk-{row}" for row in range(start, start + 10)]
+                yield ids, [f"passage text {identifier}" for identifier in ids], [{"source": "test"} for _ in ids]
+
+        self.assertEqual(index.store_records(batches(0, 50), batch_size=4), 50)
+        # a second load keeps the stored vectors of the rows it doesn't replace
+        self.assertEqual(index.store_records(batches(40, 70), batch_size=4), 30)
+        self.assertEqual(index.count(), 70)
+        self.assertEqual(index.search("passage text chunk-12", n_results=1)["ids"], [["chunk-12"]])
+        # the spill files next to the index are gone
+        self.assertEqual(sorted(os.listdir(directory)), ["streamed"])
+
+
+class StdoutTest(unittest.TestCase):
+    def test_ingestion_writes_nothing_to_stdout(self):
+        # stdout is the protocol pipe of the stdio MCP server that ingests
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        index = QuantizedVectorIndex("quiet", directory, HashingEmbeddingFunction())
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            index.store_data(corpus(0, 10))
+            index.sync_data(corpus(1, 10))
+        self.assertEqual(stdout.getvalue(), "")
+        self.assertEqual(index.count(), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
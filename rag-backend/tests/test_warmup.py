@@ -0,0 +1,68 @@
+# type : ignore
+"""run from rag-backend/ : python -m unittest discover tests"""
+import os
+import socket
+import time
+import unittest
+from unittest import mock
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import chromaDB
+import server
+from tests import patch_settings
+
+
+def unused_port() -> int:
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        return listener.getsockname()[1]
+
+
+class UnreachableBackendTest(unittest.TestCase):
+    """chroma http mode pointed at a port nothing listens on"""
+
+    def setUp(self):
+        patch_settings(
+            self,
+            chroma_mode="http",
+            chroma_host="127.0.0.1",
+            chroma_port=unused_port(),
+            rag_embedding_function="hashing",
+            retrieval_backend="chroma",
+            warmup_enabled=True,
+            warmup_collections=["complete_collection"],
+            mcp_transport="memory",
+            llm_backend="replay",
+        )
+        self.enterContext(mock.patch.object(chromaDB, "_async_client", None))
+        chromaDB.get_embedding_function.cache_clear()
+        self.addCleanup(chromaDB.get_embedding_function.cache_clear)
+        server.warmup_state.clear()
+        server.warmup_state.update({"status": "pending", "steps": {}, "errors": {}, "seconds": None})
+
+    def test_server_warmup_fails(self):
+        import asyncio
+
+        asyncio.run(server.warm_up())
+        self.assertEqual(server.warmup_state["status"], "failed")
+        self.assertIn("collection:complete_collection", server.warmup_state["errors"])
+
+    def test_ready_is_unavailable(self):
+        from fastapi.testclient import TestClient  # type: ignore
+
+        import main
+
+        with TestClient(main.app) as client:
+            deadline = time.monotonic() + 60
+            while not main.app.state.client.warmup_state["done"] and time.monotonic() < deadline:
+                time.sleep(0.1)
+            response = client.get("/ready")
+
+        self.assertEqual(response.status_code, 503)
+        self.assertTrue(response.json()["detail"]["done"])
+        self.assertIn("server", response.json()["detail"]["errors"])
+
+
+if __name__ == "__main__":
+    unittest.main()
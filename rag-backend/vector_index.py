@@ -0,0 +1,523 @@
+# type : ignore
+"""
+in-process vector index, an alternative to chroma for corpora that fit on one machine (select it with RETRIEVAL_BACKEND=quantized).
+
+- vectors are stored quantized (int8 with one scale per row, or float16) in .npy files that are memory-mapped, opening an index takes milliseconds
+  and only the pages a query touches are read
+- search is a vectorized numpy scan, over every row for small corpora or over the `nprobe` closest IVF lists for large ones
+- the best candidates can be re-ranked with the exact float32 vectors (a separate memory-mapped file, only the candidate rows are read)
+
+`QuantizedVectorIndex` has the same `store_data` / `search` interface as `ChromaDBVectorDatabase` and `search` returns chroma shaped results.
+one directory per collection under settings.vector_index_path :
+    meta.json      dimension, quantization, space, embedding function, ivf layout
+    vectors.npy    quantized vectors (n x d int8 / float16)
+    scales.npy     int8 dequantization scale per row
+    norms.npy      squared l2 norm of every original vector (l2 distances)
+    exact.npy      float32 vectors, only written when rescoring is enabled (the index then takes more disk than float32 alone)
+    centroids.npy, list_offsets.npy   ivf lists, rows are stored grouped by list (only for large corpora)
+    records.json   ids, documents and metadatas
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from functools import lru_cache
+from typing import Any
+
+import numpy as np
+
+from chromaDB import content_hash, plan_sync, qa_records
+from config import settings
+
+# NOTE : no print, under the stdio MCP transport stdout is the protocol pipe
+logger = logging.getLogger(__name__)
+
+# rows scanned per matrix product, keeps the float32 temporary created from the quantized rows small enough to stay in cache
+SCAN_CHUNK_ROWS = 1024
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_SIZE = 50000
+# rows quantized and written per step while building, bounds the float32 temporaries whatever the corpus size
+BUILD_CHUNK_ROWS = 8192
+
+
+def quantize(vectors: np.ndarray, quantization: str) -> tuple[np.ndarray, np.ndarray]:
+    """quantized vectors and the per row scale that maps them back to float32"""
+    if quantization == "float16":
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+def kmeans(vectors: np.ndarray, number_of_lists: int, seed: int = 0) -> np.ndarray:
+    """plain lloyd iterations on a sample of the corpus, returns the centroids"""
+    generator = np.random.default_rng(seed)
+    sample = vectors[generator.choice(len(vectors), size=min(len(vectors), KMEANS_SAMPLE_SIZE), replace=False)]
+    centroids = sample[generator.choice(len(sample), size=number_of_lists, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignments = nearest_centroids(sample, centroids)
+        for list_index in range(number_of_lists):
+            members = sample[assignments == list_index]
+            if len(members):
+                centroids[list_index] = members.mean(axis=0)
+    return centroids
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    centroid_norms = (centroids**2).sum(axis=1)
+    for start in range(0, len(vectors), SCAN_CHUNK_ROWS):
+        chunk = vectors[start : start + SCAN_CHUNK_ROWS]
+        assignments[start : start + len(chunk)] = np.argmin(centroid_norms[None, :] - 2 * chunk @ centroids.T, axis=1)
+    return assignments
+
+
+class VectorSpill:
+    """
+    float32 rows appended batch by batch to a file next to the index and read back as one memory map, so the vectors of an ingestion
+    (or of a rebuild) never have to be held in memory at once. The file is removed on exit
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = 0
+        self.dimension = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, "wb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+        # NOTE : a memory map of the file stays readable after the removal
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def append(self, vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(vectors):
+            self.dimension = vectors.shape[1]
+            self._file.write(vectors.tobytes())
+            self.rows += len(vectors)
+
+    def vectors(self) -> np.ndarray:
+        self._file.flush()
+        return np.memmap(self.path, dtype=np.float32, mode="r", shape=(self.rows, self.dimension))
+
+
+def meta_generation(directory: str) -> tuple[int, int] | None:
+    """identifies the build of an index (meta.json is written last and the directory is swapped as a whole), None without an index"""
+    try:
+        stat = os.stat(os.path.join(directory, "meta.json"))
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+class IndexSnapshot:
+    """
+    one version of the index files : meta, memory maps and records. load() replaces the whole snapshot, searches hold on to the one they
+    started with, so a rebuild in another thread or process never mixes rows of two versions (the maps, and the records file opened
+    here, stay readable after the files are replaced)
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        meta: dict[str, Any] | None = None,
+        records: dict[str, list] | None = None,
+        generation: tuple[int, int] | None = None,
+    ):
+        self.directory = directory
+        self.meta = meta
+        self.generation = generation
+        self._records = records
+        self._records_lock = threading.Lock()
+        self._records_file = None
+        if meta and records is None:
+            self._records_file = open(os.path.join(directory, "records.json"))
+
+        def mapped(name: str):
+            path = os.path.join(directory, f"{name}.npy")
+            return np.load(path, mmap_mode="r") if meta and os.path.exists(path) else None
+
+        self.vectors = mapped("vectors")
+        self.scales = mapped("scales")
+        self.norms = mapped("norms")
+        self.exact = mapped("exact")
+        self.centroids = mapped("centroids")
+        self.list_offsets = mapped("list_offsets")
+
+    @property
+    def records(self) -> dict[str, list]:
+        if self._records is None:
+            with self._records_lock:
+                if self._records is None:
+                    with self._records_file as f:
+                        self._records = json.load(f)
+        return self._records
+
+
+class QuantizedVectorIndex:
+    def __init__(
+        self,
+        collection_name: str = "complete_collection",
+        directory: str | None = None,
+        embedding_function: Any = None,
+    ):
+        from chromaDB import get_embedding_function
+
+        self.collection_name = collection_name
+        self.directory = os.path.join(directory or settings.vector_index_path, collection_name)
+        self.embedding_function = embedding_function or get_embedding_function()
+        # writers (add, sync_data) hold it for a whole read-modify-rebuild, load() takes it again to swap the snapshot
+        self._lock = threading.RLock()
+        self._snapshot = IndexSnapshot(self.directory)
+        self.load()
+
+    def load(self, records: dict[str, list] | None = None):
+        """
+        memory-maps the index files, nothing but meta.json is read until a query touches the data (unless the records are passed in).
+        the new snapshot is complete before it replaces the current one
+        """
+        meta = None
+        meta_path = os.path.join(self.directory, "meta.json")
+        # read before meta.json, a rebuild finishing in between is picked up by the next refresh()
+        generation = meta_generation(self.directory)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["embedding_function"] != self.embedding_function.name():
+                raise ValueError(
+                    f"index {self.collection_name} was built with the {meta['embedding_function']} embedding function, "
+                    f"not {self.embedding_function.name()}"
+                )
+
+        snapshot = IndexSnapshot(self.directory, meta, records if meta else None, generation)
+        with self._lock:
+            self._snapshot = snapshot
+
+    def refresh(self):
+        """
+        reloads the index when another process (the cli, a second server) rebuilt it since the last load, costs one stat of meta.json.
+        NOTE : a missing meta.json keeps the current snapshot, it is the short moment where a rebuild swaps the directories
+        """
+        generation = meta_generation(self.directory)
+        if generation is not None and generation != self._snapshot.generation:
+            self.load()
+
+    @property
+    def meta(self) -> dict[str, Any] | None:
+        return self._snapshot.meta
+
+    @property
+    def records(self) -> dict[str, list]:
+        return self._snapshot.records
+
+    def count(self) -> int:
+        self.refresh()
+        meta = self._snapshot.meta
+        return meta["count"] if meta else 0
+
+    def memory_footprint(self) -> dict[str, int]:
+        """
+        bytes of the index compared to the same vectors in float32 :
+            quantized_bytes  quantized vectors, scales and norms, what every query scans
+            rescore_bytes    exact float32 copy (exact.npy) kept for rescoring, only the candidate rows are read (0 without rescoring)
+            disk_bytes       every index file, records included
+        with rescoring the vectors take more room than float32 alone (int8 about 1.25x, float16 about 1.5x), only the scanned part shrinks
+        """
+        snapshot = self._snapshot
+        if not snapshot.meta:
+            return {"quantized_bytes": 0, "rescore_bytes": 0, "disk_bytes": 0, "float32_bytes": 0}
+        quantized = snapshot.vectors.nbytes + snapshot.scales.nbytes + snapshot.norms.nbytes
+        disk = sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+        return {
+            "quantized_bytes": int(quantized),
+            "rescore_bytes": int(snapshot.exact.nbytes) if snapshot.exact is not None else 0,
+            "disk_bytes": int(disk),
+            "float32_bytes": int(snapshot.meta["count"] * snapshot.meta["dimension"] * 4),
+        }
+
+    @property
+    def space(self) -> str:
+        # an existing index keeps the space it was built with
+        return self.meta["space"] if self.meta else settings.vector_index_space
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.asarray(self.embedding_function(texts), dtype=np.float32)
+        if self.space == "cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            vectors = vectors / norms
+        return vectors
+
+    def store_data(self, data, batch_size: int = 100):
+        """
+        embeds the `test` split (question / answer / id entries, same as ChromaDBVectorDatabase.store_data) and rebuilds the index files.
+        rows with an existing id are replaced, the others are kept.
+        """
+        ids, documents, metadatas = qa_records(data)
+        if not ids:
+            return
+        self.store_records([(ids, documents, metadatas)], batch_size)
+        logger.info(f"Stored {len(ids)} documents in quantized index {self.collection_name} ({self.count()} total)")
+
+    def store_records(self, batches, batch_size: int = 100) -> int:
+        """
+        embeds (ids, documents, metadatas) batches as they arrive and rebuilds the index files once at the end. Returns the number of rows.
+        the embeddings are spilled to disk as they are computed, only the records (what records.json holds) stay in memory
+        """
+        ids, documents, metadatas = [], [], []
+        with VectorSpill(self.spill_path("ingest")) as spill:
+            for batch_ids, batch_documents, batch_metadatas in batches:
+                ids += batch_ids
+                documents += batch_documents
+                metadatas += batch_metadatas
+                for start in range(0, len(batch_documents), batch_size):
+                    spill.append(self.embed(batch_documents[start : start + batch_size]))
+            if ids:
+                self.add(ids, documents, metadatas, spill.vectors())
+        return len(ids)
+
+    def sync_data(self, data, batch_size: int = 100, delete_missing: bool = True) -> dict[str, int]:
+        """
+        delta ingestion, same contract as ChromaDBVectorDatabase.sync_data : only new or changed rows are embedded,
+        unchanged rows keep their stored vectors (the index files are still rewritten as a whole).
+        """
+        ids, documents, metadatas = qa_records(data)
+        with self._lock:
+            self.refresh()
+            stored_hashes = {}
+            if self.meta:
+                for identifier, document, metadata in zip(*(self.records[key] for key in ("ids", "documents", "metadatas"))):
+                    stored_hashes[identifier] = metadata.get("content_hash") or content_hash(document, metadata)
+            plan = plan_sync(ids, metadatas, stored_hashes)
+            if not plan["upsert"] and not (delete_missing and plan["delete"]):
+                return {"added": 0, "updated": 0, "unchanged": len(plan["unchanged"]), "deleted": 0}
+
+            upserted_ids = {ids[position] for position in plan["upsert"]}
+            removed_ids = set(plan["delete"]) if delete_missing else set()
+            kept_rows = [
+                row
+                for row, identifier in enumerate(self.records["ids"] if self.meta else [])
+                if identifier not in upserted_ids and identifier not in removed_ids
+            ]
+            upsert_documents = [documents[position] for position in plan["upsert"]]
+            if not kept_rows and not upsert_documents:
+                shutil.rmtree(self.directory, ignore_errors=True)
+                self.load()
+                return {"added": 0, "updated": 0, "unchanged": 0, "deleted": len(removed_ids)}
+
+            with VectorSpill(self.spill_path("sync")) as spill:
+                self.spill_stored_vectors(spill, kept_rows)
+                for start in range(0, len(upsert_documents), batch_size):
+                    spill.append(self.embed(upsert_documents[start : start + batch_size]))
+
+                records = self.build(
+                    [self.records["ids"][row] for row in kept_rows] + [ids[position] for position in plan["upsert"]],
+                    [self.records["documents"][row] for row in kept_rows] + upsert_documents,
+                    [self.records["metadatas"][row] for row in kept_rows] + [metadatas[position] for position in plan["upsert"]],
+                    spill.vectors(),
+                )
+            self.load(records)
+
+        added = sum(ids[position] not in stored_hashes for position in plan["upsert"])
+        return {
+            "added": added,
+            "updated": len(plan["upsert"]) - added,
+            "unchanged": len(plan["unchanged"]),
+            "deleted": len(removed_ids),
+        }
+
+    def add(self, ids: list[str], documents: list[str], metadatas: list[dict[str, Any]], vectors: np.ndarray):
+        with self._lock:
+            self.refresh()
+            if not self.meta:
+                self.load(self.build(ids, documents, metadatas, vectors))
+                return
+            new_ids = set(ids)
+            kept_rows = [row for row, identifier in enumerate(self.records["ids"]) if identifier not in new_ids]
+            ids = [self.records["ids"][row] for row in kept_rows] + ids
+            documents = [self.records["documents"][row] for row in kept_rows] + documents
+            metadatas = [self.records["metadatas"][row] for row in kept_rows] + metadatas
+            with VectorSpill(self.spill_path("add")) as spill:
+                self.spill_stored_vectors(spill, kept_rows)
+                for start in range(0, len(vectors), BUILD_CHUNK_ROWS):
+                    spill.append(vectors[start : start + BUILD_CHUNK_ROWS])
+                records = self.build(ids, documents, metadatas, spill.vectors())
+            self.load(records)
+
+    def spill_path(self, purpose: str) -> str:
+        return f"{self.directory}.{purpose}-{os.getpid()}-{threading.get_ident()}.f32"
+
+    def spill_stored_vectors(self, spill: VectorSpill, rows: list[int]):
+        for start in range(0, len(rows), BUILD_CHUNK_ROWS):
+            spill.append(self.stored_vectors(rows[start : start + BUILD_CHUNK_ROWS]))
+
+    def stored_vectors(self, rows: list[int]) -> np.ndarray:
+        snapshot = self._snapshot
+        if snapshot.exact is not None:
+            return np.asarray(snapshot.exact[rows], dtype=np.float32)
+        return np.asarray(snapshot.vectors[rows], dtype=np.float32) * np.asarray(snapshot.scales[rows])[:, None]
+
+    def build(self, ids, documents, metadatas, vectors: np.ndarray) -> dict[str, list]:
+        """
+        writes the index files and returns the records in stored row order.
+        `vectors` can be a memory map (VectorSpill), it is read, quantized and written BUILD_CHUNK_ROWS rows at a time
+        """
+        space = self.space
+        quantization = settings.vector_index_quantization
+        count, dimension = vectors.shape
+
+        # write everything to a fresh directory and swap it in, readers never see a half written index
+        staging_directory = f"{self.directory}.staging-{os.getpid()}"
+        shutil.rmtree(staging_directory, ignore_errors=True)
+        os.makedirs(staging_directory)
+
+        number_of_lists = 0
+        order = None
+        if count >= settings.vector_index_ivf_min_size:
+            number_of_lists = int(np.sqrt(count))
+            centroids = kmeans(vectors, number_of_lists)
+            assignments = nearest_centroids(vectors, centroids)
+            order = np.argsort(assignments, kind="stable")
+            # rows are stored grouped by list so a probed list is one contiguous slice of the memory map
+            ids, documents, metadatas = ([values[row] for row in order] for values in (ids, documents, metadatas))
+            np.save(os.path.join(staging_directory, "centroids.npy"), centroids.astype(np.float32))
+            np.save(
+                os.path.join(staging_directory, "list_offsets.npy"),
+                np.searchsorted(assignments[order], np.arange(number_of_lists + 1)).astype(np.int64),
+            )
+
+        def output(name: str, dtype, shape):
+            return np.lib.format.open_memmap(os.path.join(staging_directory, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape)
+
+        outputs = {
+            "vectors": output("vectors", np.float16 if quantization == "float16" else np.int8, (count, dimension)),
+            "scales": output("scales", np.float32, (count,)),
+            "norms": output("norms", np.float32, (count,)),
+        }
+        if settings.vector_index_rescore:
+            outputs["exact"] = output("exact", np.float32, (count, dimension))
+        for start in range(0, count, BUILD_CHUNK_ROWS):
+            end = min(start + BUILD_CHUNK_ROWS, count)
+            chunk = np.asarray(vectors[order[start:end] if order is not None else slice(start, end)], dtype=np.float32)
+            outputs["vectors"][start:end], outputs["scales"][start:end] = quantize(chunk, quantization)
+            outputs["norms"][start:end] = (chunk**2).sum(axis=1)
+            if "exact" in outputs:
+                outputs["exact"][start:end] = chunk
+        for array in outputs.values():
+            array.flush()
+        del outputs
+
+        records = {"ids": ids, "documents": documents, "metadatas": metadatas}
+        with open(os.path.join(staging_directory, "records.json"), "w") as f:
+            json.dump(records, f)
+        with open(os.path.join(staging_directory, "meta.json"), "w") as f:
+            json.dump(
+                {
+                    "count": len(ids),
+                    "dimension": int(dimension),
+                    "quantization": quantization,
+                    "space": space,
+                    "embedding_function": self.embedding_function.name(),
+                    "number_of_lists": number_of_lists,
+                    "created": time.time(),
+                },
+                f,
+            )
+
+        previous_directory = f"{self.directory}.previous-{os.getpid()}"
+        if os.path.exists(self.directory):
+            os.replace(self.directory, previous_directory)
+        os.replace(staging_directory, self.directory)
+        # NOTE : the current snapshot keeps mapping the removed files, its records were already read by the caller (add, sync_data)
+        shutil.rmtree(previous_directory, ignore_errors=True)
+        return records
+
+    @staticmethod
+    def candidate_rows(snapshot: IndexSnapshot, query_vector: np.ndarray, nprobe: int) -> list[tuple[int, int]]:
+        """contiguous row ranges to scan"""
+        if not snapshot.meta["number_of_lists"]:
+            return [(0, snapshot.meta["count"])]
+        centroids = np.asarray(snapshot.centroids)
+        closest = np.argsort(((centroids - query_vector) ** 2).sum(axis=1))[:nprobe]
+        return [(int(snapshot.list_offsets[list_index]), int(snapshot.list_offsets[list_index + 1])) for list_index in closest]
+
+    @staticmethod
+    def distances(snapshot: IndexSnapshot, query_vector: np.ndarray, rows: slice | np.ndarray, exact: bool = False) -> np.ndarray:
+        """distances to `rows` (a slice or sorted row numbers), computed from the quantized or the exact vectors"""
+        if exact:
+            dot = np.asarray(snapshot.exact[rows]) @ query_vector
+        else:
+            dot = (np.asarray(snapshot.vectors[rows], dtype=np.float32) @ query_vector) * snapshot.scales[rows]
+        if snapshot.meta["space"] == "l2":
+            return snapshot.norms[rows] - 2 * dot + float(query_vector @ query_vector)
+        return 1.0 - dot
+
+    def search(self, query, n_results=5, nprobe: int | None = None, rescore: bool | None = None):
+        """
+        Search for the most relevant documents based on the query.
+        Returns the top n_results matching documents (chroma's query result format).
+        a list of queries is embedded in one call and gives one result row per query, like chroma's query_texts
+        """
+        queries = query if isinstance(query, list) else [query]
+        self.refresh()
+        # every query of the call reads this one version, even if add / sync_data swap in a new one meanwhile
+        snapshot = self._snapshot
+        if not snapshot.meta or not snapshot.meta["count"]:
+            return {"ids": [[]] * len(queries), "documents": [[]] * len(queries), "metadatas": [[]] * len(queries), "distances": [[]] * len(queries)}
+
+        rescore = settings.vector_index_rescore if rescore is None else rescore
+        rescore = rescore and snapshot.exact is not None
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for query_vector in self.embed(queries):
+            for key, values in self.search_vector(query_vector, n_results, nprobe, rescore, snapshot).items():
+                results[key].append(values)
+        return results
+
+    def search_vector(
+        self, query_vector: np.ndarray, n_results: int, nprobe: int | None, rescore: bool, snapshot: IndexSnapshot | None = None
+    ) -> dict[str, list]:
+        snapshot = snapshot or self._snapshot
+        number_of_candidates = n_results * settings.vector_index_rescore_candidates if rescore else n_results
+
+        rows, scores = [], []
+        for start, end in self.candidate_rows(snapshot, query_vector, nprobe or settings.vector_index_nprobe):
+            for chunk_start in range(start, end, SCAN_CHUNK_ROWS):
+                chunk_end = min(chunk_start + SCAN_CHUNK_ROWS, end)
+                rows.append(np.arange(chunk_start, chunk_end))
+                scores.append(self.distances(snapshot, query_vector, slice(chunk_start, chunk_end)))
+        if not rows:
+            # every probed ivf list is empty (kmeans can leave lists without members)
+            return {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        rows, scores = np.concatenate(rows), np.concatenate(scores)
+
+        if len(rows) > number_of_candidates:
+            best = np.argpartition(scores, number_of_candidates - 1)[:number_of_candidates]
+            rows, scores = rows[best], scores[best]
+        if rescore:
+            # sorted rows keep the reads from the memory map in file order
+            rows = np.sort(rows)
+            scores = self.distances(snapshot, query_vector, rows, exact=True)
+        top = np.argsort(scores, kind="stable")[:n_results]
+
+        records = snapshot.records
+        return {
+            "ids": [records["ids"][rows[position]] for position in top],
+            "documents": [records["documents"][rows[position]] for position in top],
+            "metadatas": [records["metadatas"][rows[position]] for position in top],
+            "distances": [float(scores[position]) for position in top],
+        }
+
+
+@lru_cache(maxsize=None)
+def get_quantized_index(collection_name: str) -> QuantizedVectorIndex:
+    """one (memory-mapped) index per collection and process, rebuilds made by other processes are picked up by count / search (refresh)"""
+    return QuantizedVectorIndex(collection_name)